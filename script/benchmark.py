@@ -0,0 +1,261 @@
+# Benchmarks of parsing and exporting, on a synthetic SD card by default
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timezone
+
+import common
+import parse_index
+import parse_video
+import export_gps
+import synthetic_card
+
+# Number of random periods searched by the search benchmarks
+search_period_num = 1000
+
+# Segments parsed with export_video, exporting is slow
+export_seg_num = 4
+
+#===========================================
+
+def run(
+        sd_dir_path: str = None,
+        result_path: str = None,
+        card_options: dict = None,
+        repeat: int = 3
+    ) -> dict:
+    """
+    Time each benchmark case. common.set_timezone() should be called
+    first.
+
+    Files are read through the page cache after the first run of a case,
+    so results are of a warm cache.
+
+    Parameters
+    ----------
+    sd_dir_path: str
+        SD card to benchmark. If None or it has no index00.bin, a card is
+        made there by synthetic_card.make_card() with card_options. None
+        means a temporary folder.
+    result_path: str
+        Save the result as JSON. Optional.
+    card_options: dict
+        See synthetic_card.make_card()
+    repeat: int
+        Runs of each case.
+
+    Returns
+    ----------
+    result: dict
+        See README.md
+    """
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if sd_dir_path == None:
+            sd_dir_path = os.path.join(temp_dir, 'card')
+        result = {}
+        result['time'] = datetime.now(timezone.utc).isoformat()
+        result['revision'] = __get_revision()
+        result['python'] = platform.python_version()
+        result['numpy'] = __get_numpy_version()
+        result['platform'] = platform.platform()
+        result['repeat'] = repeat
+        if not os.path.isfile(os.path.join(sd_dir_path, 'index00.bin')):
+            start = time.perf_counter()
+            result['card'] = synthetic_card.make_card(sd_dir_path, card_options)
+            result['card']['make_sec'] = time.perf_counter() - start
+        else:
+            result['card'] = None
+
+        cases = __get_cases(sd_dir_path, os.path.join(temp_dir, 'out'))
+        result['cases'] = []
+        for (name, case) in cases:
+            result['cases'].append(__time_case(name, case, repeat))
+
+    if result_path != None:
+        with open(result_path, 'w') as f:
+            json.dump(result, f, indent = 2)
+    return result
+
+def __get_cases(sd_dir_path: str, out_dir: str) -> list:
+    """
+    Benchmark cases in running order. A case is a function returning the
+    number of bytes it read or wrote, or None.
+    """
+
+    os.makedirs(out_dir, exist_ok = True)
+    record_file_index = parse_index.parse(sd_dir_path)
+    search_index = parse_index.build_search_index(record_file_index)
+    segs = []
+    for file_info in record_file_index['record_file_infos']:
+        if file_info['file_type'] != 'video':
+            continue
+        for seg_info in file_info['seg_infos']:
+            segs.append((file_info['file_no'], seg_info))
+    seg_bytes = sum(seg_info['end_pos'] - seg_info['start_pos'] for (file_no, seg_info) in segs)
+
+    # Random periods of 1 minute to 1 hour over the card
+    rnd = random.Random(0)
+    periods = []
+    if len(segs) != 0:
+        first = min(seg_info['start_time'] for (file_no, seg_info) in segs)
+        last = max(seg_info['end_time'] for (file_no, seg_info) in segs)
+        for i in range(search_period_num):
+            start = rnd.randint(first, last)
+            periods.append((start, start + rnd.randint(60, 3600)))
+
+    telemetry_options = {
+        'export_video': False,
+        'export_thumbnail': False,
+        'gps_track': True,
+        'acce': True,
+        'image_label': False
+    }
+    telemetries = []
+
+    def index_parse():
+        parse_index.parse(sd_dir_path)
+        return os.path.getsize(os.path.join(sd_dir_path, 'index00.bin'))
+
+    def index_search():
+        for (start, end) in periods:
+            parse_index.search(record_file_index, start, end)
+
+    def index_search_many():
+        parse_index.search_many(search_index, periods)
+
+    def parse_segs(parse_options: dict, seg_num: int = -1):
+        def case():
+            case_segs = segs if seg_num == -1 else segs[:seg_num]
+            for (file_no, seg_info) in case_segs:
+                parse_options['export_video_path'] = os.path.join(out_dir, 'seg.mp4')
+                parse_video.parse_seg(
+                    sd_dir_path, file_no, seg_info['seg_no'], record_file_index, parse_options
+                )
+            return sum(seg_info['end_pos'] - seg_info['start_pos'] for (file_no, seg_info) in case_segs)
+        return case
+
+    def videos(read_order: str = 'timeline'):
+        def case():
+            parse_options = {
+                'export_videos': False,
+                'gps_track': True,
+                'acce': True,
+                'image_label': False,
+                'read_order': read_order
+            }
+            telemetries[:] = parse_video.parse_videos(
+                sd_dir_path, parse_index.search(record_file_index), record_file_index, parse_options
+            )
+            return seg_bytes
+        return case
+
+    def exporter(export, file_name: str):
+        def case():
+            file_path = os.path.join(out_dir, file_name)
+            export(file_path, telemetries)
+            return os.path.getsize(file_path)
+        return case
+
+    all_options = dict(telemetry_options, ascii_acce = True, image_label = True, traffic_light = True)
+    export_options = dict(telemetry_options, export_video = True)
+    cases = [
+        ('parse_index.parse', index_parse),
+        ('parse_index.search', index_search),
+        ('parse_index.search_many', index_search_many),
+        ('parse_seg', parse_segs(telemetry_options)),
+        ('parse_seg mmap', parse_segs(dict(telemetry_options, use_mmap = True))),
+        ('parse_seg all decoders', parse_segs(all_options)),
+        ('parse_seg export_video', parse_segs(export_options, export_seg_num)),
+        ('parse_seg export_video pipeline', parse_segs(dict(export_options, pipeline = True), export_seg_num)),
+        ('parse_seg export_video fmp4', parse_segs(dict(export_options, export_format = 'fmp4'), export_seg_num)),
+        ('parse_videos', videos()),
+        ('parse_videos offset order', videos('offset')),
+        ('export_gps.export_geojson', exporter(export_gps.export_geojson, 'track.geojson')),
+        ('export_gps.export_gpx', exporter(export_gps.export_gpx, 'track.gpx')),
+        ('export_gps.export_kml', exporter(export_gps.export_kml, 'track.kml'))
+    ]
+    # Geoid height from pyproj would be timed with the exporters
+    export_gps.set_geoid_height(0.0)
+    return cases
+
+def __time_case(name: str, case, repeat: int) -> dict:
+    case_result = {'name': name}
+    seconds = []
+    try:
+        for i in range(repeat):
+            start = time.perf_counter()
+            case_bytes = case()
+            seconds.append(time.perf_counter() - start)
+    except ImportError as e:
+        # Exporters of missing optional modules
+        case_result['skipped'] = str(e)
+        return case_result
+    case_result['seconds'] = seconds
+    case_result['min'] = min(seconds)
+    case_result['median'] = statistics.median(seconds)
+    case_result['mean'] = statistics.mean(seconds)
+    case_result['bytes'] = case_bytes
+    if (case_bytes != None) and (case_result['min'] > 0):
+        case_result['mb_per_s'] = case_bytes / case_result['min'] / 1e6
+    return case_result
+
+def __get_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd = os.path.dirname(os.path.abspath(__file__)),
+            capture_output = True, text = True, check = True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def __get_numpy_version() -> str:
+    try:
+        import numpy
+        return numpy.__version__
+    except ImportError:
+        return None
+
+def print_result(result: dict):
+    """
+    Print a result of run() as a table.
+    """
+    print('revision %s, python %s, numpy %s' % (result['revision'], result['python'], result['numpy']))
+    if result['card'] != None:
+        print('card: %d files, %d segments, %d seconds, %.1f MB' % (
+            result['card']['file_num'], result['card']['seg_num'],
+            result['card']['sec_num'], result['card']['bytes'] / 1e6
+        ))
+    for case_result in result['cases']:
+        if 'skipped' in case_result:
+            print('%-32s skipped: %s' % (case_result['name'], case_result['skipped']))
+            continue
+        line = '%-32s min %9.4f s  median %9.4f s' % (
+            case_result['name'], case_result['min'], case_result['median']
+        )
+        if 'mb_per_s' in case_result:
+            line = line + '  %9.1f MB/s' % case_result['mb_per_s']
+        print(line)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python benchmark.py <result.json> [sd_dir_path or -] [file_num] [repeat]')
+        sys.exit(1)
+    common.set_timezone('UTC')
+    card_options = {}
+    if len(sys.argv) > 3:
+        card_options['file_num'] = int(sys.argv[3])
+    print_result(run(
+        sys.argv[2] if (len(sys.argv) > 2) and (sys.argv[2] != '-') else None,
+        sys.argv[1],
+        card_options,
+        int(sys.argv[4]) if len(sys.argv) > 4 else 3
+    ))
@@ -0,0 +1,321 @@
+# SQLite catalog of everything in an SD card
+
+import os
+import sqlite3
+
+import common
+import parse_index
+import parse_photo
+import parse_video
+
+# Bump when tables change
+schema_version = 1
+
+schema = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS segments (
+    file_no INTEGER,
+    seg_no INTEGER,
+    seg_type TEXT,
+    video_type TEXT,
+    is_emergency_file INTEGER,
+    start_time INTEGER,
+    end_time INTEGER,
+    start_pos INTEGER,
+    end_pos INTEGER,
+    video_fps INTEGER,
+    PRIMARY KEY (file_no, seg_no)
+);
+CREATE INDEX IF NOT EXISTS segments_time ON segments (start_time, end_time);
+CREATE TABLE IF NOT EXISTS gps (
+    time INTEGER,
+    file_no INTEGER,
+    seg_no INTEGER,
+    valid INTEGER,
+    lat INTEGER,
+    lon INTEGER,
+    height INTEGER,
+    speed INTEGER,
+    heading INTEGER
+);
+CREATE INDEX IF NOT EXISTS gps_time ON gps (time);
+CREATE INDEX IF NOT EXISTS gps_seg ON gps (file_no, seg_no);
+CREATE TABLE IF NOT EXISTS acce (
+    time_ms INTEGER,
+    file_no INTEGER,
+    seg_no INTEGER,
+    x INTEGER,
+    y INTEGER,
+    z INTEGER
+);
+CREATE INDEX IF NOT EXISTS acce_time ON acce (time_ms);
+CREATE INDEX IF NOT EXISTS acce_seg ON acce (file_no, seg_no);
+CREATE TABLE IF NOT EXISTS emergency (
+    time INTEGER,
+    file_no INTEGER,
+    seg_no INTEGER
+);
+CREATE INDEX IF NOT EXISTS emergency_time ON emergency (time);
+CREATE INDEX IF NOT EXISTS emergency_seg ON emergency (file_no, seg_no);
+CREATE TABLE IF NOT EXISTS thumbnails (
+    file_no INTEGER,
+    seg_no INTEGER,
+    time INTEGER,
+    data BLOB,
+    PRIMARY KEY (file_no, seg_no)
+);
+CREATE INDEX IF NOT EXISTS thumbnails_time ON thumbnails (time);
+CREATE TABLE IF NOT EXISTS photos (
+    time INTEGER,
+    file_no INTEGER,
+    seg_no INTEGER,
+    photo_no INTEGER,
+    reason TEXT,
+    photo_pos INTEGER,
+    data_len INTEGER,
+    photo_len INTEGER,
+    thumb_len INTEGER
+);
+CREATE INDEX IF NOT EXISTS photos_time ON photos (time);
+CREATE INDEX IF NOT EXISTS photos_seg ON photos (file_no, seg_no);
+'''
+
+# Tables with rows of segments, and their time column
+data_tables = {
+    'gps': 'time',
+    'acce': 'time_ms',
+    'emergency': 'time',
+    'thumbnails': 'time',
+    'photos': 'time'
+}
+
+segment_columns = [
+    'file_no', 'seg_no', 'seg_type', 'video_type', 'is_emergency_file',
+    'start_time', 'end_time', 'start_pos', 'end_pos', 'video_fps'
+]
+
+#===========================================
+
+def ingest(
+    sd_dir_path: str, db_path: str,
+    record_file_index: dict = None,
+    parse_options: dict = None
+) -> dict:
+    """
+    Read every segment in the SD card once and add it to the catalog.
+
+    Each segment is added in its own transaction. Segments already in
+    the catalog with the same position and time are skipped, so an
+    interrupted ingestion continues where it stopped. Segments
+    overwritten by loop recording are added again.
+
+    Parameters
+    ----------
+    db_path: str
+        SQLite database file. Created if not exists.
+    record_file_index: dict
+        Index returned by parse_index.parse(). Parsed from the SD card
+        if None.
+    parse_options: dict
+        'use_mmap' and 'telemetry_index_dir' are passed to
+        parse_video.parse_seg(). Optional.
+
+    Returns
+    ----------
+    ingest_result: dict
+        {'added': number of segments added, 'skipped': number of segments
+        already in the catalog, 'removed': number of segments no longer
+        in the index}
+    """
+
+    if record_file_index == None:
+        record_file_index = parse_index.parse(sd_dir_path)
+    parse_seg_options = {}
+    parse_seg_options['export_video'] = False
+    parse_seg_options['export_thumbnail'] = False
+    parse_seg_options['gps_track'] = True
+    parse_seg_options['acce'] = True
+    parse_seg_options['image_label'] = False
+    parse_seg_options['columnar'] = True
+    if parse_options != None:
+        for key in ('use_mmap', 'telemetry_index_dir'):
+            if key in parse_options:
+                parse_seg_options[key] = parse_options[key]
+
+    conn = connect(db_path)
+    try:
+        catalogued = {}
+        for row in conn.execute('SELECT * FROM segments'):
+            catalogued[(row['file_no'], row['seg_no'])] = dict(row)
+
+        ingest_result = {'added': 0, 'skipped': 0, 'removed': 0}
+        in_index = set()
+        for file_info in record_file_index['record_file_infos']:
+            for seg_info in file_info['seg_infos']:
+                segment = __get_segment(file_info, seg_info)
+                key = (segment['file_no'], segment['seg_no'])
+                in_index.add(key)
+                if catalogued.get(key) == segment:
+                    ingest_result['skipped'] = ingest_result['skipped'] + 1
+                    continue
+                if segment['seg_type'] == 'video':
+                    rows = __read_video_seg(sd_dir_path, segment, record_file_index, parse_seg_options)
+                else:
+                    rows = __read_photo_seg(sd_dir_path, segment, record_file_index)
+                with conn:
+                    __delete_segment(conn, key)
+                    __insert(conn, 'segments', [segment])
+                    for table_name in rows:
+                        __insert(conn, table_name, rows[table_name])
+                ingest_result['added'] = ingest_result['added'] + 1
+
+        # Files removed from the index
+        with conn:
+            for key in catalogued:
+                if key not in in_index:
+                    __delete_segment(conn, key)
+                    ingest_result['removed'] = ingest_result['removed'] + 1
+    finally:
+        conn.close()
+
+    return ingest_result
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """
+    Open the catalog, creating tables if needed. Rows are returned as
+    sqlite3.Row, which can be used as dicts.
+
+    A catalog made with another schema version or timezone is cleared,
+    since its timestamps can't be used.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    with conn:
+        conn.executescript(schema)
+        meta = {row['key']: row['value'] for row in conn.execute('SELECT * FROM meta')}
+        new_meta = {
+            'schema_version': str(schema_version),
+            'timezone': str(common.local_timezone)
+        }
+        if meta != new_meta:
+            for table_name in ['segments'] + list(data_tables):
+                conn.execute('DELETE FROM %s' % table_name)
+            conn.execute('DELETE FROM meta')
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', new_meta.items())
+    return conn
+
+def query(db_path: str, table_name: str, start_time: int, end_time: int) -> list:
+    """
+    Get rows of a table in a time range.
+
+    Parameters
+    ----------
+    table_name: str
+        'segments', 'gps', 'acce', 'emergency', 'thumbnails' or 'photos'
+    start_time, end_time: int
+        Time range, both included. For 'segments', segments overlapping
+        with the range. For 'acce', still in seconds.
+
+    Returns
+    ----------
+    rows: list
+        Rows as dicts, sorted by time.
+    """
+
+    conn = connect(db_path)
+    try:
+        if table_name == 'segments':
+            cursor = conn.execute(
+                'SELECT * FROM segments WHERE start_time <= ? AND end_time >= ? '
+                'ORDER BY start_time',
+                (end_time, start_time)
+            )
+        elif table_name in data_tables:
+            time_column = data_tables[table_name]
+            if time_column == 'time_ms':
+                (start_time, end_time) = (start_time * 1000, end_time * 1000 + 999)
+            cursor = conn.execute(
+                'SELECT * FROM %s WHERE %s BETWEEN ? AND ? ORDER BY %s' % (
+                    table_name, time_column, time_column
+                ),
+                (start_time, end_time)
+            )
+        else:
+            common.error('Unknown table %s.' % table_name)
+        return [dict(row) for row in cursor]
+    finally:
+        conn.close()
+
+def __get_segment(file_info: dict, seg_info: dict) -> dict:
+    segment = {}
+    segment['file_no'] = file_info['file_no']
+    segment['seg_no'] = seg_info['seg_no']
+    segment['seg_type'] = seg_info['seg_type']
+    segment['video_type'] = seg_info.get('video_type')
+    segment['is_emergency_file'] = int(file_info.get('is_emergency_file', False))
+    segment['start_time'] = seg_info['start_time']
+    segment['end_time'] = seg_info['end_time']
+    segment['start_pos'] = seg_info['start_pos']
+    segment['end_pos'] = seg_info['end_pos']
+    segment['video_fps'] = seg_info.get('video_fps')
+    return segment
+
+def __read_video_seg(sd_dir_path: str, segment: dict, record_file_index: dict, parse_seg_options: dict) -> dict:
+    file_no = segment['file_no']
+    seg_no = segment['seg_no']
+    parse_seg_result = parse_video.parse_seg(
+        sd_dir_path, file_no, seg_no, record_file_index, parse_seg_options
+    )
+    rows = {}
+    rows['gps'] = [
+        dict(point, file_no = file_no, seg_no = seg_no)
+        for point in parse_seg_result['gps_info']['gps_track']
+    ]
+    rows['acce'] = [
+        dict(acce_data, file_no = file_no, seg_no = seg_no)
+        for acce_data in parse_seg_result['acce_info']['acce_log']
+    ]
+    rows['emergency'] = [
+        {'time': t, 'file_no': file_no, 'seg_no': seg_no}
+        for t in parse_seg_result['emergency_info']['emergency_video_timestamps']
+    ]
+
+    # Seg 3 Thumbnail
+    with open(os.path.join(sd_dir_path, 'hiv%05d.mp4' % file_no), 'rb') as f:
+        f.seek(segment['start_pos'] + 0x20000)
+        buf = f.read(0x20)
+        thumbnail_len = int.from_bytes(buf[0x1C:0x1E], 'little')
+        data = f.read(thumbnail_len)
+    rows['thumbnails'] = [
+        {'file_no': file_no, 'seg_no': seg_no, 'time': segment['start_time'], 'data': data}
+    ]
+    return rows
+
+def __read_photo_seg(sd_dir_path: str, segment: dict, record_file_index: dict) -> dict:
+    file_no = segment['file_no']
+    seg_no = segment['seg_no']
+    photo_infos = parse_photo.parse_seg(sd_dir_path, file_no, seg_no, record_file_index)
+    rows = {}
+    rows['photos'] = [
+        dict(photo_info, file_no = file_no, seg_no = seg_no)
+        for photo_info in photo_infos
+    ]
+    return rows
+
+def __delete_segment(conn: sqlite3.Connection, key: tuple):
+    for table_name in ['segments'] + list(data_tables):
+        conn.execute('DELETE FROM %s WHERE file_no = ? AND seg_no = ?' % table_name, key)
+
+def __insert(conn: sqlite3.Connection, table_name: str, rows: list):
+    if len(rows) == 0:
+        return
+    columns = list(rows[0])
+    conn.executemany(
+        'INSERT INTO %s (%s) VALUES (%s)' % (
+            table_name, ', '.join(columns), ', '.join(':' + column for column in columns)
+        ),
+        rows
+    )
@@ -1,18 +1,61 @@
 # Common consts and functions
 
 import pytz
+from bisect import bisect_right
 from datetime import datetime, timezone
 
-# A recent time for timezone history database
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+# A recent time for timezones without transition history
 __dt = datetime(2024, 1, 1, 0, 0, 0)
 
 # Use computer's timezone by default
 local_timezone = datetime.now().astimezone().tzinfo
 
+# Standard time offset tables of timezones, see __get_zone_table()
+__zone_tables = {}
+__current_zone = None
+__current_table = None
+
 # Assume dashcam is at the same timezone as the computer
 def adjust_tz(timestamp):
-    utc_offset = int(local_timezone.utcoffset(__dt, is_dst = False).total_seconds())
-    return timestamp - utc_offset
+    """
+    Convert dashcam timestamps to UTC timestamps.
+
+    The dashcam clock runs in the standard time of its timezone, without
+    daylight saving time, and its timestamps are written as if they were
+    UTC. The standard time offset in effect at each timestamp is used.
+
+    Parameters
+    ----------
+    timestamp: int, float or numpy array
+        Dashcam timestamps.
+
+    Returns
+    ----------
+    Timestamps of the same type.
+    """
+    (times, offsets) = __get_current_table()
+    if len(offsets) == 1:
+        # A Python int, so that a scalar timestamp keeps its type
+        return timestamp - int(offsets[0])
+    # Find the offset by the UTC time, guessed with the offset at the
+    # dashcam time
+    utc_guess = timestamp - __lookup_offset(times, offsets, timestamp)
+    return timestamp - __lookup_offset(times, offsets, utc_guess)
+
+def to_dashcam_time(timestamp):
+    """
+    Convert UTC timestamps to dashcam timestamps. Reverse of adjust_tz().
+    """
+    (times, offsets) = __get_current_table()
+    if len(offsets) == 1:
+        return timestamp + int(offsets[0])
+    return timestamp + __lookup_offset(times, offsets, timestamp)
 
 # Set global timezone for dashcam internal timestamp conversion
 def set_timezone(timezone_str: str = None):
@@ -22,6 +65,66 @@ def set_timezone(timezone_str: str = None):
     else:
         local_timezone = datetime.now().astimezone().tzinfo
 
+def __get_current_table() -> tuple:
+    # local_timezone may be set directly, check it every time
+    global __current_zone, __current_table
+    if __current_zone is not local_timezone:
+        __current_table = __get_zone_table(local_timezone)
+        __current_zone = local_timezone
+    return __current_table
+
+def __get_zone_table(tz) -> tuple:
+    """
+    Get standard time offsets of a timezone, computed once for each timezone.
+
+    Returns
+    ----------
+    tuple(times, offsets)
+        offsets[i] is the standard time offset in seconds from UTC time
+        times[i]. times[0] is the earliest time. Numpy arrays if numpy is
+        installed, otherwise lists.
+    """
+    if tz in __zone_tables:
+        return __zone_tables[tz]
+
+    times = []
+    offsets = []
+    if hasattr(tz, '_utc_transition_times'):
+        # pytz timezone with history
+        epoch = datetime(1970, 1, 1)
+        for (when, (utcoffset, dst, tzname)) in zip(tz._utc_transition_times, tz._transition_info):
+            offset = int((utcoffset - dst).total_seconds())
+            if (len(offsets) != 0) and (offsets[-1] == offset):
+                continue
+            if len(offsets) == 0:
+                times.append(-(1 << 62))
+            else:
+                times.append(int((when - epoch).total_seconds()))
+            offsets.append(offset)
+    else:
+        # Fixed offset
+        dst = tz.dst(__dt)
+        offset = tz.utcoffset(__dt)
+        if dst != None:
+            offset = offset - dst
+        times.append(-(1 << 62))
+        offsets.append(int(offset.total_seconds()))
+
+    if has_numpy:
+        table = (np.array(times, dtype = np.int64), np.array(offsets, dtype = np.int64))
+    else:
+        table = (times, offsets)
+    __zone_tables[tz] = table
+    return table
+
+def __lookup_offset(times, offsets, timestamp):
+    if has_numpy:
+        i = np.searchsorted(times, timestamp, side = 'right') - 1
+        if np.ndim(i) == 0:
+            return int(offsets[i])
+        return offsets[i]
+    return offsets[bisect_right(times, timestamp) - 1]
+
 def print_iso_timestr(when: datetime) -> str:
     return when.isoformat()
 
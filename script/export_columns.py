@@ -0,0 +1,298 @@
+# Columnar export of telemetry, partitioned by day
+
+import os
+
+import common
+import parse_index
+import parse_video
+import telemetry_columns
+
+# Exported tables and their column containers
+table_types = {
+    'gps': telemetry_columns.GpsTrack,
+    'acce': telemetry_columns.AcceLog,
+    'emergency': telemetry_columns.EmergencyLog
+}
+
+# Time column of each table and its units per second
+time_columns = {
+    'gps': ('time', 1),
+    'acce': ('time_ms', 1000),
+    'emergency': ('time', 1)
+}
+
+file_formats = ['npy', 'arrow', 'parquet']
+
+#===========================================
+
+def export_telemetries(folder: str, telemetries: list, file_format: str = 'npy'):
+    """
+    Export GPS tracks, accelerometer logs and emergency timestamps as
+    column files.
+
+    Parameters
+    ----------
+    folder: str
+        Output folder. A sub folder is created for each day. Existing
+        files of the same days are replaced.
+    telemetries: list
+        Result got from parse_video.parse_videos(). Results without
+        emergency_info add no emergency timestamps.
+    file_format: str
+        'npy', 'arrow' or 'parquet'. See README.md
+
+    Returns
+    ----------
+    days: list
+        Exported days, 'YYYY-MM-DD'.
+    """
+
+    __check_format(file_format)
+    pending = __new_tables()
+    for telemetry in telemetries:
+        telemetry = telemetry['telemetry']
+        pending['gps'].extend(telemetry['gps_info']['gps_track'])
+        pending['acce'].extend(telemetry['acce_info']['acce_log'])
+        # Not in results saved by older versions
+        emergency_info = telemetry.get('emergency_info')
+        if emergency_info == None:
+            continue
+        for (t, seg) in zip(emergency_info['emergency_video_timestamps'], emergency_info['emergency_video_segs']):
+            pending['emergency'].append({'time': t, 'file_no': seg['file_no'], 'seg_no': seg['seg_no']})
+    return __flush(folder, pending, file_format, set())
+
+def export_card(
+    sd_dir_path: str, record_file_index: dict, folder: str,
+    file_format: str = 'npy',
+    parse_options: dict = None
+):
+    """
+    Export GPS tracks, accelerometer logs and emergency timestamps of all
+    video segments in the SD card as column files.
+
+    Segments are parsed in time order, and a day is written as soon as
+    no later segment can have data of it. So only about one day of data
+    is kept in memory.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    folder: str
+        Output folder. See export_telemetries().
+    file_format: str
+        See export_telemetries().
+    parse_options: dict
+        'use_mmap' and 'telemetry_index_dir' are passed to
+        parse_video.parse_seg(). Optional.
+
+    Returns
+    ----------
+    days: list
+        Exported days, 'YYYY-MM-DD'.
+    """
+
+    __check_format(file_format)
+    parse_seg_options = {}
+    parse_seg_options['export_video'] = False
+    parse_seg_options['export_thumbnail'] = False
+    parse_seg_options['gps_track'] = True
+    parse_seg_options['acce'] = True
+    parse_seg_options['image_label'] = False
+    parse_seg_options['columnar'] = True
+    if parse_options != None:
+        for key in ('use_mmap', 'telemetry_index_dir'):
+            if key in parse_options:
+                parse_seg_options[key] = parse_options[key]
+
+    search_index = parse_index.build_search_index(record_file_index)
+    pending = __new_tables()
+    written = set()
+    days = []
+    for i in range(len(search_index['start'])):
+        # Later segments start after this one, so earlier days are complete
+        days = days + __flush(
+            folder, pending, file_format, written,
+            __get_day(search_index['start'][i])
+        )
+        file_no = search_index['file_no'][i]
+        seg_no = search_index['seg_no'][i]
+        parse_seg_result = parse_video.parse_seg(
+            sd_dir_path, file_no, seg_no, record_file_index, parse_seg_options
+        )
+        pending['gps'].extend(parse_seg_result['gps_info']['gps_track'])
+        pending['acce'].extend(parse_seg_result['acce_info']['acce_log'])
+        for t in parse_seg_result['emergency_info']['emergency_video_timestamps']:
+            pending['emergency'].append({'time': t, 'file_no': file_no, 'seg_no': seg_no})
+    days = days + __flush(folder, pending, file_format, written)
+    return sorted(set(days))
+
+def get_days(folder: str) -> list:
+    """
+    List exported days in a folder, 'YYYY-MM-DD'.
+    """
+    return sorted(
+        name for name in os.listdir(folder)
+        if os.path.isdir(os.path.join(folder, name))
+    )
+
+def load(folder: str, day: str, file_format: str = 'npy', use_mmap: bool = True) -> dict:
+    """
+    Load exported tables of a day.
+
+    Parameters
+    ----------
+    folder: str
+        Folder passed to export_telemetries() or export_card().
+    day: str
+        'YYYY-MM-DD'
+    file_format: str
+        Format used when exporting.
+    use_mmap: bool
+        Map files into memory instead of reading them. Columns are read
+        from the files only when they are used.
+
+    Returns
+    ----------
+    tables: dict
+        {'gps': {'time': array, ...}, 'acce': {...}, 'emergency': {...}}
+        with numpy arrays for 'npy', pyarrow tables otherwise.
+        Missing tables are left out.
+    """
+
+    __check_format(file_format)
+    day_folder = os.path.join(folder, day)
+    tables = {}
+    for table_name in table_types:
+        if file_format == 'npy':
+            import numpy as np
+            columns = {}
+            for (name, typecode) in table_types[table_name].fields:
+                file_path = os.path.join(day_folder, '%s_%s.npy' % (table_name, name))
+                if os.path.isfile(file_path):
+                    columns[name] = np.load(file_path, mmap_mode = 'r' if use_mmap else None)
+            if len(columns) != 0:
+                tables[table_name] = columns
+        else:
+            file_path = os.path.join(day_folder, '%s.%s' % (table_name, file_format))
+            if os.path.isfile(file_path):
+                tables[table_name] = __read_table(file_path, file_format, use_mmap)
+    return tables
+
+def __check_format(file_format: str):
+    if file_format not in file_formats:
+        common.error('Unknown file format %s.' % file_format)
+    try:
+        import numpy
+    except ImportError:
+        common.error('Module numpy is needed for column export.')
+    if file_format != 'npy':
+        try:
+            import pyarrow
+        except ImportError:
+            common.error('Module pyarrow is needed for Arrow and Parquet export.')
+
+def __new_tables() -> dict:
+    return {table_name: table_types[table_name]() for table_name in table_types}
+
+def __get_day(t: int) -> int:
+    # Days of the dashcam clock
+    return common.to_dashcam_time(t) // 86400
+
+def __flush(folder: str, pending: dict, file_format: str, written: set, before_day: int = None) -> list:
+    """
+    Write data of days before before_day (all days if None) and remove
+    them from pending. Days in written are added to, not replaced.
+
+    Returns
+    ----------
+    days: list
+        Written days, 'YYYY-MM-DD'.
+    """
+
+    import numpy as np
+    from datetime import datetime, timezone
+
+    # Split each table by day
+    day_columns = {}
+    for table_name in pending:
+        container = pending[table_name]
+        if len(container) == 0:
+            continue
+        (time_name, units) = time_columns[table_name]
+        # Shared arrays, the container is not added to before they are gone
+        record_days = __get_day(container.column(time_name, copy = False) // units)
+        columns = {name: container.column(name, copy = False) for (name, typecode) in container.fields}
+        keep = np.ones(len(container), dtype = bool)
+        for day in np.unique(record_days):
+            if (before_day != None) and (day >= before_day):
+                continue
+            mask = (record_days == day)
+            keep = keep & (~mask)
+            day_columns.setdefault(int(day), {})[table_name] = {
+                name: columns[name][mask] for name in columns
+            }
+        if not keep.all():
+            pending[table_name] = table_types[table_name]({
+                name: columns[name][keep] for name in columns
+            })
+
+    days = []
+    for day in sorted(day_columns):
+        day_str = datetime.fromtimestamp(day * 86400, timezone.utc).strftime('%Y-%m-%d')
+        day_folder = os.path.join(folder, day_str)
+        os.makedirs(day_folder, exist_ok = True)
+        if day_str in written:
+            # Data of the day found again, add to what is written
+            existing = load(folder, day_str, file_format, use_mmap = False)
+        else:
+            existing = {}
+        for (table_name, columns) in day_columns[day].items():
+            if table_name in existing:
+                old_columns = existing[table_name]
+                if file_format != 'npy':
+                    old_columns = {name: old_columns.column(name).to_numpy() for name in columns}
+                columns = {name: np.concatenate((old_columns[name], columns[name])) for name in columns}
+            __write_table(day_folder, table_name, columns, file_format)
+        written.add(day_str)
+        days.append(day_str)
+    return days
+
+def __write_table(day_folder: str, table_name: str, columns: dict, file_format: str):
+    import numpy as np
+
+    # Sort by time, segments are not always in time order
+    (time_name, units) = time_columns[table_name]
+    order = np.argsort(columns[time_name], kind = 'stable')
+    columns = {name: np.ascontiguousarray(columns[name][order]) for name in columns}
+
+    if file_format == 'npy':
+        for name in columns:
+            file_path = os.path.join(day_folder, '%s_%s.npy' % (table_name, name))
+            np.save(file_path, columns[name])
+        return
+
+    import pyarrow as pa
+    table = pa.table(columns)
+    file_path = os.path.join(day_folder, '%s.%s' % (table_name, file_format))
+    if file_format == 'arrow':
+        # Uncompressed Arrow IPC file, can be memory mapped
+        with pa.OSFile(file_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    else:
+        import pyarrow.parquet as pq
+        pq.write_table(table, file_path)
+
+def __read_table(file_path: str, file_format: str, use_mmap: bool):
+    import pyarrow as pa
+
+    if file_format == 'arrow':
+        if use_mmap:
+            source = pa.memory_map(file_path, 'r')
+        else:
+            source = pa.OSFile(file_path, 'rb')
+        return pa.ipc.open_file(source).read_all()
+    else:
+        import pyarrow.parquet as pq
+        return pq.read_table(file_path, memory_map = use_mmap)
@@ -0,0 +1,639 @@
+# Remux Program Stream video and audio to fragmented MP4 while exporting
+
+import json
+import struct
+
+import common
+
+# Timescale of video, same as PTS
+video_timescale = 90000
+
+# Timescale of the telemetry track, milliseconds
+meta_timescale = 1000
+
+# Duration of a video frame when it can't be told from the next one
+default_frame_duration = 3000
+
+# AAC frame, in samples
+aac_frame_samples = 1024
+
+# Sampling frequencies of ADTS sampling_frequency_index
+aac_sample_rates = [
+    96000, 88200, 64000, 48000, 44100, 32000, 24000,
+    22050, 16000, 12000, 11025, 8000, 7350
+]
+
+# HEVC nal_unit_type
+hevc_vps = 32
+hevc_sps = 33
+hevc_pps = 34
+hevc_aud = 35
+
+# sample_flags of trun
+sync_sample_flags = 0x02000000
+non_sync_sample_flags = 0x01010000
+
+#===========================================
+
+class Muxer:
+    """
+    Remuxes Program Stream to fragmented MP4, fed in file order.
+
+    HEVC video and ADTS AAC audio PES packets are remuxed, other packets
+    are dropped. Each GOP is a fragment. The init segment is written
+    before the first fragment, and a seek index (mfra) at close().
+    Segments fed one after another are joined into one timeline, see
+    new_segment().
+    """
+
+    def __init__(self, of, telemetry: bool = False):
+        """
+        Parameters
+        ----------
+        of: file
+            Output file, opened for writing. Closed by close().
+        telemetry: bool
+            Add a timed metadata track, samples added by add_metadata().
+        """
+        self.of = of
+        self.telemetry = telemetry
+        self.pos = 0
+        # Unread end of the stream
+        self.pending = bytearray()
+        # Access unit being assembled
+        self.au = None
+        # Video samples of the GOP, and audio and metadata samples not written
+        self.video_samples = []
+        self.audio_samples = []
+        self.meta_samples = []
+        self.audio_buf = bytearray()
+        self.audio_pts = None
+        self.audio_config = None
+        self.parameter_sets = {}
+        self.video_info = None
+        self.init_written = False
+        # Track IDs of written tracks, set with the init segment
+        self.track_ids = {}
+        self.sequence_number = 0
+        # Seek index, (time, moof_offset, traf_number) of each track
+        self.index = {'video': [], 'audio': [], 'meta': []}
+        # Extended timestamps, and the offset of the segment being fed
+        self.last_raw = None
+        self.last_ext = 0
+        self.offset = None
+        self.segment_start = 0
+        self.segment_time = None
+        # Next decode time of each track in the timeline, in its timescale
+        self.next_time = {'video': 0, 'audio': 0, 'meta': 0}
+        self.last_duration = default_frame_duration
+
+    def __deepcopy__(self, memo):
+        # Shared by copies of parse_options
+        return self
+
+    def new_segment(self, start_time: int = None):
+        """
+        Start feeding a segment. Its first video frame follows the last
+        frame of the segment before it, whatever their PTS.
+
+        Parameters
+        ----------
+        start_time: int
+            Time of the first frame, for add_metadata(). Optional.
+        """
+        self.__finish_segment()
+        self.offset = None
+        self.segment_time = start_time
+
+    def write(self, data) -> int:
+        """
+        Feed Program Stream bytes. Packets can be split at any byte.
+        """
+        self.pending += data
+        pos = self.__parse(self.pending)
+        del self.pending[:pos]
+        return len(data)
+
+    def flush(self):
+        self.of.flush()
+
+    def add_metadata(self, t: float, data: bytes):
+        """
+        Add a sample to the telemetry track. t is a time of the segment
+        being fed, in the same units as start_time of new_segment().
+        """
+        if (not self.telemetry) or (self.segment_time == None):
+            return
+        self.meta_samples.append((self.segment_start / video_timescale + (t - self.segment_time), data))
+
+    def close(self):
+        """
+        Write the rest and the seek index, and close the file.
+        """
+        self.__finish_segment()
+        if not self.init_written:
+            self.__write_init()
+        self.__write_mfra()
+        self.of.close()
+
+    def __parse(self, buf) -> int:
+        """
+        Parse whole packets in buf. Returns the position parsed to.
+        """
+        pos = 0
+        buf_len = len(buf)
+        while pos + 6 <= buf_len:
+            if (buf[pos] != 0) or (buf[pos + 1] != 0) or (buf[pos + 2] != 1):
+                # Not at a start code, find the next one
+                next_pos = buf.find(b'\x00\x00\x01', pos + 1)
+                if next_pos == -1:
+                    return max(pos, buf_len - 2)
+                pos = next_pos
+                continue
+            stream_id = buf[pos + 3]
+            if stream_id == 0xBA:
+                # pack_header, with stuffing
+                if pos + 14 > buf_len:
+                    break
+                pack_end = pos + 14 + (buf[pos + 13] & 0x07)
+                if pack_end > buf_len:
+                    break
+                pos = pack_end
+                continue
+            if stream_id == 0xB9:
+                # MPEG_program_end_code
+                pos = pos + 4
+                continue
+            pes_end = pos + 6 + ((buf[pos + 4] << 8) | buf[pos + 5])
+            if pes_end > buf_len:
+                break
+            if (0xE0 <= stream_id <= 0xEF) or (0xC0 <= stream_id <= 0xDF):
+                (pts, dts, payload) = Muxer.__parse_pes(buf, pos, pes_end)
+                if stream_id >= 0xE0:
+                    self.__add_video(pts, dts, payload)
+                else:
+                    self.__add_audio(pts, payload)
+            pos = pes_end
+        return pos
+
+    def __extend(self, ts: int) -> int:
+        """
+        Extend a 33 bit timestamp across wraps.
+        """
+        if self.last_raw == None:
+            self.last_ext = ts
+        else:
+            diff = (ts - self.last_raw) & ((1 << 33) - 1)
+            if diff >= (1 << 32):
+                diff = diff - (1 << 33)
+            self.last_ext = self.last_ext + diff
+        self.last_raw = ts
+        return self.last_ext
+
+    def __add_video(self, pts: int, dts: int, payload):
+        if pts != None:
+            pts = self.__extend(pts)
+            dts = pts if dts == None else pts - ((pts - dts) & ((1 << 33) - 1))
+            if (self.au == None) or (self.au[0] != pts):
+                self.__finish_au()
+                self.au = (pts, dts, bytearray())
+        if self.au != None:
+            self.au[2].extend(payload)
+
+    def __finish_au(self):
+        if self.au == None:
+            return
+        (pts, dts, data) = self.au
+        self.au = None
+        sample = bytearray()
+        key = False
+        for nal in Muxer.__split_nal_units(data):
+            nal_type = (nal[0] >> 1) & 0x3F
+            if nal_type == hevc_aud:
+                continue
+            if nal_type in (hevc_vps, hevc_sps, hevc_pps):
+                self.parameter_sets.setdefault(nal_type, bytes(nal))
+            elif 16 <= nal_type <= 21:
+                # IRAP picture
+                key = True
+            sample += len(nal).to_bytes(4, 'big')
+            sample += nal
+        if len(sample) == 0:
+            return
+        if self.offset == None:
+            # First frame of the segment follows the last one
+            self.offset = self.next_time['video'] - dts
+            self.segment_start = self.next_time['video']
+        if key and (len(self.video_samples) != 0):
+            self.__write_fragment(dts + self.offset)
+        if (len(self.video_samples) == 0) and (not key):
+            if not self.init_written:
+                # Can't start with a frame depending on earlier ones
+                return
+        self.video_samples.append((dts + self.offset, pts - dts, bytes(sample), key))
+
+    def __add_audio(self, pts: int, payload):
+        if pts != None:
+            self.audio_pts = self.__extend(pts)
+        self.audio_buf += payload
+        pos = 0
+        buf = self.audio_buf
+        while pos + 7 <= len(buf):
+            if (buf[pos] != 0xFF) or ((buf[pos + 1] & 0xF6) != 0xF0):
+                # Resync to an ADTS header
+                pos = pos + 1
+                continue
+            frame_len = ((buf[pos + 3] & 0x03) << 11) | (buf[pos + 4] << 3) | (buf[pos + 5] >> 5)
+            header_len = 7 if buf[pos + 1] & 0x01 else 9
+            if frame_len < header_len:
+                pos = pos + 1
+                continue
+            if pos + frame_len > len(buf):
+                break
+            if self.audio_config == None:
+                profile = buf[pos + 2] >> 6
+                freq_index = (buf[pos + 2] >> 2) & 0x0F
+                channels = ((buf[pos + 2] & 0x01) << 2) | (buf[pos + 3] >> 6)
+                if freq_index >= len(aac_sample_rates):
+                    pos = pos + 1
+                    continue
+                self.audio_config = (profile + 1, freq_index, channels)
+            if self.audio_pts != None:
+                self.audio_samples.append((self.audio_pts, bytes(buf[pos + header_len : pos + frame_len])))
+                rate = aac_sample_rates[self.audio_config[1]]
+                self.audio_pts = self.audio_pts + aac_frame_samples * video_timescale // rate
+            pos = pos + frame_len
+        del self.audio_buf[:pos]
+
+    def __finish_segment(self):
+        """
+        Write all samples of the segment being fed.
+        """
+        self.__finish_au()
+        if len(self.video_samples) != 0:
+            self.__write_fragment(self.video_samples[-1][0] + self.last_duration)
+        elif (len(self.audio_samples) != 0) or (len(self.meta_samples) != 0):
+            self.__write_fragment(None)
+        self.audio_buf = bytearray()
+        self.audio_pts = None
+
+    def __write_init(self):
+        """
+        Write ftyp and moov, with the tracks seen so far.
+        """
+        self.init_written = True
+        traks = []
+        if (hevc_sps in self.parameter_sets) and (hevc_pps in self.parameter_sets):
+            self.video_info = Muxer.__parse_hevc_sps(self.parameter_sets[hevc_sps])
+            self.track_ids['video'] = len(self.track_ids) + 1
+            traks.append(Muxer.__video_trak(self.track_ids['video'], self.video_info, self.parameter_sets))
+        if self.audio_config != None:
+            self.track_ids['audio'] = len(self.track_ids) + 1
+            traks.append(Muxer.__audio_trak(self.track_ids['audio'], self.audio_config))
+        if self.telemetry:
+            self.track_ids['meta'] = len(self.track_ids) + 1
+            traks.append(Muxer.__meta_trak(self.track_ids['meta']))
+        ftyp = Muxer.__box(b'ftyp', b'isom' + (0x200).to_bytes(4, 'big') + b'isomiso6mp41')
+        # Durations are not known while streaming, left 0
+        mvhd = Muxer.__full_box(b'mvhd', 0, 0, struct.pack(
+            '>IIIIIH10x36s24xI',
+            0, 0, 1000, 0, 0x00010000, 0x0100, Muxer.__matrix(), len(self.track_ids) + 1
+        ))
+        trexs = b''.join(
+            Muxer.__full_box(b'trex', 0, 0, struct.pack('>IIIII', track_id, 1, 0, 0, 0))
+            for track_id in self.track_ids.values()
+        )
+        moov = Muxer.__box(b'moov', mvhd + b''.join(traks) + Muxer.__box(b'mvex', trexs))
+        self.__out(ftyp + moov)
+
+    def __write_fragment(self, video_end):
+        """
+        Write a moof and mdat of the pending samples.
+
+        Parameters
+        ----------
+        video_end: int
+            Decode time after the last video sample, for its duration.
+        """
+        if not self.init_written:
+            self.__write_init()
+        tracks = []
+        if (len(self.video_samples) != 0) and ('video' in self.track_ids):
+            samples = []
+            for (i, (dts, cto, data, key)) in enumerate(self.video_samples):
+                next_dts = self.video_samples[i + 1][0] if i + 1 < len(self.video_samples) else video_end
+                duration = next_dts - dts
+                if duration <= 0:
+                    duration = self.last_duration
+                self.last_duration = duration
+                samples.append((duration, data, sync_sample_flags if key else non_sync_sample_flags, cto))
+            start = self.video_samples[0][0]
+            self.next_time['video'] = start + sum(sample[0] for sample in samples)
+            tracks.append(('video', start, samples, self.video_samples[0][3]))
+        self.video_samples = []
+        if (len(self.audio_samples) != 0) and ('audio' in self.track_ids) and (self.offset != None):
+            rate = aac_sample_rates[self.audio_config[1]]
+            start = (self.audio_samples[0][0] + self.offset) * rate // video_timescale
+            samples = [(aac_frame_samples, data, sync_sample_flags, 0) for (pts, data) in self.audio_samples]
+            if (self.next_time['audio'] != 0) and (abs(start - self.next_time['audio']) < aac_frame_samples):
+                # Rounding, keep audio continuous
+                start = self.next_time['audio']
+            # Drop audio before the timeline or overlapping written audio
+            skip = 0
+            while (skip < len(samples)) and (start + skip * aac_frame_samples < self.next_time['audio']):
+                skip = skip + 1
+            samples = samples[skip:]
+            start = start + skip * aac_frame_samples
+            if len(samples) != 0:
+                self.next_time['audio'] = start + len(samples) * aac_frame_samples
+                tracks.append(('audio', start, samples, True))
+        self.audio_samples = []
+        if (len(self.meta_samples) != 0) and ('meta' in self.track_ids):
+            times = [max(0, round(t * meta_timescale)) for (t, data) in self.meta_samples]
+            samples = []
+            start = None
+            for (i, (t, data)) in enumerate(self.meta_samples):
+                if times[i] < self.next_time['meta']:
+                    continue
+                if start == None:
+                    start = times[i]
+                duration = times[i + 1] - times[i] if i + 1 < len(times) else meta_timescale
+                if duration <= 0:
+                    duration = meta_timescale
+                samples.append((duration, data, sync_sample_flags, 0))
+            if len(samples) != 0:
+                self.next_time['meta'] = start + sum(sample[0] for sample in samples)
+                tracks.append(('meta', start, samples, True))
+        self.meta_samples = []
+        if len(tracks) == 0:
+            return
+
+        self.sequence_number = self.sequence_number + 1
+        moof_offset = self.pos
+        # Sizes don't depend on data offsets, so build once to get them
+        moof = self.__moof(tracks, [0] * len(tracks))
+        data_offsets = []
+        data_offset = len(moof) + 8
+        for (name, start, samples, key) in tracks:
+            data_offsets.append(data_offset)
+            data_offset = data_offset + sum(len(sample[1]) for sample in samples)
+        moof = self.__moof(tracks, data_offsets)
+        for (i, (name, start, samples, key)) in enumerate(tracks):
+            if key:
+                self.index[name].append((start, moof_offset, i + 1))
+        mdat_len = data_offset - len(moof)
+        self.__out(moof + (mdat_len).to_bytes(4, 'big') + b'mdat')
+        for (name, start, samples, key) in tracks:
+            self.__out(b''.join(sample[1] for sample in samples))
+
+    def __moof(self, tracks: list, data_offsets: list) -> bytes:
+        trafs = []
+        for ((name, start, samples, key), data_offset) in zip(tracks, data_offsets):
+            # default-base-is-moof
+            tfhd = Muxer.__full_box(b'tfhd', 0, 0x020000, self.track_ids[name].to_bytes(4, 'big'))
+            tfdt = Muxer.__full_box(b'tfdt', 1, 0, start.to_bytes(8, 'big'))
+            has_cto = any(sample[3] != 0 for sample in samples)
+            # data-offset, sample duration, size and flags, composition time offsets
+            flags = 0x000701 | (0x000800 if has_cto else 0)
+            entries = bytearray(struct.pack('>Ii', len(samples), data_offset))
+            for (duration, data, sample_flags, cto) in samples:
+                entries += struct.pack('>III', duration, len(data), sample_flags)
+                if has_cto:
+                    entries += struct.pack('>i', cto)
+            trun = Muxer.__full_box(b'trun', 1, flags, bytes(entries))
+            trafs.append(Muxer.__box(b'traf', tfhd + tfdt + trun))
+        mfhd = Muxer.__full_box(b'mfhd', 0, 0, self.sequence_number.to_bytes(4, 'big'))
+        return Muxer.__box(b'moof', mfhd + b''.join(trafs))
+
+    def __write_mfra(self):
+        tfras = []
+        for (name, track_id) in self.track_ids.items():
+            entries = self.index[name]
+            body = bytearray(struct.pack('>III', track_id, 0, len(entries)))
+            for (t, moof_offset, traf_number) in entries:
+                # trun and sample number 1, sizes of 1 byte
+                body += struct.pack('>QQBBB', t, moof_offset, traf_number, 1, 1)
+            tfras.append(Muxer.__full_box(b'tfra', 1, 0, bytes(body)))
+        mfra_len = 8 + sum(len(tfra) for tfra in tfras) + 16
+        mfro = Muxer.__full_box(b'mfro', 0, 0, mfra_len.to_bytes(4, 'big'))
+        self.__out(Muxer.__box(b'mfra', b''.join(tfras) + mfro))
+
+    def __out(self, data: bytes):
+        self.of.write(data)
+        self.pos = self.pos + len(data)
+
+    @staticmethod
+    def __parse_pes(buf, pos: int, pes_end: int) -> tuple:
+        """
+        Returns
+        ----------
+        tuple(pts, dts, payload)
+            pts and dts are None if not present.
+        """
+        flags = buf[pos + 7] >> 6
+        payload_start = pos + 9 + buf[pos + 8]
+        pts = None
+        dts = None
+        if flags & 0x02:
+            pts = Muxer.__decode_timestamp(buf, pos + 9)
+            if flags == 0x03:
+                dts = Muxer.__decode_timestamp(buf, pos + 14)
+        return (pts, dts, bytes(buf[min(payload_start, pes_end) : pes_end]))
+
+    @staticmethod
+    def __decode_timestamp(buf, pos: int) -> int:
+        return (
+            (((buf[pos] >> 1) & 0x07) << 30) |
+            (buf[pos + 1] << 22) |
+            ((buf[pos + 2] >> 1) << 15) |
+            (buf[pos + 3] << 7) |
+            (buf[pos + 4] >> 1)
+        )
+
+    @staticmethod
+    def __split_nal_units(data) -> list:
+        """
+        Split an Annex B byte stream into NAL units, without start codes.
+        """
+        nal_units = []
+        start = data.find(b'\x00\x00\x01')
+        while start != -1:
+            start = start + 3
+            end = data.find(b'\x00\x00\x01', start)
+            nal_end = len(data) if end == -1 else end
+            # Leading zero of a 4 byte start code, or trailing_zero_8bits
+            while (nal_end > start) and (data[nal_end - 1] == 0):
+                nal_end = nal_end - 1
+            if nal_end - start >= 2:
+                nal_units.append(data[start:nal_end])
+            start = end
+        return nal_units
+
+    @staticmethod
+    def __parse_hevc_sps(sps: bytes) -> dict:
+        """
+        Get fields of hvcC and the picture size from a SPS NAL unit.
+        """
+        # RBSP without emulation_prevention_three_byte
+        rbsp = bytearray()
+        zeros = 0
+        for byte in sps[2:]:
+            if (zeros >= 2) and (byte == 0x03):
+                zeros = 0
+                continue
+            rbsp.append(byte)
+            zeros = zeros + 1 if byte == 0 else 0
+        value = int.from_bytes(rbsp, 'big')
+        bit_len = len(rbsp) * 8
+        pos = 0
+
+        def bits(n: int) -> int:
+            nonlocal pos
+            pos = pos + n
+            if pos > bit_len:
+                common.error('SPS too short.')
+            return (value >> (bit_len - pos)) & ((1 << n) - 1)
+
+        def ue() -> int:
+            zeros = 0
+            while bits(1) == 0:
+                zeros = zeros + 1
+            return (1 << zeros) - 1 + bits(zeros)
+
+        info = {}
+        bits(4)
+        max_sub_layers_minus1 = bits(3)
+        info['temporal_id_nested'] = bits(1)
+        info['num_temporal_layers'] = max_sub_layers_minus1 + 1
+        # general profile_tier_level, 12 bytes
+        info['general_profile'] = bytes(bits(8) for i in range(12))
+        sub_layer_flags = [(bits(1), bits(1)) for i in range(max_sub_layers_minus1)]
+        if max_sub_layers_minus1 > 0:
+            bits(2 * (8 - max_sub_layers_minus1))
+        for (profile_present, level_present) in sub_layer_flags:
+            if profile_present:
+                bits(88)
+            if level_present:
+                bits(8)
+        ue()
+        info['chroma_format_idc'] = ue()
+        if info['chroma_format_idc'] == 3:
+            bits(1)
+        width = ue()
+        height = ue()
+        if bits(1):
+            # conformance_window
+            sub_width = 2 if info['chroma_format_idc'] in (1, 2) else 1
+            sub_height = 2 if info['chroma_format_idc'] == 1 else 1
+            (left, right, top, bottom) = (ue(), ue(), ue(), ue())
+            width = width - sub_width * (left + right)
+            height = height - sub_height * (top + bottom)
+        info['width'] = width
+        info['height'] = height
+        info['bit_depth_luma_minus8'] = ue()
+        info['bit_depth_chroma_minus8'] = ue()
+        return info
+
+    @staticmethod
+    def __box(box_type: bytes, body: bytes) -> bytes:
+        return (8 + len(body)).to_bytes(4, 'big') + box_type + body
+
+    @staticmethod
+    def __full_box(box_type: bytes, version: int, flags: int, body: bytes) -> bytes:
+        return Muxer.__box(box_type, bytes([version]) + flags.to_bytes(3, 'big') + body)
+
+    @staticmethod
+    def __matrix() -> bytes:
+        return struct.pack('>9I', 0x00010000, 0, 0, 0, 0x00010000, 0, 0, 0, 0x40000000)
+
+    @staticmethod
+    def __trak(track_id: int, handler: bytes, name: bytes, timescale: int, media_header: bytes, sample_entry: bytes, width: int = 0, height: int = 0) -> bytes:
+        # track_enabled, track_in_movie
+        tkhd = Muxer.__full_box(b'tkhd', 0, 0x000003, struct.pack(
+            '>III4xI8xhhH2x36sII',
+            0, 0, track_id, 0, 0, 0, 0x0100 if handler == b'soun' else 0, Muxer.__matrix(),
+            width << 16, height << 16
+        ))
+        # Language 'und'
+        mdhd = Muxer.__full_box(b'mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, timescale, 0, 0x55C4, 0))
+        hdlr = Muxer.__full_box(b'hdlr', 0, 0, bytes(4) + handler + bytes(12) + name + b'\x00')
+        dref = Muxer.__full_box(b'dref', 0, 0, (1).to_bytes(4, 'big') + Muxer.__full_box(b'url ', 0, 1, b''))
+        stbl = Muxer.__box(b'stbl', (
+            Muxer.__full_box(b'stsd', 0, 0, (1).to_bytes(4, 'big') + sample_entry) +
+            Muxer.__full_box(b'stts', 0, 0, bytes(4)) +
+            Muxer.__full_box(b'stsc', 0, 0, bytes(4)) +
+            Muxer.__full_box(b'stsz', 0, 0, bytes(8)) +
+            Muxer.__full_box(b'stco', 0, 0, bytes(4))
+        ))
+        minf = Muxer.__box(b'minf', media_header + Muxer.__box(b'dinf', dref) + stbl)
+        return Muxer.__box(b'trak', tkhd + Muxer.__box(b'mdia', mdhd + hdlr + minf))
+
+    @staticmethod
+    def __video_trak(track_id: int, info: dict, parameter_sets: dict) -> bytes:
+        profile = info['general_profile']
+        arrays = b''
+        for nal_type in (hevc_vps, hevc_sps, hevc_pps):
+            if nal_type in parameter_sets:
+                nal = parameter_sets[nal_type]
+                # array_completeness 0, parameter sets are also in band
+                arrays += bytes([nal_type]) + (1).to_bytes(2, 'big') + len(nal).to_bytes(2, 'big') + nal
+        hvcc = Muxer.__box(b'hvcC', (
+            bytes([1]) + profile[0:12] +
+            (0xF000).to_bytes(2, 'big') + bytes([0xFC, 0xFC | info['chroma_format_idc']]) +
+            bytes([0xF8 | info['bit_depth_luma_minus8'], 0xF8 | info['bit_depth_chroma_minus8']]) +
+            bytes(2) +
+            # lengthSizeMinusOne 3
+            bytes([(info['num_temporal_layers'] << 3) | (info['temporal_id_nested'] << 2) | 0x03]) +
+            bytes([sum(1 for nal_type in (hevc_vps, hevc_sps, hevc_pps) if nal_type in parameter_sets)]) +
+            arrays
+        ))
+        sample_entry = Muxer.__box(b'hev1', (
+            bytes(6) + (1).to_bytes(2, 'big') + bytes(16) +
+            struct.pack('>HHIIIH', info['width'], info['height'], 0x00480000, 0x00480000, 0, 1) +
+            bytes(32) + struct.pack('>Hh', 0x0018, -1) + hvcc
+        ))
+        vmhd = Muxer.__full_box(b'vmhd', 0, 1, bytes(8))
+        return Muxer.__trak(track_id, b'vide', b'Video', video_timescale, vmhd, sample_entry, info['width'], info['height'])
+
+    @staticmethod
+    def __audio_trak(track_id: int, audio_config: tuple) -> bytes:
+        (object_type, freq_index, channels) = audio_config
+        rate = aac_sample_rates[freq_index]
+        asc = ((object_type << 11) | (freq_index << 7) | (channels << 3)).to_bytes(2, 'big')
+        decoder_config = (
+            # MPEG-4 Audio, AudioStream
+            bytes([0x40, 0x15]) + bytes(3) + bytes(8) +
+            Muxer.__descriptor(0x05, asc)
+        )
+        es = bytes(3) + Muxer.__descriptor(0x04, decoder_config) + Muxer.__descriptor(0x06, b'\x02')
+        esds = Muxer.__full_box(b'esds', 0, 0, Muxer.__descriptor(0x03, es))
+        sample_entry = Muxer.__box(b'mp4a', (
+            bytes(6) + (1).to_bytes(2, 'big') + bytes(8) +
+            struct.pack('>HH4xI', channels, 16, rate << 16) + esds
+        ))
+        smhd = Muxer.__full_box(b'smhd', 0, 0, bytes(4))
+        return Muxer.__trak(track_id, b'soun', b'Audio', rate, smhd, sample_entry)
+
+    @staticmethod
+    def __meta_trak(track_id: int) -> bytes:
+        # TextMetaDataSampleEntry of JSON samples
+        sample_entry = Muxer.__box(b'mett', bytes(6) + (1).to_bytes(2, 'big') + b'\x00' + b'application/json\x00')
+        nmhd = Muxer.__full_box(b'nmhd', 0, 0, b'')
+        return Muxer.__trak(track_id, b'meta', b'Telemetry', meta_timescale, nmhd, sample_entry)
+
+    @staticmethod
+    def __descriptor(tag: int, body: bytes) -> bytes:
+        if len(body) >= 0x80:
+            common.error('Descriptor too long.')
+        return bytes([tag, len(body)]) + body
+
+#===========================================
+
+def add_gps_track(muxer: Muxer, gps_track):
+    """
+    Add GPS points of the segment being fed to the telemetry track, as
+    JSON samples. Points before the segment start are skipped.
+    """
+    for point in gps_track:
+        if (muxer.segment_time != None) and (point['time'] >= muxer.segment_time):
+            muxer.add_metadata(point['time'], json.dumps(dict(point), separators = (',', ':')).encode())
@@ -1,7 +1,10 @@
+import os
 from datetime import datetime
 
 import common
 import geoid
+import pipeline_stats
+import telemetry_columns
 
 # Whether to use a single uniformed geoid height to calc elev
 use_uniform_geoid_height = False
@@ -10,7 +13,7 @@ geojson_indent = 2
 
 #===========================================
 
-def set_geoid_height_pyproj(telemetries: list):
+def set_geoid_height_pyproj(telemetries: list, stats: pipeline_stats.Stats = None):
     """
     Use pyproj to calculate geoid height in the first point in telemetry.
 
@@ -18,13 +21,16 @@ def set_geoid_height_pyproj(telemetries: list):
     ----------
     telemetries: list
         Telemetries get from parse_video.parse_videos(). See README.md
+    stats: pipeline_stats.Stats
+        Time the transform in stage 'geoid'. Optional.
 
     Returns
     ----------
     Nothing
     """
     # Use first point in first track segment to determine geoid height
-    geoid.set_geoid_height(
+    __geoid_transform(
+        stats, geoid.set_geoid_height,
         telemetries[0]['telemetry']['gps_info']['gps_track'][0]['lat'] / 360000,
         telemetries[0]['telemetry']['gps_info']['gps_track'][0]['lon'] / 360000
     )
@@ -48,7 +54,7 @@ def set_geoid_height(geoid_height: float):
     # Use first point in first track segment to determine geoid height
     geoid.geoid_height = geoid_height
 
-def __get_point_info(point: dict) -> tuple:
+def __get_point_info(point: dict, stats: pipeline_stats.Stats = None) -> tuple:
     """
     Convert units
 
@@ -56,6 +62,8 @@ def __get_point_info(point: dict) -> tuple:
     ----------
     point: dict
         parse_video.parse_seg()['gps_info']['gps_track'][]
+    stats: pipeline_stats.Stats
+        Optional.
 
     Returns
     ----------
@@ -74,18 +82,64 @@ def __get_point_info(point: dict) -> tuple:
         elev = h - geoid.geoid_height
         geoid_h = geoid.geoid_height
     else:
-        elev = geoid.get_elev(
-            lat, lon, h
+        elev = __geoid_transform(
+            stats, geoid.get_elev, lat, lon, h
         )
         geoid_h = h - elev
     speed = point['speed'] / 3.6 # km/h to m/s
     heading = point['heading']
     return (t, lat, lon, h, elev, geoid_h, speed, heading)
 
+def __geoid_transform(stats: pipeline_stats.Stats, transform, *args):
+    """
+    transform(*args), timed in stage 'geoid' and counted as
+    'geoid_transforms' by the number of points when stats is not None.
+    """
+    if stats == None:
+        return transform(*args)
+    with stats.stage('geoid'):
+        stats.add('geoid_transforms', len(args[0]) if hasattr(args[0], '__len__') else 1)
+        return transform(*args)
+
+def __get_track_columns(gps_track, point_num: int) -> tuple:
+    """
+    Get time, latitude, longtitude and height of the first point_num points
+    as lists.
+
+    Parameters
+    ----------
+    gps_track: list or telemetry_columns.GpsTrack
+        parse_video.parse_seg()['gps_info']['gps_track']
+
+    Returns
+    ----------
+    Tuple(time (list), latitude (d), longtitude (d), ellipsoidal height (m))
+    """
+    if isinstance(gps_track, telemetry_columns.GpsTrack):
+        # Read the columns, no dict for each point
+        return (
+            gps_track.columns['time'][:point_num].tolist(),
+            [v / 360000 for v in gps_track.columns['lat'][:point_num]],
+            [v / 360000 for v in gps_track.columns['lon'][:point_num]],
+            [v / 100 for v in gps_track.columns['height'][:point_num]]
+        )
+    timestamp = [None] * point_num
+    lat = [0] * point_num
+    lon = [0] * point_num
+    height = [0] * point_num
+    for i in range(point_num):
+        point = gps_track[i]
+        timestamp[i] = point['time']
+        lat[i] = point['lat'] / 360000
+        lon[i] = point['lon'] / 360000
+        height[i] = point['height'] / 100
+    return (timestamp, lat, lon, height)
+
 def export_geojson(
     geojson_file_path: str, telemetries: list,
     include_height: bool = True,
-    use_amsl_height: bool = True
+    use_amsl_height: bool = True,
+    stats: pipeline_stats.Stats = None
 ):
     """
     Export GPS data as GeoJSON file.
@@ -98,19 +152,29 @@ def export_geojson(
         True to create a 3D GPS track.
     use_amsl_height: bool
         Use above mean sea level height instead of GPS ellipsoidal height.
+    stats: pipeline_stats.Stats
+        Time the export in stage 'export_geojson'. Optional.
 
     Returns
     ----------
     Nothing
     """
 
+    with pipeline_stats.stage(stats, 'export_geojson'):
+        __export_geojson(geojson_file_path, telemetries, include_height, use_amsl_height, stats)
+
+def __export_geojson(
+    geojson_file_path: str, telemetries: list,
+    include_height: bool, use_amsl_height: bool,
+    stats: pipeline_stats.Stats
+):
     import json
 
     tracks = []
     for telemetry in telemetries:
         track = []
         for point in telemetry['telemetry']['gps_info']['gps_track']:
-            (t, lat, lon, h, elev, geoid_h, speed, heading) = __get_point_info(point)
+            (t, lat, lon, h, elev, geoid_h, speed, heading) = __get_point_info(point, stats)
             height = elev if use_amsl_height else h
             if include_height:
                 track.append([lon, lat, height])
@@ -123,9 +187,9 @@ def export_geojson(
     geojson['coordinates'] = tracks
 
     with open(geojson_file_path, 'w+') as f:
-        json.dump(geojson, f, indent = geojson_indent)
+        json.dump(geojson, pipeline_stats.wrap_file(f, stats), indent = geojson_indent)
 
-def export_gpx(gpx_file_path: str, telemetries: list):
+def export_gpx(gpx_file_path: str, telemetries: list, stats: pipeline_stats.Stats = None):
     """
     Export GPS data as GPX file. GPX file version is '1.0'.
 
@@ -133,12 +197,18 @@ def export_gpx(gpx_file_path: str, telemetries: list):
     ----------
     telemetries: list
         Result got from garse_video.parse_videos()
+    stats: pipeline_stats.Stats
+        Time the export in stage 'export_gpx'. Optional.
 
     Returns
     ----------
     Nothing
     """
 
+    with pipeline_stats.stage(stats, 'export_gpx'):
+        __export_gpx(gpx_file_path, telemetries, stats)
+
+def __export_gpx(gpx_file_path: str, telemetries: list, stats: pipeline_stats.Stats):
     try:
         import gpxpy.gpx
     except ImportError:
@@ -163,7 +233,7 @@ def export_gpx(gpx_file_path: str, telemetries: list):
                 gpx_wpt.elevation,
                 gpx_wpt.geoid_height,
                 speed, heading
-            ) = __get_point_info(point)
+            ) = __get_point_info(point, stats)
             desc_s = gpx_wpt.time.strftime('%Y-%m-%d %H:%M:%S UTC%z')
             gpx_wpt.description = 'Parking start at ' +  desc_s
             parking_no = parking_no + 1
@@ -185,7 +255,7 @@ def export_gpx(gpx_file_path: str, telemetries: list):
                     gpx_point.geoid_height,
                     gpx_point.speed,
                     gpx_point.course
-                ) = __get_point_info(point)
+                ) = __get_point_info(point, stats)
                 gpx_points.append(gpx_point)
             gpx_segment.points = gpx_points
             desc_s = gpx_segment.points[0].time.strftime('%Y-%m-%d %H:%M:%S UTC%z')
@@ -196,7 +266,7 @@ def export_gpx(gpx_file_path: str, telemetries: list):
             track_no = track_no + 1
 
     with open(gpx_file_path, 'w+') as f:
-        f.write(gpx.to_xml(version = '1.0'))
+        pipeline_stats.wrap_file(f, stats).write(gpx.to_xml(version = '1.0'))
 
 def __mov_avg_filter(x, window: int):
 
@@ -237,7 +307,8 @@ def export_kml(
     export_tour: bool = True,
     interpolate_track_points: bool = False,
     interpolate_points_per_gap: int = 3,
-    export_elevation: bool = True
+    export_elevation: bool = True,
+    stats: pipeline_stats.Stats = None
 ):
     """
     Export GPS data as KML file. KML version is '2.2'.
@@ -255,12 +326,28 @@ def export_kml(
         Number of extra inserted points between two previous track points.
     export_elevation: bool
         Include elevation in track coordinates.
+    stats: pipeline_stats.Stats
+        Time the export in stage 'export_kml'. Optional.
 
     Returns
     ----------
     Nothing
     """
 
+    with pipeline_stats.stage(stats, 'export_kml'):
+        __export_kml(
+            kml_file_path, telemetries, export_tour,
+            interpolate_track_points, interpolate_points_per_gap, export_elevation, stats
+        )
+
+def __export_kml(
+    kml_file_path: str, telemetries: list,
+    export_tour: bool,
+    interpolate_track_points: bool,
+    interpolate_points_per_gap: int,
+    export_elevation: bool,
+    stats: pipeline_stats.Stats
+):
     try:
         import simplekml
         import numpy as np
@@ -301,25 +388,21 @@ def export_kml(
         telemetry = telemetry['telemetry']
         gps_info = telemetry['gps_info']
         gps_data_num = gps_info['gps_data_num']
-        timestamp = [None] * gps_data_num
         time_obj = [None] * gps_data_num
-        lat = [0] * gps_data_num
-        lon = [0] * gps_data_num
-        height = [0] * gps_data_num
-        for i in range(gps_data_num):
-            point = gps_info['gps_track'][i]
-            if export_tour or interpolate_track_points:
-                timestamp[i] = point['time']
-                lat[i] = point['lat'] / 360000
-                lon[i] = point['lon'] / 360000
-                height[i] = point['height'] / 100
-            else:
+        if export_tour or interpolate_track_points:
+            (timestamp, lat, lon, height) = __get_track_columns(gps_info['gps_track'], gps_data_num)
+        else:
+            lat = [0] * gps_data_num
+            lon = [0] * gps_data_num
+            height = [0] * gps_data_num
+            for i in range(gps_data_num):
+                point = gps_info['gps_track'][i]
                 (
                     time_obj[i],
                     lat[i], lon[i],
                     h, height[i], geoid_h,
                     speed, heading
-                ) = __get_point_info(point)
+                ) = __get_point_info(point, stats)
         # interpolate GPS track points if needed
         if export_tour or interpolate_track_points:
             point_num = len(timestamp)
@@ -330,7 +413,7 @@ def export_kml(
             z = np.empty(point_num)
             for i in range(point_num):
                 t[i] = timestamp[i]
-            (x, y, z) = geoid.t_latlon_to_xyz(lat, lon, height)
+            (x, y, z) = __geoid_transform(stats, geoid.t_latlon_to_xyz, lat, lon, height)
             if interpolate_track_points:
                 # interpolate using CubicSpline
                 # fit
@@ -351,7 +434,7 @@ def export_kml(
                 look_x = __mov_avg_filter(x, filter_window_size)
                 look_y = __mov_avg_filter(y, filter_window_size)
                 look_z = __mov_avg_filter(z, filter_window_size)
-                (look_lat, look_lon, look_h) = geoid.t_xyz_to_latlonelev(look_x, look_y, look_z)
+                (look_lat, look_lon, look_h) = __geoid_transform(stats, geoid.t_xyz_to_latlonelev, look_x, look_y, look_z)
                 # calculate speed for later use. m/s
                 spd_x = np.diff(x) * points_per_sec
                 spd_y = np.diff(y) * points_per_sec
@@ -376,7 +459,7 @@ def export_kml(
             height = [0] * point_num
             for i in range(point_num):
                 time_obj[i] = datetime.fromtimestamp(t[i], tz = common.local_timezone)
-            (lat, lon, height) = geoid.t_xyz_to_latlonelev(x, y, z)
+            (lat, lon, height) = __geoid_transform(stats, geoid.t_xyz_to_latlonelev, x, y, z)
             gps_data_num = point_num
             if export_tour:
                 # generate heading for tour lookat
@@ -389,7 +472,7 @@ def export_kml(
                 look_x_pad = np.linspace(look_x[0] - look_dx * look_padding_points, look_x[0] - look_dx, look_padding_points)
                 look_y_pad = np.linspace(look_y[0] - look_dy * look_padding_points, look_y[0] - look_dy, look_padding_points)
                 look_z_pad = np.linspace(look_z[0] - look_dz * look_padding_points, look_z[0] - look_dz, look_padding_points)
-                (look_lat_pad, look_lon_pad, look_h_pad) = geoid.t_xyz_to_latlonelev(look_x_pad, look_y_pad, look_z_pad)
+                (look_lat_pad, look_lon_pad, look_h_pad) = __geoid_transform(stats, geoid.t_xyz_to_latlonelev, look_x_pad, look_y_pad, look_z_pad)
                 look_heading_lat = np.concatenate((look_lat_pad, look_lat[:-look_padding_points]))
                 look_heading_lon = np.concatenate((look_lon_pad, look_lon[:-look_padding_points]))
                 look_heading = geoid.calc_heading(look_heading_lat, look_heading_lon, lat, lon, tour_heading_calc_threshold)
@@ -495,3 +578,5 @@ def export_kml(
         track_no = track_no + 1
 
     kml.save(kml_file_path)
+    if stats != None:
+        stats.add_write(os.path.getsize(kml_file_path))
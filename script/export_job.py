@@ -0,0 +1,238 @@
+# Resumable export of videos, checkpointed after each segment
+
+import os
+import json
+import time
+from datetime import datetime
+
+import common
+import parse_index
+import parse_video
+
+# Checkpoint of a job, in the output folder
+checkpoint_name = 'export_job.json'
+
+# Suffix of an output being written
+temp_suffix = '.tmp'
+
+#===========================================
+
+def plan(
+        record_file_index: dict,
+        folder: str,
+        start_time: int = -1, end_time: int = -1,
+        export_video_names: list = None
+    ) -> dict:
+    """
+    Plan the output files of all consecutive videos in a time range.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    folder: str
+        Output folder.
+    start_time, end_time: int
+        Same as parse_index.search()
+    export_video_names: list
+        Name of each output file. Optional. Default YYYYMMDDhhmmss.mp4,
+        the start time of each video in common.local_timezone.
+
+    Returns
+    ----------
+    job: dict
+        See README.md
+    """
+
+    videos = parse_index.search(record_file_index, start_time, end_time)
+    if (export_video_names != None) and (len(export_video_names) != len(videos)):
+        common.error('Number of export_video_names does not match the number of videos.')
+    job = {}
+    job['folder'] = folder
+    job['outputs'] = []
+    for (i, video) in enumerate(videos):
+        output = {}
+        if export_video_names != None:
+            output['file_name'] = export_video_names[i]
+        else:
+            start = __get_seg_info(record_file_index, video[0])['start_time'] + video[0]['start']
+            output['file_name'] = datetime.fromtimestamp(start, common.local_timezone).strftime('%Y%m%d%H%M%S.mp4')
+        output['segments'] = []
+        for segment in video:
+            seg_info = __get_seg_info(record_file_index, segment)
+            planned = dict(segment)
+            # Tells if the segment was overwritten since planning
+            planned['start_time'] = seg_info['start_time']
+            planned['start_pos'] = seg_info['start_pos']
+            planned['bytes'] = __estimate_bytes(seg_info, segment['start'], segment['end'])
+            output['segments'].append(planned)
+        output['bytes'] = sum(planned['bytes'] for planned in output['segments'])
+        job['outputs'].append(output)
+    job['bytes'] = sum(output['bytes'] for output in job['outputs'])
+    return job
+
+def run(
+        sd_dir_path: str,
+        record_file_index: dict,
+        job: dict,
+        parse_options: dict = None,
+        progress_callback = None
+    ) -> dict:
+    """
+    Export the videos of a job from plan(), resuming from its checkpoint.
+
+    Each output is written to a temporary file and renamed when all its
+    segments are done. The checkpoint in the output folder records the
+    finished segments and the length of the temporary file after them,
+    so a stopped job continues after the last finished segment.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    job: dict
+        From plan(). A checkpoint in job['folder'] of another plan is an
+        error.
+    parse_options: dict
+        'use_mmap', 'pipeline', 'pipeline_memory' and 'stats' are passed
+        to parse_video.parse_seg().
+        Optional.
+    progress_callback: function
+        progress_callback(progress), called after each segment. See
+        README.md. Optional.
+
+    Returns
+    ----------
+    checkpoint: dict
+        Final checkpoint. See README.md
+    """
+
+    folder = job['folder']
+    os.makedirs(folder, exist_ok = True)
+    checkpoint = __load_checkpoint(folder, job)
+
+    parse_seg_options = {}
+    parse_seg_options['export_video'] = True
+    parse_seg_options['export_thumbnail'] = False
+    parse_seg_options['gps_track'] = False
+    parse_seg_options['acce'] = False
+    parse_seg_options['image_label'] = False
+    if parse_options != None:
+        for key in ('use_mmap', 'pipeline', 'pipeline_memory', 'stats'):
+            if key in parse_options:
+                parse_seg_options[key] = parse_options[key]
+
+    run_start = time.perf_counter()
+    run_bytes = 0
+    for (i, output) in enumerate(job['outputs']):
+        state = checkpoint['outputs'][i]
+        file_path = os.path.join(folder, output['file_name'])
+        temp_path = file_path + temp_suffix
+        if state['done']:
+            if os.path.isfile(temp_path):
+                # Stopped before renaming
+                os.replace(temp_path, file_path)
+            continue
+        if (not os.path.isfile(temp_path)) or (os.path.getsize(temp_path) < state['bytes_written']):
+            # Temporary file lost, start the output again
+            checkpoint['bytes_done'] = checkpoint['bytes_done'] - sum(
+                segment['bytes'] for segment in output['segments'][:state['segs_done']]
+            )
+            state['segs_done'] = 0
+            state['bytes_written'] = 0
+        # Drop what was written after the last finished segment
+        with open(temp_path, 'ab') as f:
+            f.truncate(state['bytes_written'])
+        parse_seg_options['export_video_path'] = temp_path
+        parse_seg_options['export_video_adding'] = True
+        for seg_i in range(state['segs_done'], len(output['segments'])):
+            segment = output['segments'][seg_i]
+            parse_video.parse_seg(
+                sd_dir_path, segment['file_no'], segment['seg_no'], record_file_index,
+                parse_seg_options, segment['start'], segment['end']
+            )
+            # On the disk before the checkpoint says so
+            with open(temp_path, 'rb+') as f:
+                os.fsync(f.fileno())
+                state['bytes_written'] = os.fstat(f.fileno()).st_size
+            state['segs_done'] = seg_i + 1
+            state['done'] = (seg_i + 1 == len(output['segments']))
+            checkpoint['bytes_done'] = checkpoint['bytes_done'] + segment['bytes']
+            __save_checkpoint(folder, checkpoint)
+            if state['done']:
+                os.replace(temp_path, file_path)
+
+            run_bytes = run_bytes + segment['bytes']
+            if progress_callback != None:
+                progress_callback(__get_progress(job, checkpoint, i, seg_i, run_start, run_bytes))
+    return checkpoint
+
+def export(
+        sd_dir_path: str,
+        record_file_index: dict,
+        folder: str,
+        start_time: int = -1, end_time: int = -1,
+        parse_options: dict = None,
+        progress_callback = None
+    ) -> dict:
+    """
+    plan() and run() in one call. Call again with the same arguments to
+    resume a stopped export.
+    """
+    job = plan(record_file_index, folder, start_time, end_time)
+    return run(sd_dir_path, record_file_index, job, parse_options, progress_callback)
+
+def __get_seg_info(record_file_index: dict, segment: dict) -> dict:
+    return record_file_index['record_file_infos'][segment['file_no']]['seg_infos'][segment['seg_no']]
+
+def __estimate_bytes(seg_info: dict, start: int, end: int) -> int:
+    # Seg 5 bytes in proportion to the seconds exported
+    seg_len_sec = seg_info['end_time'] - seg_info['start_time'] + 1
+    seg5_bytes = seg_info['end_pos'] - seg_info['start_pos'] - 0x40000
+    if seg_len_sec <= 0:
+        return seg5_bytes
+    return seg5_bytes * min(end - start + 1, seg_len_sec) // seg_len_sec
+
+def __load_checkpoint(folder: str, job: dict) -> dict:
+    """
+    Load the checkpoint of job in folder, or a new one if there is none.
+    """
+    checkpoint_path = os.path.join(folder, checkpoint_name)
+    if os.path.isfile(checkpoint_path):
+        with open(checkpoint_path, 'r') as f:
+            checkpoint = json.load(f)
+        if checkpoint['job'] != job:
+            common.error('Folder has a checkpoint of another export job, or the card changed.')
+        return checkpoint
+    checkpoint = {}
+    checkpoint['job'] = job
+    checkpoint['bytes_done'] = 0
+    checkpoint['outputs'] = [
+        {'segs_done': 0, 'bytes_written': 0, 'done': False} for output in job['outputs']
+    ]
+    return checkpoint
+
+def __save_checkpoint(folder: str, checkpoint: dict):
+    checkpoint_path = os.path.join(folder, checkpoint_name)
+    temp_path = checkpoint_path + temp_suffix
+    with open(temp_path, 'w') as f:
+        json.dump(checkpoint, f, indent = 2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, checkpoint_path)
+
+def __get_progress(job: dict, checkpoint: dict, output_no: int, seg_no: int, run_start: float, run_bytes: int) -> dict:
+    progress = {}
+    progress['output_no'] = output_no
+    progress['file_name'] = job['outputs'][output_no]['file_name']
+    progress['seg_no'] = seg_no
+    progress['bytes_done'] = checkpoint['bytes_done']
+    progress['bytes'] = job['bytes']
+    elapsed = time.perf_counter() - run_start
+    # Throughput of this run, segments done before resuming are left out
+    progress['bytes_per_sec'] = run_bytes / elapsed if elapsed > 0 else 0.0
+    if progress['bytes_per_sec'] > 0:
+        progress['eta_sec'] = (job['bytes'] - checkpoint['bytes_done']) / progress['bytes_per_sec']
+    else:
+        progress['eta_sec'] = None
+    return progress
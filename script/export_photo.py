@@ -0,0 +1,185 @@
+# Bulk export of photos in the photo hivXXXXX.mp4 file
+
+import os
+import json
+import collections
+import concurrent.futures
+from datetime import datetime
+
+import common
+import parse_photo
+
+# Photos closer than this are read together, with the padding between them
+read_gap = 0x100000
+
+# Largest single read
+read_max = 0x2000000
+
+manifest_name = 'manifest.json'
+
+#===========================================
+
+def find_photos(
+        sd_dir_path: str,
+        record_file_index: dict,
+        start_time: int = None, end_time: int = None
+    ) -> list:
+    """
+    Find photos taken in a time range.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    start_time, end_time: int
+        Time range, both included. None means no limit.
+
+    Returns
+    ----------
+    photo_infos: list
+        parse_photo.parse_seg() results with 'file_no' and 'seg_no',
+        sorted by time.
+    """
+
+    photo_infos = []
+    for file_info in record_file_index['record_file_infos']:
+        if file_info['file_type'] != 'photo':
+            continue
+        file_no = file_info['file_no']
+        for seg_info in file_info['seg_infos']:
+            # Only read tables of segments in the range
+            if (start_time != None) and (seg_info['end_time'] < start_time):
+                continue
+            if (end_time != None) and (seg_info['start_time'] > end_time):
+                continue
+            seg_no = seg_info['seg_no']
+            for photo_info in parse_photo.parse_seg(sd_dir_path, file_no, seg_no, record_file_index):
+                if (start_time != None) and (photo_info['time'] < start_time):
+                    continue
+                if (end_time != None) and (photo_info['time'] > end_time):
+                    continue
+                photo_infos.append(dict(photo_info, file_no = file_no, seg_no = seg_no))
+    photo_infos.sort(key = lambda x: x['time'])
+    return photo_infos
+
+def export_photos(
+        sd_dir_path: str,
+        record_file_index: dict,
+        folder: str,
+        start_time: int = None, end_time: int = None,
+        export_thumbnail: bool = False,
+        workers: int = 4
+    ) -> list:
+    """
+    Export photos taken in a time range as JPEG files, with a manifest.
+
+    Photos are read in file offset order, and close photos are read
+    together. Files are written by a thread pool while later photos are
+    being read.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    folder: str
+        Output folder. Created if not exists.
+    start_time, end_time: int
+        Time range, both included. None means the whole card.
+    export_thumbnail: bool
+        Also export the thumbnail of each photo.
+    workers: int
+        Number of threads writing files.
+
+    Returns
+    ----------
+    manifest: list
+        Also saved as manifest.json in folder. See README.md
+    """
+
+    os.makedirs(folder, exist_ok = True)
+    photo_infos = find_photos(sd_dir_path, record_file_index, start_time, end_time)
+    manifest = []
+    for photo_info in photo_infos:
+        entry = dict(photo_info)
+        file_name = '%s_%05d_%03d_%03d' % (
+            datetime.fromtimestamp(photo_info['time'], common.local_timezone).strftime('%Y%m%d%H%M%S'),
+            photo_info['file_no'], photo_info['seg_no'], photo_info['photo_no']
+        )
+        entry['photo_file'] = file_name + '.jpg'
+        if export_thumbnail:
+            entry['thumb_file'] = file_name + '_thumb.jpg'
+        manifest.append(entry)
+
+    # Read each file from start to end
+    by_file = {}
+    for entry in manifest:
+        by_file.setdefault(entry['file_no'], []).append(entry)
+    with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as pool:
+        # Buffers being written, read ahead is limited to read_max
+        pending = collections.deque()
+        pending_len = 0
+        for file_no in sorted(by_file):
+            entries = sorted(by_file[file_no], key = lambda x: x['photo_pos'])
+            video_file_path = os.path.join(sd_dir_path, 'hiv%05d.mp4' % file_no)
+            with open(video_file_path, 'rb') as f:
+                for (read_start, buf, run) in __read_runs(f, entries):
+                    while (len(pending) != 0) and (pending_len + len(buf) > read_max):
+                        (buf_len, futures) = pending.popleft()
+                        for future in futures:
+                            future.result()
+                        pending_len = pending_len - buf_len
+                    mv = memoryview(buf)
+                    futures = []
+                    for entry in run:
+                        pos = entry['photo_pos'] - read_start
+                        photo_end = pos + entry['photo_len']
+                        futures.append(pool.submit(
+                            __write_file, os.path.join(folder, entry['photo_file']), mv[pos:photo_end]
+                        ))
+                        if export_thumbnail:
+                            futures.append(pool.submit(
+                                __write_file, os.path.join(folder, entry['thumb_file']),
+                                mv[photo_end : photo_end + entry['thumb_len']]
+                            ))
+                    pending.append((len(buf), futures))
+                    pending_len = pending_len + len(buf)
+        for (buf_len, futures) in pending:
+            for future in futures:
+                future.result()
+
+    temp_path = os.path.join(folder, manifest_name + '.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent = 2)
+    os.replace(temp_path, os.path.join(folder, manifest_name))
+    return manifest
+
+def __read_runs(f, entries: list):
+    """
+    Read photos sorted by position, merging close ones into one read.
+
+    Yields
+    ----------
+    tuple(read_start, buf, run)
+        run is the entries in buf.
+    """
+    i = 0
+    while i < len(entries):
+        j = i + 1
+        read_start = entries[i]['photo_pos']
+        read_end = read_start + entries[i]['photo_len'] + entries[i]['thumb_len']
+        while j < len(entries):
+            next_end = entries[j]['photo_pos'] + entries[j]['photo_len'] + entries[j]['thumb_len']
+            if (entries[j]['photo_pos'] - read_end > read_gap) or (next_end - read_start > read_max):
+                break
+            read_end = next_end
+            j = j + 1
+        f.seek(read_start)
+        buf = f.read(read_end - read_start)
+        if len(buf) != read_end - read_start:
+            common.error('Photo data out of file.')
+        yield (read_start, buf, entries[i:j])
+        i = j
+
+def __write_file(file_path: str, data):
+    with open(file_path, 'wb') as f:
+        f.write(data)
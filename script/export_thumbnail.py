@@ -0,0 +1,161 @@
+# Batch export of video thumbnails in Seg 3, with contact sheets
+
+import os
+import io
+import json
+from datetime import datetime, timezone
+
+import common
+
+# Seg 3 is read with one read of this size, more is read for a larger thumbnail
+first_read = 0x8000
+
+manifest_name = 'manifest.json'
+
+# Contact sheet layout
+sheet_columns = 8
+tile_width = 320
+label_height = 16
+
+#===========================================
+
+def export_thumbnails(
+        sd_dir_path: str,
+        record_file_index: dict,
+        folder: str,
+        start_time: int = None, end_time: int = None,
+        contact_sheet: bool = False
+    ) -> list:
+    """
+    Export thumbnails of all video segments in a time range as JPEG
+    files, with a manifest. Only Seg 3 of each segment is read.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    folder: str
+        Output folder. Created if not exists.
+    start_time, end_time: int
+        Segments overlapping with the range, both included. None means
+        the whole card.
+    contact_sheet: bool
+        Also make a contact sheet of each day, with an index of tiles.
+        Module PIL (Pillow) is needed.
+
+    Returns
+    ----------
+    manifest: list
+        Also saved as manifest.json in folder. See README.md
+    """
+
+    if contact_sheet:
+        try:
+            import PIL
+        except ImportError:
+            common.error('Module PIL (Pillow) is needed for contact sheets.')
+    os.makedirs(folder, exist_ok = True)
+
+    # Read in file and offset order
+    segs = []
+    for file_info in record_file_index['record_file_infos']:
+        if file_info['file_type'] != 'video':
+            continue
+        for seg_info in file_info['seg_infos']:
+            if (start_time != None) and (seg_info['end_time'] < start_time):
+                continue
+            if (end_time != None) and (seg_info['start_time'] > end_time):
+                continue
+            segs.append((file_info['file_no'], seg_info))
+    segs.sort(key = lambda x: (x[0], x[1]['start_pos']))
+
+    manifest = []
+    thumbnails = {}
+    f = None
+    opened_file_no = None
+    try:
+        for (file_no, seg_info) in segs:
+            if file_no != opened_file_no:
+                if f != None:
+                    f.close()
+                f = open(os.path.join(sd_dir_path, 'hiv%05d.mp4' % file_no), 'rb')
+                opened_file_no = file_no
+            data = __read_thumbnail(f, seg_info['start_pos'] + 0x20000)
+            if len(data) == 0:
+                continue
+            entry = {}
+            entry['file_no'] = file_no
+            entry['seg_no'] = seg_info['seg_no']
+            entry['time'] = int(seg_info['start_time'])
+            entry['video_type'] = seg_info['video_type']
+            entry['thumb_file'] = '%s_%05d_%03d.jpg' % (
+                datetime.fromtimestamp(entry['time'], common.local_timezone).strftime('%Y%m%d%H%M%S'),
+                file_no, entry['seg_no']
+            )
+            with open(os.path.join(folder, entry['thumb_file']), 'wb') as of:
+                of.write(data)
+            if contact_sheet:
+                thumbnails[entry['thumb_file']] = data
+            manifest.append(entry)
+    finally:
+        if f != None:
+            f.close()
+    manifest.sort(key = lambda x: x['time'])
+
+    if contact_sheet:
+        days = {}
+        for entry in manifest:
+            days.setdefault(common.to_dashcam_time(entry['time']) // 86400, []).append(entry)
+        for day in sorted(days):
+            day_str = datetime.fromtimestamp(day * 86400, timezone.utc).strftime('%Y-%m-%d')
+            __make_contact_sheet(folder, day_str, days[day], thumbnails)
+
+    __save_json(os.path.join(folder, manifest_name), manifest)
+    return manifest
+
+def __read_thumbnail(f, seg3_pos: int) -> bytes:
+    # Seg 3 header and usually the whole thumbnail
+    f.seek(seg3_pos)
+    buf = f.read(first_read)
+    thumbnail_len = int.from_bytes(buf[0x1C:0x1E], 'little')
+    if 0x20 + thumbnail_len > len(buf):
+        buf = buf + f.read(0x20 + thumbnail_len - len(buf))
+    return buf[0x20 : 0x20 + thumbnail_len]
+
+def __make_contact_sheet(folder: str, day_str: str, entries: list, thumbnails: dict):
+    """
+    Tile thumbnails of a day in time order, each labeled with its time.
+    Saves contact_YYYY-MM-DD.jpg and contact_YYYY-MM-DD.json, the tile
+    index.
+    """
+    from PIL import Image, ImageDraw
+
+    images = [Image.open(io.BytesIO(thumbnails[entry['thumb_file']])) for entry in entries]
+    (width, height) = images[0].size
+    tile_height = int(tile_width * height / width)
+    rows = (len(entries) + sheet_columns - 1) // sheet_columns
+    columns = min(len(entries), sheet_columns)
+    sheet = Image.new('RGB', (columns * tile_width, rows * (tile_height + label_height)))
+    draw = ImageDraw.Draw(sheet)
+    tiles = []
+    for (i, (entry, image)) in enumerate(zip(entries, images)):
+        (row, column) = divmod(i, sheet_columns)
+        x = column * tile_width
+        y = row * (tile_height + label_height)
+        sheet.paste(image.convert('RGB').resize((tile_width, tile_height)), (x, y))
+        label = datetime.fromtimestamp(entry['time'], common.local_timezone).strftime('%H:%M:%S')
+        draw.text((x + 2, y + tile_height + 2), label, fill = (255, 255, 255))
+        tile = dict(entry)
+        tile['x'] = x
+        tile['y'] = y
+        tile['w'] = tile_width
+        tile['h'] = tile_height
+        tiles.append(tile)
+    sheet.save(os.path.join(folder, 'contact_%s.jpg' % day_str), quality = 85)
+    __save_json(os.path.join(folder, 'contact_%s.json' % day_str), tiles)
+
+def __save_json(file_path: str, obj):
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(obj, f, indent = 2)
+    os.replace(temp_path, file_path)
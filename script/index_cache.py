@@ -0,0 +1,238 @@
+# Persistent cache of parsed indexXX.bin
+
+import hashlib
+import os
+import pickle
+
+import common
+import parse_index
+
+# Bump when the cache content changes
+cache_version = 2
+
+# All copies of the index. index00.bin is usually the newest.
+index_file_names = ['index00.bin', 'index01.bin', 'index02.bin']
+
+def parse(sd_dir_path: str, cache_dir: str) -> dict:
+    """
+    Same as parse_index.parse(), but keep the result in a cache file.
+
+    The cache is valid while the index files have the same size and mtime,
+    and the chosen index file has the same content. When an index file
+    changed, only Seg 3 and Seg 4 records whose digest changed are parsed
+    again. When index00.bin, index01.bin and index02.bin disagree, the
+    newest copy that passes the checks of parse_index is used.
+
+    Parameters
+    ----------
+    sd_dir_path: str
+        SD card path or a folder containing index bin file.
+    cache_dir: str
+        Folder to keep cache files. Created if not exists.
+
+    Returns
+    ----------
+    record_file_index: dict
+        Same as parse_index.parse() returns.
+    """
+
+    if not os.path.isdir(sd_dir_path):
+        common.error('SD card folder doesn''t exist.')
+    os.makedirs(cache_dir, exist_ok = True)
+    cache_file_path = get_cache_path(sd_dir_path, cache_dir)
+    cache = __load_cache(cache_file_path)
+
+    stats = __stat_index_files(sd_dir_path)
+    if len(stats) == 0:
+        common.error('index00.bin, index01.bin or index02.bin not found in SD card folder.')
+
+    # Fast path: nothing changed since last time
+    if (cache != None) and (cache['stats'] == stats):
+        with open(cache['index_file_path'], 'rb') as index_file:
+            buf = index_file.read()
+        if hashlib.sha256(buf).hexdigest() == cache['sha256']:
+            return cache['record_file_index']
+
+    # Read all copies and try them from the newest one
+    copies = []
+    for index_file_name in stats:
+        index_file_path = os.path.join(sd_dir_path, index_file_name)
+        with open(index_file_path, 'rb') as index_file:
+            buf = index_file.read()
+        copies.append((index_file_path, buf))
+    copies.sort(key = lambda x: __get_copy_age(x[1], stats[os.path.basename(x[0])]), reverse = True)
+
+    record_file_index = None
+    for (index_file_path, buf) in copies:
+        # Broken or half written copy gives None, try an older one
+        record_file_index = __update(cache, buf)
+        if record_file_index != None:
+            break
+    if record_file_index == None:
+        common.error('No consistent index file found in SD card folder.')
+
+    cache = {}
+    cache['version'] = cache_version
+    cache['sd_dir_path'] = os.path.abspath(sd_dir_path)
+    cache['index_file_path'] = index_file_path
+    cache['stats'] = stats
+    cache['timezone'] = str(common.local_timezone)
+    cache['sha256'] = hashlib.sha256(buf).hexdigest()
+    cache['size'] = len(buf)
+    cache['header'] = parse_index.parse_header(buf)
+    cache['digests'] = __get_file_digests(buf, cache['header'])
+    cache['record_file_index'] = record_file_index
+    __save_cache(cache_file_path, cache)
+
+    return record_file_index
+
+def get_card_key(sd_dir_path: str) -> str:
+    """
+    Get the key of an SD card folder used in cache file names.
+    """
+    return hashlib.sha1(os.path.abspath(sd_dir_path).encode('utf-8')).hexdigest()[:16]
+
+def get_cache_path(sd_dir_path: str, cache_dir: str) -> str:
+    """
+    Get the cache file path of an SD card folder.
+    """
+    return os.path.join(cache_dir, 'index_%s.cache' % get_card_key(sd_dir_path))
+
+def __stat_index_files(sd_dir_path: str) -> dict:
+    stats = {}
+    for index_file_name in index_file_names:
+        index_file_path = os.path.join(sd_dir_path, index_file_name)
+        if os.path.isfile(index_file_path):
+            st = os.stat(index_file_path)
+            stats[index_file_name] = (st.st_size, st.st_mtime_ns)
+    return stats
+
+def __get_copy_age(buf, stat: tuple) -> tuple:
+    """
+    Sort key of index copies, larger is newer. Uses the end time of the
+    last file in Seg 1.2, then the growing counter in Seg 1.1, then mtime.
+    """
+    return (
+        int.from_bytes(buf[0x38:0x3C], 'little'),
+        int.from_bytes(buf[0x00:0x04], 'little'),
+        stat[1]
+    )
+
+def __load_cache(cache_file_path: str):
+    if not os.path.isfile(cache_file_path):
+        return None
+    try:
+        with open(cache_file_path, 'rb') as cache_file:
+            cache = pickle.load(cache_file)
+    except Exception:
+        return None
+    if (
+        (not isinstance(cache, dict)) or
+        (cache.get('version') != cache_version) or
+        (cache['timezone'] != str(common.local_timezone))
+    ):
+        return None
+    return cache
+
+def __save_cache(cache_file_path: str, cache: dict):
+    temp_file_path = cache_file_path + '.tmp'
+    with open(temp_file_path, 'wb') as cache_file:
+        pickle.dump(cache, cache_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file_path, cache_file_path)
+
+def __update(cache: dict, buf: bytes) -> dict:
+    """
+    Parse index file content, reusing records in the cache which are not
+    changed.
+
+    Returns
+    ----------
+    record_file_index: dict
+        None if the content is not consistent. Checked before parsing, so
+        that a broken copy is skipped without an error message.
+    """
+
+    header = parse_index.parse_header(buf)
+    record_file_num = header['record_file_num']
+    if len(buf) < 0x500 + record_file_num * (0x20 + 0x5000):
+        # Truncated
+        return None
+    if (
+        (cache == None) or
+        (cache['size'] != len(buf)) or
+        (cache['header']['record_file_num'] != record_file_num) or
+        (cache['header']['photo_file_no'] != header['photo_file_no']) or
+        (cache['header']['photo_seg_num'] != header['photo_seg_num'])
+    ):
+        for i in range(record_file_num):
+            if not __is_valid_file(buf, i, header):
+                return None
+        return parse_index.parse_buffer(buf)
+
+    # Find record files whose Seg 3 or Seg 4 records changed
+    digests = __get_file_digests(buf, header)
+    changed = set(i for i in range(record_file_num) if digests[i] != cache['digests'][i])
+    if cache['header']['last_file_no'] != header['last_file_no']:
+        # The file being written is checked differently
+        changed.add(cache['header']['last_file_no'])
+        changed.add(header['last_file_no'])
+    changed = set(i for i in changed if i < record_file_num)
+    for i in changed:
+        if not __is_valid_file(buf, i, header):
+            return None
+
+    # Don't touch the cache, this copy may turn out to be broken
+    record_file_infos = list(cache['record_file_index']['record_file_infos'])
+    for i in changed:
+        record_file_infos[i] = parse_index.parse_file_info(buf, i, header)
+    record_file_index = {}
+    record_file_index['record_file_num'] = record_file_num
+    record_file_index['record_file_infos'] = record_file_infos
+    return record_file_index
+
+def __get_file_digests(buf, header: dict) -> list:
+    """
+    Digest of the Seg 3 record and Seg 4 records of each record file.
+    Kept in the cache instead of the index content.
+    """
+    record_file_num = header['record_file_num']
+    mv = memoryview(buf)
+    seg4_pos = 0x500 + record_file_num * 0x20
+    digests = []
+    for i in range(record_file_num):
+        h = hashlib.sha1(mv[0x500 + i * 0x20 : 0x500 + (i + 1) * 0x20])
+        h.update(mv[seg4_pos + i * 0x5000 : seg4_pos + (i + 1) * 0x5000])
+        digests.append(h.digest())
+    return digests
+
+def __is_valid_file(buf, i: int, header: dict) -> bool:
+    """
+    Check the records of the i-th record file as parse_index does, without
+    printing an error.
+    """
+    photo_file_no = header['photo_file_no']
+    seg3_pos = 0x500 + i * 0x20
+    if int.from_bytes(buf[seg3_pos : seg3_pos + 0x04], 'little') != i:
+        return False
+    file_type = int.from_bytes(buf[seg3_pos + 0x10 : seg3_pos + 0x12], 'little')
+    if i != photo_file_no:
+        if (file_type == 2) and (i != header['last_file_no']):
+            return False
+        seg_num = int.from_bytes(buf[seg3_pos + 0x06 : seg3_pos + 0x08], 'little') + 1
+    else:
+        if file_type != 2:
+            return False
+        seg_num = header['photo_seg_num']
+    if seg_num > 0x100:
+        return False
+    seg4_pos = 0x500 + header['record_file_num'] * 0x20 + i * 0x5000
+    for seg_no in range(seg_num):
+        pos = seg4_pos + seg_no * 0x50
+        if i != photo_file_no:
+            if buf[pos] != 0:
+                return False
+            if int.from_bytes(buf[pos + 0x04 : pos + 0x08], 'little') not in (0x00, 0x13):
+                return False
+        elif buf[pos] != 2:
+            return False
+    return True
@@ -0,0 +1,259 @@
+# Read ahead and write behind threads, so that the SD card and the
+# export disk are busy at the same time
+
+import os
+import queue
+import threading
+import collections
+
+# Memory for buffers of a pipeline, by default
+default_memory = 0x4000000
+
+# Largest chunk read at once. Small enough to stay in the CPU cache until
+# it is written
+chunk_size_max = 0x100000
+
+# Smallest chunk, larger than any PES packet so that one spans 2 chunks at most
+chunk_size_min = 0x10000
+
+#===========================================
+
+class ReadAhead:
+    """
+    Reads a byte range of a file in chunks on a thread, ahead of the
+    caller walking it.
+
+    Chunks are read into a fixed ring of buffers, which is all the memory
+    used. A buffer is read into again only after release(), so reading
+    waits when the caller or the writer falls behind.
+    """
+
+    def __init__(self, file_path: str, start: int, end: int, memory: int = default_memory):
+        """
+        Parameters
+        ----------
+        file_path: str
+            File to read. Opened again by the thread.
+        start, end: int
+            Byte range to read. Reading stops early at the end of file.
+        memory: int
+            Bytes of all buffers. At least 4 chunks of chunk_size_min.
+        """
+        self.chunk_size = max(chunk_size_min, min(chunk_size_max, memory // 4, end - start))
+        self.free = queue.Queue()
+        # Buffers are made when needed, a short range needs few
+        self.buf_num = 0
+        self.buf_num_max = max(4, memory // self.chunk_size)
+        self.ready = queue.Queue()
+        # Chunks taken by the caller, as (pos, buf, mv), in file order
+        self.held = collections.deque()
+        # End of the first and the last held chunk
+        self.first_end = start
+        self.held_end = start
+        self.finished = False
+        self.error = None
+        self.thread = threading.Thread(target = self.__read, args = (file_path, start, end), daemon = True)
+        self.thread.start()
+
+    def __read(self, file_path: str, pos: int, end: int):
+        try:
+            with open(file_path, 'rb', buffering = 0) as f:
+                f.seek(pos)
+                while pos < end:
+                    if (self.buf_num < self.buf_num_max) and self.free.empty():
+                        self.buf_num = self.buf_num + 1
+                        buf = bytearray(self.chunk_size)
+                    else:
+                        buf = self.free.get()
+                    if buf == None:
+                        # Closed
+                        return
+                    mv = memoryview(buf)[:min(self.chunk_size, end - pos)]
+                    n = 0
+                    while n < len(mv):
+                        read_len = f.readinto(mv[n:])
+                        if not read_len:
+                            break
+                        n = n + read_len
+                    if n == 0:
+                        # End of file
+                        self.free.put(buf)
+                        return
+                    self.ready.put((pos, buf, mv[:n]))
+                    pos = pos + n
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.ready.put(None)
+
+    def __take(self) -> bool:
+        """
+        Wait for the next chunk. False if there is no more.
+        """
+        if self.finished:
+            return False
+        chunk = self.ready.get()
+        if chunk == None:
+            self.finished = True
+            if self.error != None:
+                raise self.error
+            return False
+        if len(self.held) == 0:
+            self.first_end = chunk[0] + len(chunk[2])
+        self.held.append(chunk)
+        self.held_end = chunk[0] + len(chunk[2])
+        return True
+
+    def get(self, pos: int, n: int):
+        """
+        Get bytes [pos, pos + n) of the file, waiting for them to be read.
+        pos should not be in a chunk already popped by pop_walked().
+
+        Returns
+        ----------
+        buf: memoryview or bytes
+            Shorter if the range passes the end of reading. Valid until its
+            chunk is released.
+        """
+        while (self.held_end < pos + n) and self.__take():
+            pass
+        if (len(self.held) != 0) and (pos + n <= self.first_end):
+            # Mostly in the first held chunk, where walking is
+            (chunk_pos, buf, mv) = self.held[0]
+            if pos >= chunk_pos:
+                return mv[pos - chunk_pos : pos - chunk_pos + n]
+        for (i, (chunk_pos, buf, mv)) in enumerate(self.held):
+            chunk_end = chunk_pos + len(mv)
+            if pos >= chunk_end:
+                continue
+            if pos + n <= chunk_end:
+                return mv[pos - chunk_pos : pos - chunk_pos + n]
+            # Spans chunks
+            parts = []
+            for (chunk_pos, buf, mv) in list(self.held)[i:]:
+                parts.append(mv[max(pos - chunk_pos, 0) : pos + n - chunk_pos])
+            return b''.join(parts)
+        return b''
+
+    def pop_walked(self, pos: int = None) -> list:
+        """
+        Pop held chunks ending at or before pos, all held and remaining
+        chunks if pos is None. Each popped chunk should be released.
+
+        Returns
+        ----------
+        chunks: list
+            List of (pos, buf, mv). mv is the data read into buf.
+        """
+        if pos == None:
+            while self.__take():
+                pass
+        chunks = []
+        while (len(self.held) != 0) and ((pos == None) or (self.held[0][0] + len(self.held[0][2]) <= pos)):
+            chunks.append(self.held.popleft())
+        if len(self.held) != 0:
+            self.first_end = self.held[0][0] + len(self.held[0][2])
+        else:
+            self.first_end = self.held_end
+        return chunks
+
+    def release(self, buf: bytearray):
+        """
+        Give a buffer back to be read into. Can be called from any thread.
+        """
+        self.free.put(buf)
+
+    def close(self):
+        """
+        Stop reading and wait for the thread.
+        """
+        self.free.put(None)
+        while not self.finished:
+            chunk = self.ready.get()
+            if chunk == None:
+                self.finished = True
+            else:
+                self.free.put(chunk[1])
+        self.thread.join()
+
+class WriteBehind:
+    """
+    Writes buffers to a file on a thread, in the order given.
+    """
+
+    def __init__(self, of, release = None):
+        """
+        Parameters
+        ----------
+        of: file
+            Destination, written at its current position. Not to be used
+            by others until close().
+        release: function
+            release(buf), called with the buffers given to free() after
+            all writes before them are done. Optional.
+        """
+        self.of = of
+        self.release = release
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target = self.__write, daemon = True)
+        self.thread.start()
+
+    def __write(self):
+        while True:
+            item = self.queue.get()
+            if item == None:
+                return
+            (parts, buf) = item
+            try:
+                if self.error == None:
+                    for data in parts:
+                        self.of.write(data)
+            except BaseException as e:
+                # Keep releasing buffers, so that reading is not stuck
+                self.error = e
+            if (buf != None) and (self.release != None):
+                self.release(buf)
+
+    def write(self, data):
+        """
+        Queue data to write. data should not change until written.
+        """
+        self.write_parts((data,))
+
+    def write_parts(self, parts, buf: bytearray = None):
+        """
+        Queue a sequence of data to write, in order, and release buf after.
+        One queue item for all, cheaper than a write() for each part.
+        """
+        if self.error != None:
+            raise self.error
+        self.queue.put((parts, buf))
+
+    def free(self, buf: bytearray):
+        """
+        Release buf after the writes queued before.
+        """
+        self.queue.put(((), buf))
+
+    def close(self):
+        """
+        Wait for all writes, and raise an error that happened in writing.
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.error != None:
+            raise self.error
+
+def will_need(file_path: str, start: int, length: int):
+    """
+    Ask the OS to start reading a range of a file into the page cache.
+    Does nothing where posix_fadvise() is not available.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, start, length, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
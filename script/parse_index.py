@@ -2,14 +2,46 @@
 
 import json
 import os
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 
 import common
+import pipeline_stats
+
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    # Numpy is not installed, parse record by record
+    has_numpy = False
+
+# Seg 3 record, one for each hivXXXXX.mp4 file
+seg3_dtype = np.dtype({
+    'names': ['file_no', 'video_write_complete', 'seg_num', 'file_type'],
+    'formats': ['<u4', '<u2', '<u2', '<u2'],
+    'offsets': [0x00, 0x04, 0x06, 0x10],
+    'itemsize': 0x20
+}) if has_numpy else None
+
+# Seg 4 record, one for each segment. 0x100 records for each file.
+seg4_dtype = np.dtype({
+    'names': [
+        'seg_type', 'video_type', 'start_time', 'end_time',
+        'start_pos', 'end_pos', 'video_fps'
+    ],
+    'formats': ['u1', '<u4', '<u4', '<u4', '<u4', '<u4', 'u1'],
+    'offsets': [0x00, 0x04, 0x08, 0x10, 0x28, 0x2C, 0x31],
+    'itemsize': 0x50
+}) if has_numpy else None
 
 # sd_dir_path = './misc'
 # dump_json_to_file = True
 # json_file_path = './misc/record_file_index.json'
 
-def parse(sd_dir_path: str, dump_json_to_file: bool = False, json_file_path: str = None) -> dict:
+def parse(
+        sd_dir_path: str, dump_json_to_file: bool = False, json_file_path: str = None,
+        stats: pipeline_stats.Stats = None
+    ) -> dict:
     """
     Parse index00.bin or index01.bin file and get segment infos of mp4 files.
 
@@ -21,6 +53,9 @@ def parse(sd_dir_path: str, dump_json_to_file: bool = False, json_file_path: str
         When is True, the result dict will be dumped to json_file_path.
     json_file_path: str
         Required when dump_json_to_file is True.
+    stats: pipeline_stats.Stats
+        Time reading and decoding in stages 'read_index' and
+        'decode_index'. Optional.
 
     Returns
     ----------
@@ -28,6 +63,25 @@ def parse(sd_dir_path: str, dump_json_to_file: bool = False, json_file_path: str
         A dictionary containing segment infos.
     """
 
+    index_file_path = __find_index_file(sd_dir_path)
+    with pipeline_stats.stage(stats, 'read_index'):
+        with open(index_file_path, 'rb') as index_file:
+            buf = pipeline_stats.wrap_file(index_file, stats).read()
+
+    with pipeline_stats.stage(stats, 'decode_index'):
+        record_file_index = parse_buffer(buf)
+
+    if dump_json_to_file:
+        if json_file_path != None:
+            with open(json_file_path, 'w+') as json_file:
+                json.dump(record_file_index, json_file, indent = 2)
+        else:
+            common.error('Output json file path is missing.')
+    
+    return record_file_index
+
+def __find_index_file(sd_dir_path: str) -> str:
+
     index_00_file_name = 'index00.bin'
     index_01_file_name = 'index01.bin'
 
@@ -40,103 +94,298 @@ def parse(sd_dir_path: str, dump_json_to_file: bool = False, json_file_path: str
         if (not os.path.isfile(index_file_path)):
             common.error('index00.bin or index01.bin not found in SD card folder.')
 
+    return index_file_path
+
+def parse_buffer(buf) -> dict:
+    """
+    Parse content of an index file.
+
+    Parameters
+    ----------
+    buf: bytes-like
+        Whole content of index00.bin, index01.bin or index02.bin.
+
+    Returns
+    ----------
+    record_file_index: dict
+        Same as parse() returns.
+    """
+
+    if has_numpy:
+        return table_to_index(__decode_table(buf))
+
+    header = parse_header(buf)
+
     record_file_index = {}
+    record_file_index['record_file_num'] = header['record_file_num']
+    record_file_infos = []
+    for i in range(header['record_file_num']):
+        record_file_infos.append(parse_file_info(buf, i, header))
+    record_file_index['record_file_infos'] = record_file_infos
 
-    with open(index_file_path, 'rb') as index_file:
+    return record_file_index
+
+def parse_header(buf) -> dict:
+    """
+    Parse Seg 1 of an index file.
 
-        # Seg 1 Overall info
-
-        # Seg 1.1 Total file number
-        buf = index_file.read(0x30)
-        record_file_num = int.from_bytes(buf[0x0C:0x0E], 'little')
-        record_file_index['record_file_num'] = record_file_num
-
-        # Seg 1.2 Last file
-        buf = index_file.read(0x30)
-        last_file_no = int.from_bytes(buf[0:2], 'little')
-
-        # Seg 1.3 Photo record file
-        buf = index_file.read(0x30)
-        photo_file_no = int.from_bytes(buf[0x00:0x02], 'little')
-        photo_seg_num = int.from_bytes(buf[0x02:0x04], 'little') + 1
-
-        #Seg 2 Unknown
-
-        # Seg 3 Each record file info
-        record_file_infos = []
-        index_file.seek(0x500)
-        for i in range(record_file_num):
-            record_file_info = {}
-            buf = index_file.read(0x20)
-            file_no = int.from_bytes(buf[0x00:0x04], 'little')
-            if file_no != i:
-                common.warning('Seg 3 file no out of order.')
-            record_file_info['file_no'] = file_no
-            if file_no != photo_file_no:
-                record_file_info['file_type'] = 'video'
-                record_file_info['video_write_complete'] = int.from_bytes(buf[0x04:0x06], 'little')
-                record_file_info['seg_num'] = int.from_bytes(buf[0x06:0x08], 'little') + 1
-                video_type = int.from_bytes(buf[0x10:0x12], 'little')
-                if video_type == 2:
-                    if file_no != last_file_no:
-                        common.error('Seg 3 0x10 - 0x12 error. Normal video should be 0x00 and 0x01.')
-                    else:
-                        video_type = 0
-                record_file_info['is_emergency_file'] = video_type
+    Returns
+    ----------
+    header: dict
+        'record_file_num', 'last_file_no', 'photo_file_no' and 'photo_seg_num'.
+    """
+
+    header = {}
+    # Seg 1.1 Total file number
+    header['record_file_num'] = int.from_bytes(buf[0x0C:0x0E], 'little')
+    # Seg 1.2 Last file
+    header['last_file_no'] = int.from_bytes(buf[0x30:0x32], 'little')
+    # Seg 1.3 Photo record file
+    header['photo_file_no'] = int.from_bytes(buf[0x60:0x62], 'little')
+    header['photo_seg_num'] = int.from_bytes(buf[0x62:0x64], 'little') + 1
+    return header
+
+def parse_file_info(buf, i: int, header: dict) -> dict:
+    """
+    Parse Seg 3 record and Seg 4 records of the i-th record file.
+
+    Parameters
+    ----------
+    buf: bytes-like
+        Whole content of an index file.
+    i: int
+        Record file index in Seg 3.
+    header: dict
+        Returned by parse_header().
+
+    Returns
+    ----------
+    record_file_info: dict
+        record_file_index['record_file_infos'][i]
+    """
+
+    record_file_num = header['record_file_num']
+    last_file_no = header['last_file_no']
+    photo_file_no = header['photo_file_no']
+
+    # Seg 3 Record file info
+    record_file_info = {}
+    seg3_pos = 0x500 + i * 0x20
+    buf2 = buf[seg3_pos : seg3_pos + 0x20]
+    file_no = int.from_bytes(buf2[0x00:0x04], 'little')
+    if file_no != i:
+        common.warning('Seg 3 file no out of order.')
+    record_file_info['file_no'] = file_no
+    if file_no != photo_file_no:
+        record_file_info['file_type'] = 'video'
+        record_file_info['video_write_complete'] = int.from_bytes(buf2[0x04:0x06], 'little')
+        record_file_info['seg_num'] = int.from_bytes(buf2[0x06:0x08], 'little') + 1
+        video_type = int.from_bytes(buf2[0x10:0x12], 'little')
+        if video_type == 2:
+            if file_no != last_file_no:
+                common.error('Seg 3 0x10 - 0x12 error. Normal video should be 0x00 and 0x01.')
             else:
-                record_file_info['file_type'] = 'photo'
-                photo_type = int.from_bytes(buf[0x10:0x12], 'little')
-                if photo_type != 2:
-                    common.error('Seg 3 0x10 - 0x12 error. Photo should be 0x02.')
-                record_file_info['seg_num'] = photo_seg_num
-
-            record_file_infos.append(record_file_info)
-        
-        # Seg 4 Each segment detailed info
-        for file_no in range(record_file_num):
-            seg_infos = []
-            buf = index_file.read(0x5000)
-            for seg_no in range(record_file_infos[file_no]['seg_num']):
-                buf2 = buf[seg_no * 0x50 : (seg_no + 1) * 0x50]
-                seg_info = {}
-                seg_info['seg_no'] = seg_no
-                seg_type = buf2[0]
-                if file_no != photo_file_no:
-                    if seg_type != 0:
-                        common.error('Seg 4 0x00 error. Video should be 0x00.')
-                    else:
-                        seg_info['seg_type'] = 'video'
-                else:
-                    if seg_type != 2:
-                        common.error('Seg 4 0x00 error. Photo should be 0x02.')
-                    else:
-                        seg_info['seg_type'] = 'photo'
-                seg_info['start_time'] = common.adjust_tz(int.from_bytes(buf2[0x08:0x0C], 'little'))
-                seg_info['end_time'] = common.adjust_tz(int.from_bytes(buf2[0x10:0x14], 'little'))
-                seg_info['start_pos'] = int.from_bytes(buf2[0x28:0x2C], 'little') - 0x40000
-                seg_info['end_pos'] = int.from_bytes(buf2[0x2C:0x30], 'little')
-                if file_no != photo_file_no:
-                    video_type = int.from_bytes(buf2[0x04:0x08], 'little')
-                    if video_type == 0x13:
-                        seg_info['video_type'] = 'normal'
-                    elif video_type == 0x00:
-                        seg_info['video_type'] = 'parking'
-                    else:
-                        common.error('Seg 4 0x04 - 0x08 error. Video should be either of 0x00 and 0x13.')
-                    seg_info['video_fps'] = buf2[0x31]
-                seg_infos.append(seg_info)
-            record_file_infos[file_no]['seg_infos'] = seg_infos
-        
-        # Done.
-        record_file_index['record_file_infos'] = record_file_infos
+                video_type = 0
+        record_file_info['is_emergency_file'] = video_type
+    else:
+        record_file_info['file_type'] = 'photo'
+        photo_type = int.from_bytes(buf2[0x10:0x12], 'little')
+        if photo_type != 2:
+            common.error('Seg 3 0x10 - 0x12 error. Photo should be 0x02.')
+        record_file_info['seg_num'] = header['photo_seg_num']
 
-    if dump_json_to_file:
-        if json_file_path != None:
-            with open(json_file_path, 'w+') as json_file:
-                json.dump(record_file_index, json_file, indent = 2)
+    # Seg 4 Segment detailed info
+    seg_infos = []
+    seg4_pos = 0x500 + record_file_num * 0x20 + i * 0x5000
+    for seg_no in range(record_file_info['seg_num']):
+        buf2 = buf[seg4_pos + seg_no * 0x50 : seg4_pos + (seg_no + 1) * 0x50]
+        seg_info = {}
+        seg_info['seg_no'] = seg_no
+        seg_type = buf2[0]
+        if i != photo_file_no:
+            if seg_type != 0:
+                common.error('Seg 4 0x00 error. Video should be 0x00.')
+            else:
+                seg_info['seg_type'] = 'video'
         else:
-            common.error('Output json file path is missing.')
-    
+            if seg_type != 2:
+                common.error('Seg 4 0x00 error. Photo should be 0x02.')
+            else:
+                seg_info['seg_type'] = 'photo'
+        seg_info['start_time'] = common.adjust_tz(int.from_bytes(buf2[0x08:0x0C], 'little'))
+        seg_info['end_time'] = common.adjust_tz(int.from_bytes(buf2[0x10:0x14], 'little'))
+        seg_info['start_pos'] = int.from_bytes(buf2[0x28:0x2C], 'little') - 0x40000
+        seg_info['end_pos'] = int.from_bytes(buf2[0x2C:0x30], 'little')
+        if i != photo_file_no:
+            video_type = int.from_bytes(buf2[0x04:0x08], 'little')
+            if video_type == 0x13:
+                seg_info['video_type'] = 'normal'
+            elif video_type == 0x00:
+                seg_info['video_type'] = 'parking'
+            else:
+                common.error('Seg 4 0x04 - 0x08 error. Video should be either of 0x00 and 0x13.')
+            seg_info['video_fps'] = buf2[0x31]
+        seg_infos.append(seg_info)
+    record_file_info['seg_infos'] = seg_infos
+
+    return record_file_info
+
+def parse_table(sd_dir_path: str, index_file_path: str = None) -> dict:
+    """
+    Read the whole index file in one go and decode it into a columnar
+    segment table. Numpy is required.
+
+    Parameters
+    ----------
+    sd_dir_path: str
+        SD card path or a folder containing index bin file.
+    index_file_path: str
+        Index file to parse. Default None: index00.bin or index01.bin
+        in sd_dir_path.
+
+    Returns
+    ----------
+    index_table: dict
+        See README.md. Use table_to_index() to get record_file_index.
+    """
+
+    if not has_numpy:
+        common.error('Module numpy is needed for index table.')
+    if index_file_path == None:
+        index_file_path = __find_index_file(sd_dir_path)
+
+    with open(index_file_path, 'rb') as index_file:
+        buf = index_file.read()
+
+    return __decode_table(buf)
+
+def __decode_table(buf) -> dict:
+
+    # Seg 1 Overall info
+    header = parse_header(buf)
+    record_file_num = header['record_file_num']
+    last_file_no = header['last_file_no']
+    photo_file_no = header['photo_file_no']
+    photo_seg_num = header['photo_seg_num']
+
+    # Seg 3 Each record file info
+    seg3 = np.frombuffer(buf, dtype = seg3_dtype, count = record_file_num, offset = 0x500)
+    file_no = seg3['file_no'].astype(np.int64)
+    if np.any(file_no != np.arange(record_file_num)):
+        common.warning('Seg 3 file no out of order.')
+    is_photo = (file_no == photo_file_no)
+    file_type = seg3['file_type'].astype(np.int64)
+    is_video = ~is_photo
+    if np.any(is_video & (file_type == 2) & (file_no != last_file_no)):
+        common.error('Seg 3 0x10 - 0x12 error. Normal video should be 0x00 and 0x01.')
+    if np.any(is_photo & (file_type != 2)):
+        common.error('Seg 3 0x10 - 0x12 error. Photo should be 0x02.')
+    file_infos = {}
+    file_infos['file_no'] = file_no
+    file_infos['is_photo'] = is_photo
+    file_infos['video_write_complete'] = seg3['video_write_complete'].astype(np.int64)
+    file_infos['seg_num'] = np.where(
+        is_photo, photo_seg_num, seg3['seg_num'].astype(np.int64) + 1
+    )
+    file_infos['is_emergency_file'] = np.where(file_type == 2, 0, file_type)
+    if np.any(file_infos['seg_num'] > 0x100):
+        common.error('Seg 3 0x06 - 0x08 error. Segment number should not exceed 0x100.')
+
+    # Seg 4 Each segment detailed info
+    seg4 = np.frombuffer(
+        buf, dtype = seg4_dtype, count = record_file_num * 0x100,
+        offset = 0x500 + 0x20 * record_file_num
+    ).reshape(record_file_num, 0x100)
+    used = np.arange(0x100)[np.newaxis, :] < file_infos['seg_num'][:, np.newaxis]
+    (file_idx, seg_no) = np.nonzero(used)
+    seg4 = seg4[used]
+    seg_is_photo = is_photo[file_idx]
+    seg_type = seg4['seg_type'].astype(np.int64)
+    video_type = seg4['video_type'].astype(np.int64)
+    if np.any(~seg_is_photo & (seg_type != 0)):
+        common.error('Seg 4 0x00 error. Video should be 0x00.')
+    if np.any(seg_is_photo & (seg_type != 2)):
+        common.error('Seg 4 0x00 error. Photo should be 0x02.')
+    if np.any(~seg_is_photo & (video_type != 0x13) & (video_type != 0x00)):
+        common.error('Seg 4 0x04 - 0x08 error. Video should be either of 0x00 and 0x13.')
+    segments = {}
+    segments['file_no'] = file_no[file_idx]
+    segments['seg_no'] = seg_no
+    segments['seg_type'] = seg_type
+    segments['start_time'] = common.adjust_tz(seg4['start_time'].astype(np.int64))
+    segments['end_time'] = common.adjust_tz(seg4['end_time'].astype(np.int64))
+    segments['start_pos'] = seg4['start_pos'].astype(np.int64) - 0x40000
+    segments['end_pos'] = seg4['end_pos'].astype(np.int64)
+    segments['video_fps'] = seg4['video_fps'].astype(np.int64)
+    segments['video_type'] = video_type
+
+    index_table = {}
+    index_table['record_file_num'] = record_file_num
+    index_table['last_file_no'] = last_file_no
+    index_table['photo_file_no'] = photo_file_no
+    index_table['file_infos'] = file_infos
+    index_table['segments'] = segments
+    return index_table
+
+def table_to_index(index_table: dict) -> dict:
+    """
+    Build record_file_index dict from the table returned by parse_table().
+
+    Parameters
+    ----------
+    index_table: dict
+        Table returned by parse_table()
+
+    Returns
+    ----------
+    record_file_index: dict
+        Same as parse() returns.
+    """
+
+    file_infos = index_table['file_infos']
+    segments = {}
+    for key in index_table['segments']:
+        segments[key] = index_table['segments'][key].tolist()
+
+    record_file_index = {}
+    record_file_index['record_file_num'] = index_table['record_file_num']
+    record_file_infos = []
+    seg_i = 0
+    for (file_no, is_photo, video_write_complete, seg_num, is_emergency_file) in zip(
+        file_infos['file_no'].tolist(),
+        file_infos['is_photo'].tolist(),
+        file_infos['video_write_complete'].tolist(),
+        file_infos['seg_num'].tolist(),
+        file_infos['is_emergency_file'].tolist()
+    ):
+        record_file_info = {}
+        record_file_info['file_no'] = file_no
+        if not is_photo:
+            record_file_info['file_type'] = 'video'
+            record_file_info['video_write_complete'] = video_write_complete
+            record_file_info['seg_num'] = seg_num
+            record_file_info['is_emergency_file'] = is_emergency_file
+        else:
+            record_file_info['file_type'] = 'photo'
+            record_file_info['seg_num'] = seg_num
+        seg_infos = []
+        for i in range(seg_i, seg_i + seg_num):
+            seg_info = {}
+            seg_info['seg_no'] = segments['seg_no'][i]
+            seg_info['seg_type'] = 'photo' if is_photo else 'video'
+            seg_info['start_time'] = segments['start_time'][i]
+            seg_info['end_time'] = segments['end_time'][i]
+            seg_info['start_pos'] = segments['start_pos'][i]
+            seg_info['end_pos'] = segments['end_pos'][i]
+            if not is_photo:
+                seg_info['video_type'] = 'normal' if segments['video_type'][i] == 0x13 else 'parking'
+                seg_info['video_fps'] = segments['video_fps'][i]
+            seg_infos.append(seg_info)
+        seg_i = seg_i + seg_num
+        record_file_info['seg_infos'] = seg_infos
+        record_file_infos.append(record_file_info)
+    record_file_index['record_file_infos'] = record_file_infos
+
     return record_file_index
 
 def search(record_file_index: dict, start_time: int = -1, end_time: int = -1) -> list:
@@ -183,6 +432,13 @@ def search(record_file_index: dict, start_time: int = -1, end_time: int = -1) ->
     # Sort to find all consecutive video segments.
     temp_result.sort(key = lambda x: x['start'])
 
+    return __group_segments(temp_result, start_time, end_time)
+
+def __group_segments(temp_result: list, start_time: int, end_time: int) -> list:
+    """
+    Split overlapping segments sorted by start time into consecutive videos.
+    """
+
     start_offset = 0
     end_offset = 0
     if len(temp_result) > 0:
@@ -213,3 +469,126 @@ def search(record_file_index: dict, start_time: int = -1, end_time: int = -1) ->
         search_result[-1][-1]['end'] = search_result[-1][-1]['end'] - end_offset
 
     return search_result
+
+def build_search_index(record_file_index: dict) -> dict:
+    """
+    Build a search index of all video segments, sorted by start time.
+    Used by search_indexed() and search_many() to find segments with
+    binary search instead of scanning the whole index.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse()
+
+    Returns
+    ----------
+    search_index: dict
+        Columns of video segments sorted by start time.
+    """
+
+    segs = []
+    for file_info in record_file_index['record_file_infos']:
+        if file_info['file_type'] == 'video':
+            for seg_info in file_info['seg_infos']:
+                segs.append((
+                    seg_info['start_time'], seg_info['end_time'],
+                    file_info['file_no'], seg_info['seg_no'],
+                    seg_info['video_type'] == 'parking'
+                ))
+    # Stable sort keeps index order for segments with same start time,
+    # same as search()
+    segs.sort(key = lambda x: x[0])
+
+    search_index = {}
+    search_index['start'] = [seg[0] for seg in segs]
+    search_index['end'] = [seg[1] for seg in segs]
+    search_index['file_no'] = [seg[2] for seg in segs]
+    search_index['seg_no'] = [seg[3] for seg in segs]
+    search_index['parking'] = [seg[4] for seg in segs]
+    # Latest end time of the segments up to each one. Segments before the
+    # first one reaching a period can't overlap with it.
+    search_index['max_end'] = list(accumulate(search_index['end'], max))
+    return search_index
+
+def __search_range(search_index: dict, start_time: int, end_time: int, lo: int = 0) -> tuple:
+    """
+    Find overlapping segments of a period in search_index.
+
+    Returns
+    ----------
+    tuple(temp_result, lo)
+        temp_result is the same as in search(). lo is where to start
+        the binary search for a later period.
+    """
+
+    starts = search_index['start']
+    ends = search_index['end']
+    lo = bisect_left(search_index['max_end'], start_time, lo)
+    hi = bisect_right(starts, end_time, lo)
+
+    temp_result = []
+    for i in range(lo, hi):
+        if ends[i] >= start_time:
+            temp = {}
+            temp['file_no'] = search_index['file_no'][i]
+            temp['seg_no'] = search_index['seg_no'][i]
+            temp['start'] = starts[i]
+            temp['end'] = ends[i]
+            temp['parking'] = search_index['parking'][i]
+            temp_result.append(temp)
+    return (temp_result, lo)
+
+def search_indexed(search_index: dict, start_time: int = -1, end_time: int = -1) -> list:
+    """
+    Same as search(), but use the index from build_search_index().
+
+    Parameters
+    ----------
+    search_index: dict
+        Index returned by build_search_index()
+    start_time: int
+        Timestamp. Default -1: search from the beginning.
+    end_time: int
+        Timestamp. Default -1: search to the end.
+
+    Returns
+    ----------
+    result: list
+        A list containing all consecutive videos. Same as search().
+    """
+
+    if end_time == -1:
+        end_time = (1 << 32)
+
+    (temp_result, lo) = __search_range(search_index, start_time, end_time)
+    return __group_segments(temp_result, start_time, end_time)
+
+def search_many(search_index: dict, periods: list) -> list:
+    """
+    Search many periods in one pass over the index from build_search_index().
+
+    Parameters
+    ----------
+    search_index: dict
+        Index returned by build_search_index()
+    periods: list
+        List of (start_time, end_time). -1 has the same meaning as in search().
+
+    Returns
+    ----------
+    results: list
+        search() result of each period, in the same order as periods.
+    """
+
+    results = [None] * len(periods)
+    # Visit periods by start time, so the binary search only moves forward
+    order = sorted(range(len(periods)), key = lambda i: periods[i][0])
+    lo = 0
+    for i in order:
+        (start_time, end_time) = periods[i]
+        if end_time == -1:
+            end_time = (1 << 32)
+        (temp_result, lo) = __search_range(search_index, start_time, end_time, lo)
+        results[i] = __group_segments(temp_result, start_time, end_time)
+    return results
@@ -0,0 +1,238 @@
+# Parse log.bin, the running log of the dashcam
+
+import mmap
+import os
+
+import common
+
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+# Log record, from 0x2000
+log_dtype = np.dtype({
+    'names': ['time', 'type_id', 'message'],
+    'formats': ['<u4', '<u4', 'V132'],
+    'offsets': [0x00, 0x04, 0x0C],
+    'itemsize': 0x90
+}) if has_numpy else None
+
+# type_id of known logs, the 4 bytes read as little endian uint32
+log_types = {
+    0x00100001: 'power_on',
+    0x000C0001: 'power_loss',
+    0x00010001: 'version',
+    0x00090003: 'clock'
+}
+
+# Events told by the start of the log string. Logs of the same type_id
+# can be different events, and some type_ids are unknown.
+log_events = [
+    (b'power:', 'power_on'),
+    (b'Low power', 'power_loss'),
+    (b'PARKING ENTER', 'parking_enter'),
+    (b'PARKING EXIT', 'parking_exit'),
+    (b'GMT', 'timezone_change'),
+    (b'TimeZone ', 'timezone_set'),
+    (b'GPS ', 'gps_sync'),
+    (b'Wifi ap passwd set', 'wifi_passwd')
+]
+
+#===========================================
+
+def parse(sd_dir_path: str, log_file_path: str = None) -> dict:
+    """
+    Decode all logs in log.bin into columns, with indexes by type and
+    time. Numpy is required.
+
+    Parameters
+    ----------
+    sd_dir_path: str
+        SD card path or a folder containing log.bin.
+    log_file_path: str
+        Log file to parse. Default None: log.bin in sd_dir_path.
+
+    Returns
+    ----------
+    log_table: dict
+        See README.md
+    """
+
+    if not has_numpy:
+        common.error('Module numpy is needed for log table.')
+    if log_file_path == None:
+        log_file_path = os.path.join(sd_dir_path, 'log.bin')
+    if not os.path.isfile(log_file_path):
+        common.error('Log file not found.')
+
+    with open(log_file_path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            if mm[0:4] != b'SWKH':
+                common.error('Log file header error.')
+            log_num = min(
+                int.from_bytes(mm[0x10:0x12], 'little'),
+                (len(mm) - 0x2000) // 0x90
+            )
+            records = np.frombuffer(mm, dtype = log_dtype, count = log_num, offset = 0x2000)
+            log_table = __decode_records(records)
+            # Release the buffer before mm is closed
+            del records
+    return log_table
+
+def __decode_records(records) -> dict:
+    times = records['time'].astype(np.int64)
+    type_ids = records['type_id'].astype(np.int64)
+    raw_messages = [message.tobytes() for message in records['message']]
+
+    log_table = {}
+    log_table['log_num'] = len(records)
+    log_table['time'] = common.adjust_tz(times) if len(times) != 0 else times
+    log_table['type_id'] = type_ids
+    log_table['event'] = []
+    log_table['message'] = []
+    for (type_id, raw) in zip(type_ids.tolist(), raw_messages):
+        if log_types.get(type_id) == 'version':
+            log_table['event'].append('version')
+            log_table['message'].append(__decode_version(raw))
+            continue
+        raw = raw.split(b'\0', 1)[0]
+        event = log_types.get(type_id, 'unknown')
+        for (prefix, prefix_event) in log_events:
+            if raw.startswith(prefix):
+                event = prefix_event
+                break
+        log_table['event'].append(event)
+        log_table['message'].append(raw.decode('utf-8', 'replace').rstrip('\n'))
+
+    # Indexes, record numbers sorted by time
+    time_order = np.argsort(log_table['time'], kind = 'stable')
+    log_table['time_order'] = time_order
+    log_table['sorted_time'] = log_table['time'][time_order]
+    log_table['type_index'] = __group(type_ids[time_order].tolist(), time_order)
+    events = [log_table['event'][i] for i in time_order.tolist()]
+    log_table['event_index'] = __group(events, time_order)
+    return log_table
+
+def __decode_version(raw: bytes) -> str:
+    # Firmware version X.Y.Z, firmware date and serial number
+    serial = raw[0x14:].split(b'\0', 1)[0].decode('ascii', 'replace')
+    return 'V%d.%d.%d %04d-%02d-%02d %s' % (
+        raw[3], raw[2], int.from_bytes(raw[0:2], 'little'),
+        int.from_bytes(raw[4:6], 'little'), raw[6], raw[7], serial
+    )
+
+def __group(keys: list, time_order) -> dict:
+    groups = {}
+    for (key, i) in zip(keys, time_order.tolist()):
+        groups.setdefault(key, []).append(i)
+    return {key: np.array(groups[key], dtype = np.int64) for key in groups}
+
+def search(
+        log_table: dict,
+        start_time: int = -1, end_time: int = -1,
+        event: str = None, type_id: int = None
+    ) -> list:
+    """
+    Get logs in a time range.
+
+    Parameters
+    ----------
+    log_table: dict
+        Table returned by parse()
+    start_time: int
+        Timestamp. Default -1: search from the beginning.
+    end_time: int
+        Timestamp, included. Default -1: search to the end.
+    event: str
+        Only logs of this event, e.g. 'power_loss'. Optional.
+    type_id: int
+        Only logs of this type_id. Optional.
+
+    Returns
+    ----------
+    logs: list
+        Logs sorted by time. See README.md
+    """
+
+    indices = __search_indices(log_table, start_time, end_time)
+    empty = np.zeros(0, dtype = np.int64)
+    if event != None:
+        indices = np.intersect1d(indices, log_table['event_index'].get(event, empty))
+    if type_id != None:
+        indices = np.intersect1d(indices, log_table['type_index'].get(type_id, empty))
+    indices = indices[np.argsort(log_table['time'][indices], kind = 'stable')]
+    return [__get_log(log_table, i) for i in indices.tolist()]
+
+def __search_indices(log_table: dict, start_time: int, end_time: int):
+    sorted_time = log_table['sorted_time']
+    lo = 0 if start_time == -1 else np.searchsorted(sorted_time, start_time, 'left')
+    hi = len(sorted_time) if end_time == -1 else np.searchsorted(sorted_time, end_time, 'right')
+    return np.sort(log_table['time_order'][lo:hi])
+
+def __get_log(log_table: dict, i: int) -> dict:
+    log = {}
+    log['log_no'] = i
+    log['time'] = int(log_table['time'][i])
+    log['type_id'] = int(log_table['type_id'][i])
+    log['event'] = log_table['event'][i]
+    log['message'] = log_table['message'][i]
+    return log
+
+def correlate(logs: list, record_file_index: dict) -> list:
+    """
+    Find the video segment recording when each log happened, and the
+    last one ended before it.
+
+    Parameters
+    ----------
+    logs: list
+        From search().
+    record_file_index: dict
+        Index returned by parse_index.parse()
+
+    Returns
+    ----------
+    logs: list
+        Copies of logs with 'segment' and 'last_segment'. See README.md
+    """
+
+    segs = []
+    for file_info in record_file_index['record_file_infos']:
+        if file_info['file_type'] != 'video':
+            continue
+        for seg_info in file_info['seg_infos']:
+            segs.append((seg_info['start_time'], seg_info['end_time'], file_info['file_no'], seg_info['seg_no']))
+    segs.sort()
+    if len(segs) == 0:
+        return [dict(log, segment = None, last_segment = None) for log in logs]
+    starts = np.array([seg[0] for seg in segs], dtype = np.int64)
+    ends = np.array([seg[1] for seg in segs], dtype = np.int64)
+    # Latest end among segments started so far, segments can overlap
+    max_ends = np.maximum.accumulate(ends)
+    by_end = np.argsort(ends, kind = 'stable')
+    sorted_ends = ends[by_end]
+
+    times = np.array([log['time'] for log in logs], dtype = np.int64)
+    started = np.searchsorted(starts, times, 'right') - 1
+    ended = np.searchsorted(sorted_ends, times, 'left') - 1
+    result = []
+    for (k, log) in enumerate(logs):
+        log = dict(log)
+        log['segment'] = None
+        log['last_segment'] = None
+        i = int(started[k])
+        if (i >= 0) and (max_ends[i] >= times[k]):
+            # Latest started segment still recording
+            while ends[i] < times[k]:
+                i = i - 1
+            log['segment'] = __get_seg(segs[i])
+        j = int(ended[k])
+        if j >= 0:
+            log['last_segment'] = __get_seg(segs[int(by_end[j])])
+        result.append(log)
+    return result
+
+def __get_seg(seg: tuple) -> dict:
+    return {'file_no': seg[2], 'seg_no': seg[3], 'start_time': seg[0], 'end_time': seg[1]}
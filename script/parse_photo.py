@@ -0,0 +1,72 @@
+# Parse photo segments in the photo hivXXXXX.mp4 file
+
+import os
+import struct
+
+import common
+
+# Seg 1 body record, one for each photo
+seg1_struct_format = '<4xIII24xII'
+
+# Seg 2 body record, one for each photo
+seg2_struct_format = '<2xHI8x'
+
+photo_reasons = {
+    0x03: 'voice',
+    0x67: 'parking'
+}
+
+#===========================================
+
+def parse_seg(
+        sd_dir_path: str,
+        file_no: int, seg_no: int,
+        record_file_index: dict
+    ) -> list:
+    """
+    Parse a photo segment to get time, reason and position of each photo.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+
+    Returns
+    ----------
+    photo_infos: list
+        See README.md
+    """
+
+    seg_info = record_file_index['record_file_infos'][file_no]['seg_infos'][seg_no]
+    seg_start_pos = seg_info['start_pos']
+
+    video_file_name = 'hiv%05d.mp4' % file_no
+    video_file_path = os.path.join(sd_dir_path, video_file_name)
+    with open(video_file_path, 'rb') as f:
+        # Seg 1 and Seg 2 in one read
+        f.seek(seg_start_pos)
+        buf = f.read(0x20000)
+    # Seg 1 photo time and position
+    photo_num = int(int.from_bytes(buf[0x1C:0x1E], 'little') / 0x30)
+    seg1 = buf[0x20 : 0x20 + 0x30 * photo_num]
+    # Seg 2 photo reason
+    reason_num = int(int.from_bytes(buf[0x1001C:0x1001E], 'little') / 0x10)
+    seg2 = buf[0x10020 : 0x10020 + 0x10 * reason_num]
+
+    reasons = [reason for (reason, t) in struct.iter_unpack(seg2_struct_format, seg2)]
+    # Should be the same as photo_num
+    reasons = reasons + [None] * (photo_num - len(reasons))
+    photo_infos = []
+    for (photo_no, (t, photo_offset, data_len, photo_len, thumb_len)) in enumerate(
+        struct.iter_unpack(seg1_struct_format, seg1)
+    ):
+        photo_info = {}
+        photo_info['photo_no'] = photo_no
+        photo_info['time'] = int(common.adjust_tz(t))
+        photo_info['reason'] = photo_reasons.get(reasons[photo_no], 'unknown')
+        photo_info['photo_pos'] = seg_start_pos + 0x40000 + photo_offset
+        photo_info['data_len'] = data_len
+        photo_info['photo_len'] = photo_len
+        photo_info['thumb_len'] = thumb_len
+        photo_infos.append(photo_info)
+    return photo_infos
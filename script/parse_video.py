@@ -1,12 +1,68 @@
 # Parse video segment, generate playable video, GPS track, etc.
 
 import os
+import re
+import mmap
 import struct
+import sys
 import copy
 import time
-from datetime import datetime, timezone
+import heapq
+import contextlib
+import collections
+import concurrent.futures
+from datetime import datetime
 
 import common
+import parse_index
+import telemetry_columns
+
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    # Numpy is not installed, decode tables record by record
+    has_numpy = False
+
+# Seg 1 body record of a video segment, one for each second
+seg1_struct_format = '<4xII4xIIIIIBBB9x'
+seg1_dtype = np.dtype({
+    'names': [
+        'time', 'sec_offset', 'lon', 'lat', 'speed',
+        'heading', 'height', 'valid', 'ew', 'ns'
+    ],
+    'formats': [
+        '<u4', '<u4', '<u4', '<u4', '<u4',
+        '<u4', '<u4', 'u1', 'u1', 'u1'
+    ],
+    'offsets': [
+        0x04, 0x08, 0x10, 0x14, 0x18,
+        0x1C, 0x20, 0x24, 0x25, 0x26
+    ],
+    'itemsize': 0x30
+}) if has_numpy else None
+
+# Date fields of a binary GPS/acce packet, from 0x24
+bin_date_dtype = np.dtype({
+    'names': ['year', 'mon', 'day', 'hour', 'min', 'sec'],
+    'formats': ['<u2', '<u2', '<u2', '<u2', '<u2', '<u2'],
+    'offsets': [0x00, 0x02, 0x06, 0x08, 0x0A, 0x0C],
+    'itemsize': 0x0E
+}) if has_numpy else None
+
+# Strings of a pkt_id=0x0007 sub_pkt_id=0x0001 ASCII acce packet
+ascii_time_pattern = re.compile(rb'frmNum=(\d+), timeStamp=(\d+)')
+ascii_acce_pattern = re.compile(rb'g_x=(-?\d+) g_y=(-?\d+) g_z=(-?\d+)')
+
+# label_type in image_label_log
+image_label_types = {
+    0x21: 'car_start',
+    0x22: 'green_light'
+}
+
+# private_stream_1 decoders, keyed by (pkt_id, sub_pkt_id).
+# See register_private_decoder()
+private_decoders = {}
 
 #===========================================
 
@@ -37,227 +93,1039 @@ def parse_seg(
         A dict containing various info.
     """
 
+    stats = __get_stats(parse_options)
+    if stats == None:
+        return __parse_seg(
+            sd_dir_path, file_no, seg_no, record_file_index,
+            parse_options, start_sec, end_sec, None
+        )
+    with stats.stage('parse_seg'):
+        parse_seg_result = __parse_seg(
+            sd_dir_path, file_no, seg_no, record_file_index,
+            parse_options, start_sec, end_sec, stats
+        )
+    parse_seg_result['stats'] = stats.to_dict()
+    return parse_seg_result
+
+def __parse_seg(
+        sd_dir_path: str,
+        file_no: int, seg_no: int,
+        record_file_index: dict,
+        parse_options: dict,
+        start_sec: int, end_sec: int,
+        stats
+    ) -> dict:
     seg_info = record_file_index['record_file_infos'][file_no]['seg_infos'][seg_no]
     parse_seg_result = {}
 
     video_file_name = 'hiv%05d.mp4' % file_no
     video_file_path = os.path.join(sd_dir_path, video_file_name)
     with open(video_file_path, 'rb') as f:
+        f = __wrap_file(f, stats)
 
         # Seg 1 Video timestamp and GPS
-        f.seek(seg_info['start_pos'])
-        # header
-        buf = f.read(0x20)
-        seg_len_sec = int(int.from_bytes(buf[0x1C:0x1E], 'little') / 0x30)
-        if start_sec < 0:
-            start_sec = 0
-        parse_to_end = False
-        if end_sec == -1 or end_sec >= seg_len_sec - 1:
-            end_sec = seg_len_sec - 1
-            parse_to_end = True
-        seg_len_sec = end_sec + 1 - start_sec
-        sec_offsets = [0] * seg_len_sec
+        with __stage(stats, 'seg1'):
+            (seg1, seg_len_sec, parse_to_end) = __read_seg1(f, seg_info, start_sec, end_sec)
+        sec_offsets = seg1['sec_offset']
         gps_info = {}
         if parse_options['gps_track']:
             if seg_info['video_type'] == 'parking':
+                # in parking mode, all GPS data are same, only read one
                 gps_info['gps_data_num'] = 1
-                gps_track = []
+                if __is_columnar(parse_options):
+                    gps_track = telemetry_columns.GpsTrack({
+                        name: seg1[name][:1] for (name, typecode) in telemetry_columns.GpsTrack.fields
+                    })
+                else:
+                    gps_track = seg1_to_gps_track(seg1, 1)
+            elif __is_columnar(parse_options):
+                gps_info['gps_data_num'] = seg_len_sec
+                # in seg 1, only height is accurate
+                gps_track = telemetry_columns.GpsTrack({'height': seg1['height'][:seg_len_sec]})
             else:
                 gps_info['gps_data_num'] = seg_len_sec
-                point = {}
-                point['time'] = 0
-                point['valid'] = 0
-                point['lat'] = 0
-                point['lon'] = 0
-                point['height'] = 0
-                point['speed'] = 0
-                point['heading'] = 0
-                gps_track = [copy.deepcopy(point) for x in range(seg_len_sec)]
+                # in seg 1, only height is accurate
+                gps_track = [
+                    {
+                        'time': 0, 'valid': 0, 'lat': 0, 'lon': 0,
+                        'height': height, 'speed': 0, 'heading': 0
+                    }
+                    for height in __column_list(seg1['height'][:seg_len_sec])
+                ]
             gps_info['gps_track'] = gps_track
         else:
             gps_info['gps_data_num'] = 0
-            gps_info['gps_track'] = []
+            if __is_columnar(parse_options):
+                gps_info['gps_track'] = telemetry_columns.GpsTrack()
+            else:
+                gps_info['gps_track'] = []
         parse_seg_result['gps_info'] = gps_info
-        # body
-        f.seek(f.tell() + 0x30 * start_sec)
-        for i in range(seg_len_sec):
-            buf = f.read(0x30)
-            # File offset for each second
-            sec_offsets[i] = int.from_bytes(buf[0x08:0x0C], 'little')
-            # GPS
-            if parse_options['gps_track'] and seg_info['video_type'] == 'parking' and i == start_sec:
-                # in parking mode, all GPS data are same, only read one
-                point = {}
-                point['time'] = common.adjust_tz(int.from_bytes(buf[0x04:0x08], 'little'))
-                point['valid'] = buf[0x24]
-                point['lat'] = int.from_bytes(buf[0x14:0x18], 'little')
-                point['lon'] = int.from_bytes(buf[0x10:0x14], 'little')
-                point['height'] = int.from_bytes(buf[0x20:0x24], 'little')
-                point['speed'] = int.from_bytes(buf[0x18:0x1C], 'little')
-                point['heading'] = int(int.from_bytes(buf[0x1C:0x20], 'little') / 100)
-                if buf[0x25] == ord('W'):
-                    point['lon'] = -point['lon']
-                if buf[0x26] == ord('S'):
-                    point['lat'] = -point['lat']
-                gps_track.append(point)
-            if parse_options['gps_track'] and seg_info['video_type'] != 'parking':
-                # in seg 1, only height is accurate
-                gps_track[i]['height'] = int.from_bytes(buf[0x20:0x24], 'little')
-        if not parse_to_end:
-            buf = f.read(0x30)
-            sec_offsets.append(int.from_bytes(buf[0x08:0x0C], 'little'))
 
         # Seg 2 Emergency
-        f.seek(seg_info['start_pos'] + 0x10000)
-        # header
-        buf = f.read(0x20)
-        emergency_video_num = int(int.from_bytes(buf[0x1C:0x1E], 'little') / 0x10)
-        emergency_info = {}
-        emergency_video_timestamps = [0] * emergency_video_num
-        emergency_info['emergency_video_num'] = emergency_video_num
-        emergency_info['emergency_video_timestamps'] = emergency_video_timestamps
-        # body
-        for i in range(emergency_video_num):
-            buf = f.read(0x10)
-            emergency_video_timestamps[i] = common.adjust_tz(int.from_bytes(buf[0x04:0x08], 'little'))
+        with __stage(stats, 'seg2'):
+            f.seek(seg_info['start_pos'] + 0x10000)
+            # header
+            buf = f.read(0x20)
+            emergency_video_num = int(int.from_bytes(buf[0x1C:0x1E], 'little') / 0x10)
+            emergency_info = {}
+            emergency_video_timestamps = [0] * emergency_video_num
+            emergency_info['emergency_video_num'] = emergency_video_num
+            emergency_info['emergency_video_timestamps'] = emergency_video_timestamps
+            # body
+            for i in range(emergency_video_num):
+                buf = f.read(0x10)
+                emergency_video_timestamps[i] = common.adjust_tz(int.from_bytes(buf[0x04:0x08], 'little'))
         parse_seg_result['emergency_info'] = emergency_info
 
         # Seg 3 Thumbnail
         if parse_options['export_thumbnail']:
-            f.seek(seg_info['start_pos'] + 0x20000)
-            # header
-            buf = f.read(0x20)
-            export_thumbnail_len = int.from_bytes(buf[0x1C:0x1E], 'little')
-            buf = f.read(export_thumbnail_len)
-            of = open(parse_options['export_thumbnail_path'], 'wb+')
-            of.write(buf)
-            of.close()
+            with __stage(stats, 'seg3'):
+                f.seek(seg_info['start_pos'] + 0x20000)
+                # header
+                buf = f.read(0x20)
+                export_thumbnail_len = int.from_bytes(buf[0x1C:0x1E], 'little')
+                buf = f.read(export_thumbnail_len)
+                of = __wrap_file(open(parse_options['export_thumbnail_path'], 'wb+'), stats)
+                of.write(buf)
+                of.close()
         
         # Seg 5 Video and telemetry
-        seg_start_pos = seg_info['start_pos'] + 0x40000 + sec_offsets[0]
+        seg_start_pos = seg_info['start_pos'] + 0x40000 + int(sec_offsets[0])
         if parse_to_end:
             seg_end_pos = seg_info['end_pos']
         else:
-            seg_end_pos = seg_info['start_pos'] + 0x40000 + sec_offsets[-1]
+            seg_end_pos = seg_info['start_pos'] + 0x40000 + int(sec_offsets[-1])
         
         f.seek(seg_start_pos)
-        if parse_options['export_video']:
-            if ('export_video_adding' in parse_options) and parse_options['export_video_adding']:
-                of = open(parse_options['export_video_path'], 'ab+')
+        of = None
+        if parse_options['export_video'] and __is_fmp4(parse_options):
+            if 'fmp4_muxer' in parse_options:
+                # Shared by segments of a video, closed by parse_video()
+                of = parse_options['fmp4_muxer']
+            else:
+                import export_fmp4
+                of = export_fmp4.Muxer(
+                    __wrap_file(open(parse_options['export_video_path'], 'wb'), stats),
+                    __has_fmp4_telemetry(parse_options)
+                )
+            of.new_segment(seg_info['start_time'] + max(start_sec, 0))
+        elif parse_options['export_video']:
+            if (
+                ('export_video_adding' in parse_options) and parse_options['export_video_adding'] and
+                os.path.isfile(parse_options['export_video_path'])
+            ):
+                # Not opened in append mode, which kernel copies don't support
+                of = open(parse_options['export_video_path'], 'rb+')
+                of.seek(0, os.SEEK_END)
             else:
                 of = open(parse_options['export_video_path'], 'wb+')
-        acce_num = 0
-        acce_log = []
-        gps_num = 0
         
         # Read SCRB from the first PS header
         buf = f.read(4)
         buf = f.read(5)
-        scrb = (buf[0] % (1 << 5)) >> 3
-        scrb = (scrb << 2) + (buf[0] % (1 << 2))
-        scrb = (scrb << 8) + buf[1]
-        scrb = (scrb << 5) + (buf[2] >> 3)
-        scrb = (scrb << 2) + (buf[2] % (1 << 2))
-        scrb = (scrb << 8) + buf[3]
-        scrb = (scrb << 5) + (buf[4] >> 3)
-        seg_pts_start = scrb
+        seg_pts_start = __decode_scrb(buf, 0)
         f.seek(seg_start_pos)
 
+        telemetry = {}
+        telemetry['seg_pts_start'] = seg_pts_start
+        # Last decoded date fields, see __decode_bin_time()
+        telemetry['time_memo'] = (None, 0, 0)
+        telemetry['parking'] = (seg_info['video_type'] == 'parking')
+        telemetry['gps_track'] = gps_info['gps_track']
+        telemetry['gps_num_max'] = seg_len_sec
+        telemetry['gps_num'] = 0
+        if __is_columnar(parse_options):
+            telemetry['acce_log'] = telemetry_columns.AcceLog()
+        else:
+            telemetry['acce_log'] = []
+        # Packet types without an enabled decoder are skipped
+        enabled_decoders = __get_private_decoders(parse_options)
+        telemetry['decoders'] = {pkt_type: entry['decoder'] for (pkt_type, entry) in enabled_decoders}
+        telemetry['stats'] = stats
+        if stats != None:
+            # Time decoding apart from walking
+            for pkt_type in telemetry['decoders']:
+                telemetry['decoders'][pkt_type] = __timed_decoder(telemetry['decoders'][pkt_type], stats)
+        for (pkt_type, entry) in enabled_decoders:
+            if entry['log_name'] == None:
+                continue
+            if __is_columnar(parse_options):
+                telemetry[entry['log_name'] + '_log'] = entry['log_type']()
+            else:
+                telemetry[entry['log_name'] + '_log'] = []
+
         # Parse Program Stream
-        while(f.tell() < seg_end_pos):
-            stream_head = f.read(6)
-            if stream_head[3] == 0xBA:
-                # PS header
-                if parse_options['export_video']:
-                    buf = f.read(14)
-                    of.write(stream_head)
-                    of.write(buf)
-                else:
-                    f.seek(f.tell() + 14)
+        with __stage(stats, 'seg5'):
+            if (
+                (not parse_options['export_video']) and
+                ('telemetry_index_dir' in parse_options)
+            ):
+                # Only read private_stream_1 packets found by an earlier scan
+                import telemetry_index
+                packets = telemetry_index.load(
+                    sd_dir_path, parse_options['telemetry_index_dir'], file_no, seg_no, seg_info
+                )
+                if packets == None:
+                    packets = scan_private_stream_1(f, seg_info, stats)
+                    telemetry_index.save(
+                        sd_dir_path, parse_options['telemetry_index_dir'], file_no, seg_no, seg_info, packets
+                    )
+                if stats != None:
+                    __count_indexed_packets(packets, seg_start_pos, seg_end_pos, stats)
+                __parse_packets(f, packets, seg_start_pos, seg_end_pos, parse_options, telemetry)
+            elif ('pipeline' in parse_options) and parse_options['pipeline']:
+                __parse_ps_pipelined(video_file_path, seg_start_pos, seg_end_pos, of, parse_options, telemetry)
+            elif ('use_mmap' in parse_options) and parse_options['use_mmap']:
+                __parse_ps_mmap(f, seg_start_pos, seg_end_pos, of, parse_options, telemetry)
             else:
-                # PES packet
-                pes_len = int.from_bytes(stream_head[4:6], 'big')
-                if stream_head[3] != 0xBD:
-                    # not private_stream_1
-                    if parse_options['export_video']:
-                        buf = f.read(pes_len)
-                        of.write(stream_head)
-                        of.write(buf)
-                    else:
-                        f.seek(f.tell() + pes_len)
-                else:
-                    # private_stream_1
-                    if (
-                        (not parse_options['acce']) and 
-                        (not parse_options['gps_track']) and 
-                        (not parse_options['image_label'])
-                    ):
-                        f.seek(f.tell() + pes_len)
-                        continue
-                    # PES_packet header
-                    buf = f.read(10)
-                    pts = (buf[3] % (1 << 3)) >> 1
-                    pts = (pts << 8) + buf[4]
-                    pts = (pts << 7) + (buf[5] >> 1)
-                    pts = (pts << 8) + buf[6]
-                    pts = (pts << 7) + (buf[7] >> 1)
-                    # private_header
-                    buf = f.read(pes_len - 10)
-                    pkt_id = int.from_bytes(buf[0:2], 'big')
-                    sub_pkt_id = int.from_bytes(buf[4:6], 'big')
-                    # private_data
-                    if (
-                        (pkt_id == 0x0802) and (sub_pkt_id == 0x0007) and 
-                        (parse_options['acce'] or parse_options['gps_track'])
-                    ):
-                        # binary GPS/acce data
-                        data_type = int.from_bytes(buf[0x14:0x16], 'little')
-                        year = int.from_bytes(buf[0x24:0x26], 'little')
-                        mon = int.from_bytes(buf[0x26:0x28], 'little')
-                        day = int.from_bytes(buf[0x2A:0x2C], 'little')
-                        hour = int.from_bytes(buf[0x2C:0x2E], 'little')
-                        min = int.from_bytes(buf[0x2E:0x30], 'little')
-                        sec = int.from_bytes(buf[0x30:0x32], 'little')
-                        ms = int((pts / 90 - seg_pts_start / 90) % 1000)
-                        dt = datetime(year, mon, day, hour, min, sec, ms * 1000, tzinfo = timezone.utc)
-                        time_ms = int(common.adjust_tz(dt.timestamp()) * 1000)
-                        if (data_type == 0x10) and parse_options['acce']:
-                            acce_data = {}
-                            acce_data['time_ms'] = time_ms
-                            acce_data['x'] = int.from_bytes(buf[0x70:0x74], 'little', signed = True)
-                            acce_data['y'] = int.from_bytes(buf[0x6C:0x70], 'little', signed = True)
-                            acce_data['z'] = int.from_bytes(buf[0x68:0x6C], 'little', signed = True)
-                            acce_log.append(acce_data)
-                            acce_num = acce_num + 1
-                        elif (
-                            (data_type == 0x20) and parse_options['gps_track'] and 
-                            (not (seg_info['video_type'] == 'parking'))
-                        ):
-                            if (gps_num < seg_len_sec):
-                                point = gps_track[gps_num]
-                                point['time'] = int(common.adjust_tz(dt.timestamp()))
-                                point['valid'] = buf[0x76]
-                                lat = int(struct.unpack('<d', buf[0x64:0x6C])[0] * 360000)
-                                lon = int(struct.unpack('<d', buf[0x6C:0x74])[0] * 360000)
-                                if buf[0x74] == ord('S'):
-                                    lat = -lat
-                                if buf[0x75] == ord('W'):
-                                    lon = -lon
-                                point['lat'] = lat
-                                point['lon'] = lon
-                                point['speed'] = int(struct.unpack('<f', buf[0x78:0x7C])[0])
-                                point['heading'] = int(struct.unpack('<f', buf[0x7C:0x80])[0])
-                                gps_num = gps_num + 1
+                __parse_ps(f, seg_start_pos, seg_end_pos, of, parse_options, telemetry)
 
         acce_info = {}
-        acce_info['acce_num'] = acce_num
-        acce_info['acce_log'] = acce_log
+        acce_info['acce_num'] = len(telemetry['acce_log'])
+        acce_info['acce_log'] = telemetry['acce_log']
         parse_seg_result['acce_info'] = acce_info
-        if parse_options['export_video']:
+        for (pkt_type, entry) in enabled_decoders:
+            log_name = entry['log_name']
+            if log_name == None:
+                continue
+            log_info = {}
+            log_info[log_name + '_num'] = len(telemetry[log_name + '_log'])
+            log_info[log_name + '_log'] = telemetry[log_name + '_log']
+            parse_seg_result[log_name + '_info'] = log_info
+        if parse_options['export_video'] and __is_fmp4(parse_options):
+            if __has_fmp4_telemetry(parse_options):
+                import export_fmp4
+                export_fmp4.add_gps_track(of, gps_info['gps_track'])
+            if 'fmp4_muxer' not in parse_options:
+                of.close()
+        elif parse_options['export_video']:
             of.close()
     
     return parse_seg_result
 
+def parse_seg1(
+        sd_dir_path: str,
+        file_no: int, seg_no: int,
+        record_file_index: dict,
+        start_sec: int = -1, end_sec: int = -1
+    ) -> dict:
+    """
+    Parse the per second table in Seg 1 of a segment as columns.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    start_sec: int
+        When to start parsing. First is 0. -1 means first.
+    end_sec: int
+        When to stop parsing. Last is (len-1). -1 means last.
+
+    Returns
+    ----------
+    seg1: dict
+        Columns 'time', 'sec_offset', 'lat', 'lon', 'height', 'speed',
+        'heading' and 'valid', one element per second. Columns are numpy
+        arrays when numpy is installed, otherwise lists. Units are the same
+        as parse_seg_result. Use seg1_to_gps_track() to get dicts.
+    """
+
+    seg_info = record_file_index['record_file_infos'][file_no]['seg_infos'][seg_no]
+
+    video_file_name = 'hiv%05d.mp4' % file_no
+    video_file_path = os.path.join(sd_dir_path, video_file_name)
+    with open(video_file_path, 'rb') as f:
+        (seg1, seg_len_sec, parse_to_end) = __read_seg1(f, seg_info, start_sec, end_sec)
+
+    if not parse_to_end:
+        # drop the extra record read for the end offset
+        for key in seg1:
+            seg1[key] = seg1[key][:seg_len_sec]
+    return seg1
+
+def seg1_to_gps_track(seg1: dict, point_num: int = -1) -> list:
+    """
+    Build gps_track dicts from Seg 1 columns.
+
+    Parameters
+    ----------
+    seg1: dict
+        Columns from parse_seg1().
+    point_num: int
+        Number of points to build. -1 means all.
+
+    Returns
+    ----------
+    gps_track: list
+        See parse_seg_result in README.md
+    """
+    if point_num == -1:
+        point_num = len(seg1['time'])
+    columns = [
+        __column_list(seg1[key][:point_num]) for key in
+        ('time', 'valid', 'lat', 'lon', 'height', 'speed', 'heading')
+    ]
+    return [
+        {
+            'time': t, 'valid': valid, 'lat': lat, 'lon': lon,
+            'height': height, 'speed': speed, 'heading': heading
+        }
+        for (t, valid, lat, lon, height, speed, heading) in zip(*columns)
+    ]
+
+def __column_list(column) -> list:
+    if has_numpy:
+        return column.tolist()
+    else:
+        return list(column)
+
+def __read_seg1(f, seg_info: dict, start_sec: int, end_sec: int) -> tuple:
+    """
+    Read Seg 1 body of [start_sec, end_sec] in one read and decode it.
+
+    Returns
+    ----------
+    tuple(seg1, seg_len_sec, parse_to_end)
+        When not parse_to_end, seg1 has one more record after end_sec,
+        whose 'sec_offset' is where parsing stops.
+    """
+    f.seek(seg_info['start_pos'])
+    # header
+    buf = f.read(0x20)
+    seg_len_sec = int(int.from_bytes(buf[0x1C:0x1E], 'little') / 0x30)
+    if start_sec < 0:
+        start_sec = 0
+    parse_to_end = False
+    if end_sec == -1 or end_sec >= seg_len_sec - 1:
+        end_sec = seg_len_sec - 1
+        parse_to_end = True
+    seg_len_sec = end_sec + 1 - start_sec
+    record_num = seg_len_sec if parse_to_end else seg_len_sec + 1
+    # body
+    f.seek(seg_info['start_pos'] + 0x20 + 0x30 * start_sec)
+    buf = f.read(0x30 * record_num)
+    if has_numpy:
+        records = np.frombuffer(buf, dtype = seg1_dtype, count = record_num)
+        lat = records['lat'].astype(np.int64)
+        lon = records['lon'].astype(np.int64)
+        seg1 = {}
+        seg1['time'] = common.adjust_tz(records['time'].astype(np.int64))
+        seg1['sec_offset'] = records['sec_offset'].astype(np.int64)
+        seg1['lat'] = np.where(records['ns'] == ord('S'), -lat, lat)
+        seg1['lon'] = np.where(records['ew'] == ord('W'), -lon, lon)
+        seg1['height'] = records['height'].astype(np.int64)
+        seg1['speed'] = records['speed'].astype(np.int64)
+        seg1['heading'] = records['heading'].astype(np.int64) // 100
+        seg1['valid'] = records['valid'].astype(np.int64)
+    else:
+        seg1 = {}
+        for key in ('time', 'sec_offset', 'lat', 'lon', 'height', 'speed', 'heading', 'valid'):
+            seg1[key] = []
+        for (
+            t, sec_offset, lon, lat, speed, heading, height, valid, ew, ns
+        ) in struct.iter_unpack(seg1_struct_format, buf[:0x30 * record_num]):
+            seg1['time'].append(common.adjust_tz(t))
+            seg1['sec_offset'].append(sec_offset)
+            seg1['lat'].append(-lat if ns == ord('S') else lat)
+            seg1['lon'].append(-lon if ew == ord('W') else lon)
+            seg1['height'].append(height)
+            seg1['speed'].append(speed)
+            seg1['heading'].append(heading // 100)
+            seg1['valid'].append(valid)
+    return (seg1, seg_len_sec, parse_to_end)
+
+def __decode_scrb(buf, pos: int) -> int:
+    """
+    Decode system_clock_reference_base from a PS header. pos points to
+    the 5 SCR bytes right after the pack_start_code.
+    """
+    scrb = (buf[pos] % (1 << 5)) >> 3
+    scrb = (scrb << 2) + (buf[pos] % (1 << 2))
+    scrb = (scrb << 8) + buf[pos + 1]
+    scrb = (scrb << 5) + (buf[pos + 2] >> 3)
+    scrb = (scrb << 2) + (buf[pos + 2] % (1 << 2))
+    scrb = (scrb << 8) + buf[pos + 3]
+    scrb = (scrb << 5) + (buf[pos + 4] >> 3)
+    return scrb
+
+def __decode_pts(buf, pos: int) -> int:
+    """
+    Decode PTS from a PES_packet header. pos points to the 5 PTS bytes.
+    """
+    pts = (buf[pos] % (1 << 3)) >> 1
+    pts = (pts << 8) + buf[pos + 1]
+    pts = (pts << 7) + (buf[pos + 2] >> 1)
+    pts = (pts << 8) + buf[pos + 3]
+    pts = (pts << 7) + (buf[pos + 4] >> 1)
+    return pts
+
+def register_private_decoder(
+        pkt_id: int, sub_pkt_id: int,
+        options: list, decoder,
+        log_name: str = None, log_type = None
+    ):
+    """
+    Add a decoder of a private_stream_1 packet type. Replaces the decoder
+    already registered for the type.
+
+    Parameters
+    ----------
+    options: list
+        Names in parse_options. The decoder runs when any of them is true.
+        Packets with no enabled decoder are skipped after private_header.
+    decoder: function
+        decoder(buf, pts, parse_options, telemetry). buf is the PES packet
+        data after the 10 bytes PES_packet header, starting with
+        private_header. Decoded data is added to telemetry.
+    log_name: str
+        Records are added to telemetry[log_name + '_log'], and returned
+        as parse_seg_result[log_name + '_info']. None if the decoder fills
+        gps_track and acce_log.
+    log_type: class
+        telemetry_columns.Columns subclass of the log, used when
+        parse_options['columnar'] is true.
+    """
+    private_decoders[(pkt_id, sub_pkt_id)] = {
+        'options': options,
+        'decoder': decoder,
+        'log_name': log_name,
+        'log_type': log_type
+    }
+
+def __get_private_decoders(parse_options: dict) -> list:
+    """
+    Get registry entries of enabled decoders, as
+    [((pkt_id, sub_pkt_id), entry)].
+    """
+    enabled = []
+    for (pkt_type, entry) in private_decoders.items():
+        for option in entry['options']:
+            if (option in parse_options) and parse_options[option]:
+                enabled.append((pkt_type, entry))
+                break
+    return enabled
+
+def __get_pkt_type(buf, pos: int) -> tuple:
+    """
+    Get (pkt_id, sub_pkt_id) from private_header. pos points to it.
+    """
+    return ((buf[pos] << 8) | buf[pos + 1], (buf[pos + 4] << 8) | buf[pos + 5])
+
+def __timed_decoder(decoder, stats):
+    # Decoder running in the 'decode' stage
+    def timed_decoder(buf, pts: int, parse_options: dict, telemetry: dict):
+        with stats.stage('decode'):
+            decoder(buf, pts, parse_options, telemetry)
+    return timed_decoder
+
+def __decode_bin_acce_gps(buf, pts: int, parse_options: dict, telemetry: dict):
+    """
+    Decode a pkt_id=0x0802 sub_pkt_id=0x0007 binary GPS/acce packet.
+    """
+    data_type = int.from_bytes(buf[0x14:0x16], 'little')
+    (t, time_ms) = __decode_bin_time(buf, pts, telemetry)
+    if (data_type == 0x10) and parse_options['acce']:
+        acce_data = {}
+        acce_data['time_ms'] = time_ms
+        acce_data['x'] = int.from_bytes(buf[0x70:0x74], 'little', signed = True)
+        acce_data['y'] = int.from_bytes(buf[0x6C:0x70], 'little', signed = True)
+        acce_data['z'] = int.from_bytes(buf[0x68:0x6C], 'little', signed = True)
+        telemetry['acce_log'].append(acce_data)
+    elif (
+        (data_type == 0x20) and parse_options['gps_track'] and 
+        (not telemetry['parking'])
+    ):
+        gps_num = telemetry['gps_num']
+        if (gps_num < telemetry['gps_num_max']):
+            point = telemetry['gps_track'][gps_num]
+            point['time'] = t
+            point['valid'] = buf[0x76]
+            lat = int(struct.unpack('<d', buf[0x64:0x6C])[0] * 360000)
+            lon = int(struct.unpack('<d', buf[0x6C:0x74])[0] * 360000)
+            if buf[0x74] == ord('S'):
+                lat = -lat
+            if buf[0x75] == ord('W'):
+                lon = -lon
+            point['lat'] = lat
+            point['lon'] = lon
+            point['speed'] = int(struct.unpack('<f', buf[0x78:0x7C])[0])
+            point['heading'] = int(struct.unpack('<f', buf[0x7C:0x80])[0])
+            # Write back, points of a GpsTrack are copies
+            telemetry['gps_track'][gps_num] = point
+            telemetry['gps_num'] = gps_num + 1
+
+def __decode_ascii_acce(buf, pts: int, parse_options: dict, telemetry: dict):
+    """
+    Decode a pkt_id=0x0007 sub_pkt_id=0x0001 ASCII acce packet.
+    """
+    # String 1 at 0x3C, string 2 after the length of string 1 from 0x34
+    str1_end = 0x34 + int.from_bytes(buf[0x34:0x36], 'little')
+    time_match = ascii_time_pattern.match(bytes(buf[0x3C:str1_end]))
+    acce_match = ascii_acce_pattern.search(bytes(buf[str1_end:]))
+    if (time_match == None) or (acce_match == None):
+        return
+    acce_data = {}
+    acce_data['timestamp'] = int(time_match.group(2))
+    acce_data['frm_num'] = int(time_match.group(1))
+    acce_data['x'] = int(acce_match.group(1))
+    acce_data['y'] = int(acce_match.group(2))
+    acce_data['z'] = int(acce_match.group(3))
+    telemetry['ascii_acce_log'].append(acce_data)
+
+def __decode_image_label(buf, pts: int, parse_options: dict, telemetry: dict):
+    """
+    Decode green light / car ahead started from the header and part_1 of
+    a pkt_id=0x0802 sub_pkt_id=0x0001 packet.
+    """
+    # part_1 only exists when something is recognized
+    if (len(buf) < 0x7C) or (bytes(buf[0x34:0x36]) != b'\x01\x07'):
+        return
+    (x, y, w, h) = struct.unpack_from('<HHHH', buf, 0x68)
+    label = {}
+    label['timestamp'] = int.from_bytes(buf[0x2C:0x30], 'little')
+    label['frm_num'] = int.from_bytes(buf[0x28:0x2C], 'little')
+    label['label_type'] = int.from_bytes(buf[0x44:0x46], 'little')
+    label['x'] = x
+    label['y'] = y
+    label['w'] = w
+    label['h'] = h
+    telemetry['image_label_log'].append(label)
+
+def __decode_traffic_light(buf, pts: int, parse_options: dict, telemetry: dict):
+    """
+    Decode traffic light boxes in part_4 of a pkt_id=0x0009
+    sub_pkt_id=0x0001 packet.
+    """
+    # part_3 after the 0x10 bytes header, its length varies
+    part_3_len = int.from_bytes(buf[0x18:0x1A], 'little')
+    part_4 = 0x10 + part_3_len - 0x650
+    if (part_4 < 0x1A) or (part_4 + 0x17C > len(buf)):
+        return
+    timestamp = int.from_bytes(buf[part_4 + 0x04 : part_4 + 0x08], 'little')
+    rec_num = min(int.from_bytes(buf[part_4 + 0x178 : part_4 + 0x17C], 'little'), 45)
+    for box_no in range(rec_num):
+        (x, y, w, h) = struct.unpack_from('<HHHH', buf, part_4 + 0x10 + box_no * 8)
+        box = {}
+        box['timestamp'] = timestamp
+        box['box_no'] = box_no
+        box['x'] = x * 1.5
+        box['y'] = y * 1.5
+        box['w'] = w * 1.5
+        box['h'] = h * 1.5
+        telemetry['traffic_light_log'].append(box)
+
+register_private_decoder(0x0802, 0x0007, ['acce', 'gps_track'], __decode_bin_acce_gps)
+register_private_decoder(
+    0x0007, 0x0001, ['ascii_acce'], __decode_ascii_acce,
+    'ascii_acce', telemetry_columns.AsciiAcceLog
+)
+register_private_decoder(
+    0x0802, 0x0001, ['image_label'], __decode_image_label,
+    'image_label', telemetry_columns.ImageLabelLog
+)
+register_private_decoder(
+    0x0009, 0x0001, ['traffic_light'], __decode_traffic_light,
+    'traffic_light', telemetry_columns.TrafficLightLog
+)
+
+def __decode_bin_time(buf, pts: int, telemetry: dict) -> tuple:
+    """
+    Decode the time of a binary GPS/acce packet.
+
+    Same result as building a UTC datetime from the date fields and the
+    milliseconds from PTS, then common.adjust_tz(dt.timestamp()). Packets
+    in the same second share the date fields, so the epoch seconds and
+    timezone offset are kept in telemetry['time_memo'].
+
+    Returns
+    ----------
+    tuple(time, time_ms)
+    """
+    key = bytes(buf[0x24:0x32])
+    memo = telemetry['time_memo']
+    if memo[0] != key:
+        sec_time = __civil_to_epoch(
+            int.from_bytes(key[0x00:0x02], 'little'),
+            int.from_bytes(key[0x02:0x04], 'little'),
+            int.from_bytes(key[0x06:0x08], 'little'),
+            int.from_bytes(key[0x08:0x0A], 'little'),
+            int.from_bytes(key[0x0A:0x0C], 'little'),
+            int.from_bytes(key[0x0C:0x0E], 'little')
+        )
+        memo = (key, sec_time, sec_time - common.adjust_tz(sec_time))
+        telemetry['time_memo'] = memo
+    (key, sec_time, utc_offset) = memo
+    ms = int((pts / 90 - telemetry['seg_pts_start'] / 90) % 1000)
+    # Same float operations as datetime.timestamp(), for the same rounding
+    timestamp = (sec_time * 1000000 + ms * 1000) / 1000000 - utc_offset
+    return (int(timestamp), int(timestamp * 1000))
+
+def __civil_to_epoch(year: int, mon: int, day: int, hour: int, min: int, sec: int) -> int:
+    # Days from 1970-01-01 of a proleptic Gregorian date, without datetime
+    if (
+        (not 1 <= year <= 9999) or (not 1 <= mon <= 12) or
+        (not 1 <= day <= __days_in_month(year, mon)) or
+        (hour > 23) or (min > 59) or (sec > 59)
+    ):
+        raise ValueError('Invalid date %d-%d-%d %d:%d:%d' % (year, mon, day, hour, min, sec))
+    y = year - 1 if mon <= 2 else year
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (mon + (-3 if mon > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    days = era * 146097 + doe - 719468
+    return days * 86400 + hour * 3600 + min * 60 + sec
+
+def __days_in_month(year: int, mon: int) -> int:
+    if mon == 2:
+        return 29 if (year % 4 == 0) and ((year % 100 != 0) or (year % 400 == 0)) else 28
+    return 30 if mon in (4, 6, 9, 11) else 31
+
+def decode_bin_times(bufs: list, pts: list, seg_pts_start: int) -> tuple:
+    """
+    Decode times of many binary GPS/acce packets in one call.
+
+    Parameters
+    ----------
+    bufs: list
+        PES packet data after the 10 bytes PES_packet header, for each
+        0x0802/0x0007 packet.
+    pts: list
+        PTS of each packet.
+    seg_pts_start: int
+        SCRB of the first PS header in the segment.
+
+    Returns
+    ----------
+    tuple(time, time_ms)
+        Same as 'time' in gps_track and 'time_ms' in acce_log. Numpy
+        arrays when numpy is installed, otherwise lists.
+    """
+    if not has_numpy:
+        telemetry = {'seg_pts_start': seg_pts_start, 'time_memo': (None, 0, 0)}
+        times = [__decode_bin_time(buf, p, telemetry) for (buf, p) in zip(bufs, pts)]
+        return ([t[0] for t in times], [t[1] for t in times])
+
+    fields = np.frombuffer(
+        b''.join(bytes(buf[0x24:0x32]) for buf in bufs), dtype = bin_date_dtype
+    )
+    year = fields['year'].astype(np.int64)
+    mon = fields['mon'].astype(np.int64)
+    day = fields['day'].astype(np.int64)
+    days_in_month = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(mon, 1, 12) - 1]
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days_in_month = days_in_month + ((mon == 2) & leap)
+    if np.any(
+        (year < 1) | (year > 9999) | (mon < 1) | (mon > 12) | (day < 1) | (day > days_in_month) |
+        (fields['hour'] > 23) | (fields['min'] > 59) | (fields['sec'] > 59)
+    ):
+        raise ValueError('Invalid date in packets')
+    y = np.where(mon <= 2, year - 1, year)
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (mon + np.where(mon > 2, -3, 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    sec_time = (
+        (era * 146097 + doe - 719468) * 86400 +
+        fields['hour'].astype(np.int64) * 3600 +
+        fields['min'].astype(np.int64) * 60 +
+        fields['sec'].astype(np.int64)
+    )
+    utc_offset = sec_time - common.adjust_tz(sec_time)
+    ms = ((np.asarray(pts, dtype = np.float64) / 90 - seg_pts_start / 90) % 1000).astype(np.int64)
+    timestamp = (sec_time * 1000000 + ms * 1000) / 1000000 - utc_offset
+    return (timestamp.astype(np.int64), (timestamp * 1000).astype(np.int64))
+
+def __parse_ps(f, seg_start_pos: int, seg_end_pos: int, of, parse_options: dict, telemetry: dict):
+    """
+    Walk Program Stream in Seg 5 with file reads.
+
+    Only packet headers are read while walking. Bytes to export are
+    collected as ranges and copied in bulk after the walk.
+
+    Parameters
+    ----------
+    f: file
+        Opened hivXXXXX.mp4 file.
+    of: file
+        Video export file. None if video is not exported.
+    telemetry: dict
+        Decoding state of the segment. Decoded data is added to it.
+    """
+    decoders = telemetry['decoders']
+    stats = telemetry['stats']
+    (stream_packets, private_packets) = __get_packet_counters(stats)
+    ranges = []
+    keep_start = seg_start_pos
+    pos = seg_start_pos
+    f.seek(seg_start_pos)
+    while pos < seg_end_pos:
+        stream_head = f.read(6)
+        if stream_packets != None:
+            stream_packets[stream_head[3]] = stream_packets.get(stream_head[3], 0) + 1
+        if stream_head[3] == 0xBA:
+            # PS header
+            pos = pos + 20
+            f.seek(pos)
+            continue
+        # PES packet
+        pes_end = pos + 6 + int.from_bytes(stream_head[4:6], 'big')
+        if stream_head[3] == 0xBD:
+            # private_stream_1 is not exported
+            __add_range(ranges, keep_start, pos)
+            keep_start = pes_end
+            if (len(decoders) != 0) or (private_packets != None):
+                # PES_packet header and private_header
+                buf = f.read(22)
+                pkt_type = __get_pkt_type(buf, 10)
+                if private_packets != None:
+                    private_packets[pkt_type] = private_packets.get(pkt_type, 0) + 1
+                if pkt_type in decoders:
+                    pts = __decode_pts(buf, 3)
+                    buf = buf[10:] + f.read(pes_end - pos - 28)
+                    decoders[pkt_type](buf, pts, parse_options, telemetry)
+        pos = pes_end
+        f.seek(pos)
+    if of != None:
+        __add_range(ranges, keep_start, pos)
+        with __stage(stats, 'copy_video'):
+            __copy_ranges(f, of, ranges, stats)
+
+def __parse_ps_mmap(f, seg_start_pos: int, seg_end_pos: int, of, parse_options: dict, telemetry: dict):
+    """
+    Walk Program Stream in Seg 5 over a memory mapped file.
+
+    Packet headers are decoded in place, so no per packet read or copy is
+    needed. Parameters are the same as __parse_ps().
+    """
+    decoders = telemetry['decoders']
+    stats = telemetry['stats']
+    (stream_packets, private_packets) = __get_packet_counters(stats)
+    if stats != None:
+        stats.add('mapped_bytes', seg_end_pos - seg_start_pos)
+    ranges = []
+    keep_start = seg_start_pos
+    with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+        mv = memoryview(mm)
+        try:
+            pos = seg_start_pos
+            while pos < seg_end_pos:
+                stream_id = mv[pos + 3]
+                if stream_packets != None:
+                    stream_packets[stream_id] = stream_packets.get(stream_id, 0) + 1
+                if stream_id == 0xBA:
+                    # PS header
+                    pos = pos + 20
+                    continue
+                # PES packet
+                pes_end = pos + 6 + ((mv[pos + 4] << 8) | mv[pos + 5])
+                if stream_id == 0xBD:
+                    # private_stream_1 is not exported
+                    __add_range(ranges, keep_start, pos)
+                    keep_start = pes_end
+                    pkt_type = __get_pkt_type(mv, pos + 16)
+                    if private_packets != None:
+                        private_packets[pkt_type] = private_packets.get(pkt_type, 0) + 1
+                    if pkt_type in decoders:
+                        pts = __decode_pts(mv, pos + 9)
+                        # A copy, a view left in a decoder's traceback would
+                        # keep the map from closing
+                        decoders[pkt_type](bytes(mv[pos + 16 : pes_end]), pts, parse_options, telemetry)
+                pos = pes_end
+        finally:
+            mv.release()
+    if of != None:
+        __add_range(ranges, keep_start, pos)
+        with __stage(stats, 'copy_video'):
+            __copy_ranges(f, of, ranges, stats)
+
+def __parse_ps_pipelined(video_file_path: str, seg_start_pos: int, seg_end_pos: int, of, parse_options: dict, telemetry: dict):
+    """
+    Walk Program Stream in Seg 5 over chunks read ahead on a thread, and
+    write the exported bytes of walked chunks on another thread.
+
+    Reading the card, walking and writing the export overlap, instead of
+    copying after the walk. Memory is bounded by
+    parse_options['pipeline_memory']. Other parameters are the same as
+    __parse_ps().
+    """
+    import io_pipeline
+    decoders = telemetry['decoders']
+    stats = telemetry['stats']
+    (stream_packets, private_packets) = __get_packet_counters(stats)
+    if 'pipeline_memory' in parse_options:
+        memory = parse_options['pipeline_memory']
+    else:
+        memory = io_pipeline.default_memory
+    # The last packet may pass seg_end_pos, by one PES packet at most
+    ahead = io_pipeline.ReadAhead(video_file_path, seg_start_pos, seg_end_pos + 6 + 0xFFFF, memory)
+    behind = None
+    if of != None:
+        of.flush()
+        behind = io_pipeline.WriteBehind(of, ahead.release)
+    ranges = collections.deque()
+    keep_start = seg_start_pos
+    try:
+        pos = seg_start_pos
+        while pos < seg_end_pos:
+            stream_head = ahead.get(pos, 6)
+            if stream_packets != None:
+                stream_packets[stream_head[3]] = stream_packets.get(stream_head[3], 0) + 1
+            if stream_head[3] == 0xBA:
+                # PS header
+                pos = pos + 20
+                continue
+            # PES packet
+            pes_end = pos + 6 + ((stream_head[4] << 8) | stream_head[5])
+            if stream_head[3] == 0xBD:
+                # private_stream_1 is not exported
+                __add_range(ranges, keep_start, pos)
+                keep_start = pes_end
+                if (len(decoders) != 0) or (private_packets != None):
+                    # PES_packet header and private_header
+                    buf = ahead.get(pos + 6, 16)
+                    pkt_type = __get_pkt_type(buf, 10)
+                    if private_packets != None:
+                        private_packets[pkt_type] = private_packets.get(pkt_type, 0) + 1
+                    if pkt_type in decoders:
+                        pts = __decode_pts(buf, 3)
+                        decoders[pkt_type](ahead.get(pos + 16, pes_end - pos - 16), pts, parse_options, telemetry)
+            pos = pes_end
+            if pos >= ahead.first_end:
+                for chunk in ahead.pop_walked(pos):
+                    __write_chunk(ahead, behind, chunk, ranges, keep_start, stats)
+        __add_range(ranges, keep_start, pos)
+        for chunk in ahead.pop_walked():
+            __write_chunk(ahead, behind, chunk, ranges, None, stats)
+    finally:
+        try:
+            if behind != None:
+                behind.close()
+        finally:
+            ahead.close()
+
+def __write_chunk(ahead, behind, chunk: tuple, ranges, open_start: int, stats):
+    """
+    Queue the exported bytes of a walked chunk as one write, and release
+    it after.
+
+    Parameters
+    ----------
+    chunk: tuple
+        (pos, buf, mv) from io_pipeline.ReadAhead.pop_walked()
+    ranges: collections.deque
+        Closed ranges to export. Ranges done are removed.
+    open_start: int
+        Start of the range still being walked, past the chunk end. None
+        if there is none.
+    """
+    (chunk_pos, buf, mv) = chunk
+    chunk_end = chunk_pos + len(mv)
+    if stats != None:
+        stats.add_read(len(mv))
+    if behind == None:
+        ahead.release(buf)
+        return
+    if __is_muxer(behind.of):
+        # The muxer counts what it writes
+        stats = None
+    parts = []
+    while (len(ranges) != 0) and (ranges[0][0] < chunk_end):
+        (start, end) = ranges[0]
+        start = max(start, chunk_pos)
+        if min(end, chunk_end) > start:
+            parts.append(mv[start - chunk_pos : min(end, chunk_end) - chunk_pos])
+            if stats != None:
+                stats.add_write(min(end, chunk_end) - start)
+        if end > chunk_end:
+            break
+        ranges.popleft()
+    if (open_start != None) and (open_start < chunk_end):
+        start = max(open_start, chunk_pos)
+        parts.append(mv[start - chunk_pos :])
+        if stats != None:
+            stats.add_write(chunk_end - start)
+    behind.write_parts(parts, buf)
+
+def __add_range(ranges: list, start: int, end: int):
+    if end > start:
+        ranges.append((start, end))
+
+def __get_packet_counters(stats) -> tuple:
+    """
+    Packet counters of stats, filled while walking Seg 5.
+
+    Returns
+    ----------
+    tuple(stream_packets, private_packets)
+        Dicts of stats, or None if stats is None.
+    """
+    if stats == None:
+        return (None, None)
+    return (stats.stream_packets, stats.private_packets)
+
+def __get_stats(parse_options: dict):
+    """
+    pipeline_stats.get_stats(parse_options), importing pipeline_stats only
+    when stats are asked for.
+    """
+    if (parse_options == None) or ('stats' not in parse_options) or (not parse_options['stats']):
+        return None
+    import pipeline_stats
+    return pipeline_stats.get_stats(parse_options)
+
+def __stage(stats, name: str):
+    """
+    stats.stage(name), or a context doing nothing if stats is None.
+    """
+    if stats == None:
+        return contextlib.nullcontext()
+    return stats.stage(name)
+
+def __wrap_file(f, stats):
+    """
+    Count I/O of f into stats. f itself if stats is None.
+    """
+    if stats == None:
+        return f
+    import pipeline_stats
+    return pipeline_stats.wrap_file(f, stats)
+
+def __is_muxer(of) -> bool:
+    """
+    Whether of is an export_fmp4.Muxer. export_fmp4 is not imported for
+    it, one can only be made after export_fmp4 is.
+    """
+    export_fmp4 = sys.modules.get('export_fmp4')
+    return (export_fmp4 != None) and isinstance(of, export_fmp4.Muxer)
+
+def __count_indexed_packets(packets: dict, seg_start_pos: int, seg_end_pos: int, stats):
+    """
+    Count private_stream_1 packets in [seg_start_pos, seg_end_pos) from a
+    telemetry index, as Seg 5 is not walked.
+    """
+    for i in range(len(packets['offset'])):
+        if seg_start_pos <= packets['offset'][i] < seg_end_pos:
+            pkt_type = (packets['pkt_id'][i], packets['sub_pkt_id'][i])
+            stats.stream_packets[0xBD] = stats.stream_packets.get(0xBD, 0) + 1
+            stats.private_packets[pkt_type] = stats.private_packets.get(pkt_type, 0) + 1
+
+def __copy_ranges(f, of, ranges: list, stats = None):
+    """
+    Copy byte ranges of f to the end of of.
+
+    Uses os.copy_file_range() or os.sendfile() to copy inside the kernel
+    where available, and large buffered reads otherwise.
+
+    Parameters
+    ----------
+    f: file
+        Source file.
+    of: file
+        Destination file, written at its current position.
+    ranges: list
+        List of (start, end) in f.
+    stats: pipeline_stats.Stats
+        Count kernel copies and writes into it. Optional.
+    """
+    if __is_muxer(of):
+        # Remuxed in user space
+        for (start, end) in ranges:
+            f.seek(start)
+            pos = start
+            while pos < end:
+                buf = f.read(min(end - pos, 0x100000))
+                if len(buf) == 0:
+                    common.error('Failed to copy video data.')
+                of.write(buf)
+                pos = pos + len(buf)
+        return
+    of.flush()
+    in_fd = f.fileno()
+    out_fd = of.fileno()
+    out_pos = of.tell()
+    os.lseek(out_fd, out_pos, os.SEEK_SET)
+    method = 'copy_file_range' if hasattr(os, 'copy_file_range') else 'sendfile'
+    for (start, end) in ranges:
+        pos = start
+        while pos < end:
+            copied = 0
+            try:
+                if method == 'copy_file_range':
+                    copied = os.copy_file_range(in_fd, out_fd, end - pos, pos)
+                elif method == 'sendfile':
+                    copied = os.sendfile(out_fd, in_fd, pos, end - pos)
+            except (OSError, AttributeError):
+                # Not supported for these files, try the next method
+                method = 'sendfile' if method == 'copy_file_range' else 'read'
+                continue
+            if method == 'read':
+                os.lseek(out_fd, out_pos, os.SEEK_SET)
+                f.seek(pos)
+                buf = f.read(min(end - pos, 0x100000))
+                copied = os.write(out_fd, buf)
+            if copied <= 0:
+                common.error('Failed to copy video data.')
+            if stats != None:
+                stats.add_write(copied)
+            pos = pos + copied
+            out_pos = out_pos + copied
+    # Keep the file object in sync with the fd
+    of.seek(out_pos)
+
+def scan_private_stream_1(f, seg_info: dict, stats = None) -> dict:
+    """
+    Walk the whole Seg 5 of a segment once and record every
+    private_stream_1 packet.
+
+    Parameters
+    ----------
+    f: file
+        Opened hivXXXXX.mp4 file.
+    seg_info: dict
+        record_file_index['record_file_infos'][file_no]['seg_infos'][seg_no]
+    stats: pipeline_stats.Stats
+        Count mapped bytes into it. Optional.
+
+    Returns
+    ----------
+    packets: dict
+        See telemetry_index.new_packets()
+    """
+    import telemetry_index
+    packets = telemetry_index.new_packets()
+    if stats != None:
+        stats.add('mapped_bytes', seg_info['end_pos'] - seg_info['start_pos'] - 0x40000)
+    with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+        pos = seg_info['start_pos'] + 0x40000
+        seg_end_pos = seg_info['end_pos']
+        while pos < seg_end_pos:
+            stream_id = mm[pos + 3]
+            if stream_id == 0xBA:
+                # PS header
+                pos = pos + 20
+                continue
+            # PES packet
+            pes_end = pos + 6 + ((mm[pos + 4] << 8) | mm[pos + 5])
+            if stream_id == 0xBD:
+                packets['offset'].append(pos)
+                packets['length'].append(pes_end - pos)
+                packets['pts'].append(__decode_pts(mm, pos + 9))
+                packets['pkt_id'].append((mm[pos + 16] << 8) | mm[pos + 17])
+                packets['sub_pkt_id'].append((mm[pos + 20] << 8) | mm[pos + 21])
+            pos = pes_end
+    return packets
+
+def __parse_packets(f, packets: dict, seg_start_pos: int, seg_end_pos: int, parse_options: dict, telemetry: dict):
+    """
+    Decode private_stream_1 packets listed by scan_private_stream_1(),
+    instead of walking Program Stream.
+    """
+    import telemetry_index
+    decoders = telemetry['decoders']
+    for (pts, buf) in telemetry_index.read_packets(f, packets, seg_start_pos, seg_end_pos, set(decoders)):
+        decoders[__get_pkt_type(buf, 0)](buf, pts, parse_options, telemetry)
+
 def parse_video(
         sd_dir_path: str,
         video_segs: list,
@@ -282,39 +1150,100 @@ def parse_video(
         A dict containing various info.
     """
 
-    parse_video_result = {}
-    gps_info = {}
-    gps_data_num = 0
-    gps_track = []
-    acce_info = {}
-    acce_num = 0
-    acce_log = []
+    stats = __get_stats(parse_options)
+    if stats != None:
+        # One Stats for all segments
+        parse_options = dict(parse_options, stats = stats)
+
+    if __get_workers(parse_options) > 1:
+        with __new_pool(__get_workers(parse_options)) as pool:
+            futures = __submit_video(
+                pool, sd_dir_path, video_segs, record_file_index, parse_options
+            )
+            return __collect_video(futures, video_segs, record_file_index, parse_options)
 
     parse_seg_options = copy.deepcopy(parse_options)
     parse_seg_options['export_thumbnail'] = False
 
-    if parse_options['export_video']:
+    muxer = None
+    if parse_options['export_video'] and __is_fmp4(parse_options):
+        # One fragmented MP4 for all segments
+        import export_fmp4
+        muxer = export_fmp4.Muxer(
+            __wrap_file(open(parse_options['export_video_path'], 'wb'), stats),
+            __has_fmp4_telemetry(parse_options)
+        )
+        parse_seg_options['fmp4_muxer'] = muxer
+    elif parse_options['export_video']:
         # Create and clear video export file
         f = open(parse_options['export_video_path'], 'wb+')
         f.close()
         # Set to add to export video file
         parse_seg_options['export_video_adding'] = True
 
-    for segment in video_segs:
+    parse_seg_results = []
+    for (i, segment) in enumerate(video_segs):
         file_no = segment['file_no']
         seg_no = segment['seg_no']
         start_sec = segment['start']
         end_sec = segment['end']
 
+        if ('pipeline' in parse_options) and parse_options['pipeline'] and (i + 1 < len(video_segs)):
+            __prefetch_seg(sd_dir_path, video_segs[i + 1], record_file_index, parse_options)
         parse_seg_result = parse_seg(
             sd_dir_path, file_no, seg_no, record_file_index,
             parse_seg_options, start_sec, end_sec
         )
+        parse_seg_results.append(parse_seg_result)
+    if muxer != None:
+        muxer.close()
+
+    return __merge_seg_results(parse_seg_results, video_segs, stats)
+
+def __prefetch_seg(sd_dir_path: str, segment: dict, record_file_index: dict, parse_options: dict):
+    """
+    Have the OS read the start of a segment's Seg 5 while the segment
+    before it is parsed. Up to parse_options['pipeline_memory'] bytes.
+    """
+    import io_pipeline
+    seg_info = record_file_index['record_file_infos'][segment['file_no']]['seg_infos'][segment['seg_no']]
+    if 'pipeline_memory' in parse_options:
+        memory = parse_options['pipeline_memory']
+    else:
+        memory = io_pipeline.default_memory
+    # Seconds skipped at the start are not known before reading Seg 1
+    start = seg_info['start_pos'] + 0x40000
+    io_pipeline.will_need(
+        os.path.join(sd_dir_path, 'hiv%05d.mp4' % segment['file_no']),
+        start, min(memory, seg_info['end_pos'] - start)
+    )
+
+def __merge_seg_results(parse_seg_results: list, video_segs: list, stats = None) -> dict:
+    """
+    Merge parse_seg() results of a video in timeline order.
+    """
 
+    parse_video_result = {}
+    gps_info = {}
+    gps_data_num = 0
+    acce_info = {}
+    acce_num = 0
+    if (
+        (len(parse_seg_results) != 0) and
+        isinstance(parse_seg_results[0]['acce_info']['acce_log'], telemetry_columns.AcceLog)
+    ):
+        gps_track = telemetry_columns.GpsTrack()
+        acce_log = telemetry_columns.AcceLog()
+    else:
+        gps_track = []
+        acce_log = []
+
+    # Extend in place, adding lists copies the whole track for each segment
+    for parse_seg_result in parse_seg_results:
         gps_data_num = gps_data_num + parse_seg_result['gps_info']['gps_data_num']
-        gps_track = gps_track + parse_seg_result['gps_info']['gps_track']
+        gps_track.extend(parse_seg_result['gps_info']['gps_track'])
         acce_num = acce_num + parse_seg_result['acce_info']['acce_num']
-        acce_log = acce_log + parse_seg_result['acce_info']['acce_log']
+        acce_log.extend(parse_seg_result['acce_info']['acce_log'])
     
     gps_info['gps_data_num'] = gps_data_num
     gps_info['gps_track'] = gps_track
@@ -324,10 +1253,183 @@ def parse_video(
     acce_info['acce_log'] = acce_log
     parse_video_result['acce_info'] = acce_info
 
-    parse_video_result['parking'] = segment['parking']
+    # Each timestamp with the segment it is from
+    emergency_info = {}
+    emergency_video_timestamps = []
+    emergency_video_segs = []
+    for (parse_seg_result, segment) in zip(parse_seg_results, video_segs):
+        for t in parse_seg_result['emergency_info']['emergency_video_timestamps']:
+            emergency_video_timestamps.append(t)
+            emergency_video_segs.append({'file_no': segment['file_no'], 'seg_no': segment['seg_no']})
+    emergency_info['emergency_video_num'] = len(emergency_video_timestamps)
+    emergency_info['emergency_video_timestamps'] = emergency_video_timestamps
+    emergency_info['emergency_video_segs'] = emergency_video_segs
+    parse_video_result['emergency_info'] = emergency_info
+
+    # Logs of other private_stream_1 decoders
+    if len(parse_seg_results) != 0:
+        for entry in private_decoders.values():
+            log_name = entry['log_name']
+            if (log_name == None) or ((log_name + '_info') not in parse_seg_results[0]):
+                continue
+            log_num = 0
+            log = parse_seg_results[0][log_name + '_info'][log_name + '_log'].__class__()
+            for parse_seg_result in parse_seg_results:
+                log_num = log_num + parse_seg_result[log_name + '_info'][log_name + '_num']
+                log.extend(parse_seg_result[log_name + '_info'][log_name + '_log'])
+            log_info = {}
+            log_info[log_name + '_num'] = log_num
+            log_info[log_name + '_log'] = log
+            parse_video_result[log_name + '_info'] = log_info
+
+    parse_video_result['parking'] = video_segs[-1]['parking']
+    if stats != None:
+        parse_video_result['stats'] = stats.to_dict()
 
     return parse_video_result
 
+def __is_columnar(parse_options: dict) -> bool:
+    return ('columnar' in parse_options) and parse_options['columnar']
+
+def __is_fmp4(parse_options: dict) -> bool:
+    return ('export_format' in parse_options) and (parse_options['export_format'] == 'fmp4')
+
+def __has_fmp4_telemetry(parse_options: dict) -> bool:
+    return ('fmp4_telemetry' in parse_options) and parse_options['fmp4_telemetry']
+
+def __get_workers(parse_options: dict) -> int:
+    if 'workers' in parse_options:
+        return parse_options['workers']
+    else:
+        return 1
+
+def __init_worker(local_timezone):
+    # Spawned worker processes don't inherit common.set_timezone()
+    common.local_timezone = local_timezone
+
+def __new_pool(workers: int):
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers = workers,
+        initializer = __init_worker,
+        initargs = (common.local_timezone, )
+    )
+
+def __get_part_path(export_video_path: str, i: int) -> str:
+    return '%s.part%04d' % (export_video_path, i)
+
+def __submit_video(
+        pool,
+        sd_dir_path: str,
+        video_segs: list,
+        record_file_index: dict,
+        parse_options: dict
+    ) -> list:
+    """
+    Submit parse_seg() of each segment of a video to a worker pool.
+    Each segment exports to its own part file.
+
+    Returns
+    ----------
+    futures: list
+        Futures of parse_seg() results, in timeline order.
+    """
+
+    futures = []
+    for i in range(len(video_segs)):
+        futures.append(__submit_seg(pool, sd_dir_path, video_segs, i, record_file_index, parse_options))
+    return futures
+
+def __submit_seg(
+        pool,
+        sd_dir_path: str,
+        video_segs: list,
+        i: int,
+        record_file_index: dict,
+        parse_options: dict
+    ):
+    segment = video_segs[i]
+    parse_seg_options = __get_part_options(parse_options, i)
+    if ('stats' in parse_options) and parse_options['stats']:
+        # Counted in the worker, merged by __collect_video()
+        parse_seg_options['stats'] = True
+        parse_seg_options.pop('stats_callback', None)
+    return pool.submit(
+        parse_seg,
+        sd_dir_path, segment['file_no'], segment['seg_no'], record_file_index,
+        parse_seg_options, segment['start'], segment['end']
+    )
+
+def __get_part_options(parse_options: dict, i: int) -> dict:
+    """
+    parse_seg() options of the i-th segment of a video, exporting to its
+    own part file.
+    """
+    parse_seg_options = copy.deepcopy(parse_options)
+    parse_seg_options['export_thumbnail'] = False
+    parse_seg_options['workers'] = 1
+    if parse_options['export_video']:
+        parse_seg_options['export_video_path'] = __get_part_path(
+            parse_options['export_video_path'], i
+        )
+        parse_seg_options['export_video_adding'] = False
+        # Remuxed when joined
+        parse_seg_options['export_format'] = 'ps'
+    return parse_seg_options
+
+def __collect_video(futures: list, video_segs: list, record_file_index: dict, parse_options: dict) -> dict:
+    """
+    Wait for segments submitted by __submit_video(), then concatenate
+    part files to the export video file in timeline order.
+    """
+
+    parse_seg_results = [future.result() for future in futures]
+    stats = __get_stats(parse_options)
+    if stats != None:
+        for parse_seg_result in parse_seg_results:
+            stats.merge(parse_seg_result['stats'])
+    return __join_video(parse_seg_results, video_segs, record_file_index, parse_options, stats)
+
+def __join_video(
+        parse_seg_results: list,
+        video_segs: list,
+        record_file_index: dict,
+        parse_options: dict,
+        stats = None
+    ) -> dict:
+    """
+    Concatenate part files of parsed segments to the export video file,
+    and merge the results, in timeline order. Part files are remuxed with
+    export_format 'fmp4'.
+    """
+
+    if parse_options['export_video'] and __is_fmp4(parse_options):
+        import export_fmp4
+        export_video_path = parse_options['export_video_path']
+        muxer = export_fmp4.Muxer(
+            __wrap_file(open(export_video_path, 'wb'), stats),
+            __has_fmp4_telemetry(parse_options)
+        )
+        for (i, segment) in enumerate(video_segs):
+            seg_info = record_file_index['record_file_infos'][segment['file_no']]['seg_infos'][segment['seg_no']]
+            muxer.new_segment(seg_info['start_time'] + max(segment['start'], 0))
+            part_path = __get_part_path(export_video_path, i)
+            with open(part_path, 'rb') as part_file:
+                __copy_ranges(part_file, muxer, [(0, os.fstat(part_file.fileno()).st_size)])
+            os.remove(part_path)
+            if __has_fmp4_telemetry(parse_options):
+                export_fmp4.add_gps_track(muxer, parse_seg_results[i]['gps_info']['gps_track'])
+        muxer.close()
+    elif parse_options['export_video']:
+        export_video_path = parse_options['export_video_path']
+        with open(export_video_path, 'wb+') as of:
+            for i in range(len(video_segs)):
+                part_path = __get_part_path(export_video_path, i)
+                with open(part_path, 'rb') as part_file:
+                    __copy_ranges(part_file, of, [(0, os.fstat(part_file.fileno()).st_size)])
+                os.remove(part_path)
+
+    return __merge_seg_results(parse_seg_results, video_segs, stats)
+
 def parse_videos(
         sd_dir_path: str,
         videos: list,
@@ -357,11 +1459,26 @@ def parse_videos(
     parse_video_options['gps_track'] = parse_options['gps_track']
     parse_video_options['acce'] = parse_options['acce']
     parse_video_options['image_label'] = parse_options['image_label']
+    for key in ('ascii_acce', 'traffic_light'):
+        if key in parse_options:
+            parse_video_options[key] = parse_options[key]
+    if 'use_mmap' in parse_options:
+        parse_video_options['use_mmap'] = parse_options['use_mmap']
+    if 'telemetry_index_dir' in parse_options:
+        parse_video_options['telemetry_index_dir'] = parse_options['telemetry_index_dir']
+    if 'columnar' in parse_options:
+        parse_video_options['columnar'] = parse_options['columnar']
+    for key in ('pipeline', 'pipeline_memory', 'export_format', 'fmp4_telemetry', 'stats', 'stats_callback'):
+        if key in parse_options:
+            parse_video_options[key] = parse_options[key]
     have_filenames = (
         ('export_video_names' in parse_options) and
         (len(parse_options['export_video_names']) != 0)
     )
+    workers = __get_workers(parse_options)
+    offset_order = ('read_order' in parse_options) and (parse_options['read_order'] == 'offset')
     parse_videos_result = []
+    video_options = []
 
     for i in range(len(videos)):
         video = videos[i]
@@ -373,7 +1490,7 @@ def parse_videos(
                 seg_no = video[0]['seg_no']
                 file_info = record_file_index['record_file_infos'][file_no]
                 start = file_info['seg_infos'][seg_no]['start_time']
-                start = datetime.fromtimestamp(start, common.timezone)
+                start = datetime.fromtimestamp(start, common.local_timezone)
                 file_name = start.strftime('%Y%m%d%H%M%S.mp4')
                 file_path = os.path.join(
                     parse_options['export_videos_folder'],
@@ -387,12 +1504,142 @@ def parse_videos(
             parse_video_options['export_video_path'] = file_path
             parse_video_result['video_path'] = file_path
 
-        telemetry = parse_video(
-            sd_dir_path, video, record_file_index, parse_video_options
-        )
-
-        parse_video_result['telemetry'] = telemetry
+        if (workers > 1) or offset_order:
+            # Parse later in the worker pool or in read order
+            video_options.append(copy.deepcopy(parse_video_options))
+        else:
+            telemetry = parse_video(
+                sd_dir_path, video, record_file_index, parse_video_options
+            )
+            parse_video_result['telemetry'] = telemetry
 
         parse_videos_result.append(parse_video_result)
 
+    if (workers > 1) and offset_order:
+        # Submit segments of all videos in read order, collect them in
+        # timeline order
+        with __new_pool(workers) as pool:
+            video_futures = [[None] * len(video) for video in videos]
+            for (i, j) in __iter_read_order(sd_dir_path, videos, record_file_index, parse_options):
+                video_futures[i][j] = __submit_seg(
+                    pool, sd_dir_path, videos[i], j, record_file_index, video_options[i]
+                )
+            for i in range(len(videos)):
+                parse_videos_result[i]['telemetry'] = __collect_video(
+                    video_futures[i], videos[i], record_file_index, video_options[i]
+                )
+    elif workers > 1:
+        # Submit segments of all videos first, so that independent videos
+        # are parsed at the same time
+        with __new_pool(workers) as pool:
+            video_futures = []
+            for i in range(len(videos)):
+                video_futures.append(__submit_video(
+                    pool, sd_dir_path, videos[i], record_file_index, video_options[i]
+                ))
+            for i in range(len(videos)):
+                parse_videos_result[i]['telemetry'] = __collect_video(
+                    video_futures[i], videos[i], record_file_index, video_options[i]
+                )
+    elif offset_order:
+        # One Stats for each video, as parse_video() does
+        video_stats = [__get_stats(options) for options in video_options]
+        for i in range(len(videos)):
+            if video_stats[i] != None:
+                video_options[i]['stats'] = video_stats[i]
+        parse_seg_results = [[None] * len(video) for video in videos]
+        for (i, j) in __iter_read_order(sd_dir_path, videos, record_file_index, parse_options):
+            segment = videos[i][j]
+            parse_seg_results[i][j] = parse_seg(
+                sd_dir_path, segment['file_no'], segment['seg_no'], record_file_index,
+                __get_part_options(video_options[i], j), segment['start'], segment['end']
+            )
+        for i in range(len(videos)):
+            parse_videos_result[i]['telemetry'] = __join_video(
+                parse_seg_results[i], videos[i], record_file_index, video_options[i], video_stats[i]
+            )
+
     return parse_videos_result
+
+def __iter_read_order(sd_dir_path: str, videos: list, record_file_index: dict, parse_options: dict):
+    """
+    Iterate segments of all videos in file and offset order.
+
+    Yields
+    ----------
+    tuple(i, j)
+        Segment j of video i.
+    """
+    import read_schedule
+    segs = [(i, j) for i in range(len(videos)) for j in range(len(videos[i]))]
+    segments = [videos[i][j] for (i, j) in segs]
+    if 'read_ahead' in parse_options:
+        read_ahead = parse_options['read_ahead']
+    elif 'telemetry_index_dir' in parse_options:
+        # Only some packets are read
+        read_ahead = 0
+    else:
+        read_ahead = read_schedule.default_read_ahead
+    runs = read_schedule.plan(record_file_index, segments)
+    for k in read_schedule.iter_plan(sd_dir_path, record_file_index, segments, runs, read_ahead):
+        yield segs[k]
+
+def iter_telemetry(
+        sd_dir_path: str,
+        start_time: int,
+        end_time: int,
+        record_file_index: dict,
+        parse_options: dict
+    ):
+    """
+    Iterate GPS points and accelerometer data in a time range, without
+    holding the whole range in memory. Segments are parsed one by one, so
+    only one segment of data is kept at a time.
+
+    Parameters
+    ----------
+    start_time, end_time: int
+        Time range, same as parse_index.search().
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    parse_options: dict
+        See README.md
+
+    Yields
+    ----------
+    tuple(record_type, record)
+        ('gps', point) with point same as in gps_track, or ('acce', acce_data)
+        with acce_data same as in acce_log. Sorted by time. Points of
+        gps_track without a GPS packet are left out.
+    """
+
+    parse_seg_options = {}
+    parse_seg_options['export_video'] = False
+    parse_seg_options['export_thumbnail'] = False
+    parse_seg_options['gps_track'] = parse_options['gps_track']
+    parse_seg_options['acce'] = parse_options['acce']
+    parse_seg_options['image_label'] = parse_options['image_label']
+    if 'use_mmap' in parse_options:
+        parse_seg_options['use_mmap'] = parse_options['use_mmap']
+    if 'telemetry_index_dir' in parse_options:
+        parse_seg_options['telemetry_index_dir'] = parse_options['telemetry_index_dir']
+
+    for video in parse_index.search(record_file_index, start_time, end_time):
+        for segment in video:
+            parse_seg_result = parse_seg(
+                sd_dir_path, segment['file_no'], segment['seg_no'], record_file_index,
+                parse_seg_options, segment['start'], segment['end']
+            )
+            # Slots of the track not filled by a GPS packet keep time 0
+            gps_records = (
+                (point['time'] * 1000, 'gps', point)
+                for point in parse_seg_result['gps_info']['gps_track']
+                if point['time'] != 0
+            )
+            acce_records = (
+                (acce_data['time_ms'], 'acce', acce_data)
+                for acce_data in parse_seg_result['acce_info']['acce_log']
+            )
+            # GPS point first when at the same time
+            for (_, record_type, record) in heapq.merge(gps_records, acce_records, key = lambda x: x[0]):
+                yield (record_type, record)
@@ -0,0 +1,194 @@
+# Per-stage timing, I/O and packet counters of parsing and exporting
+
+import time
+import contextlib
+
+# I/O counters of a stage and of the whole run
+io_fields = ('bytes_read', 'bytes_written', 'read_calls', 'write_calls', 'seek_calls')
+
+class Stats:
+    """
+    Counters of a run, filled by the functions it is passed to.
+
+    A stage is a named part of the work, e.g. 'seg1' or 'copy_video'.
+    Stages can be nested, time and I/O of a stage include its inner
+    stages. Each stage keeps the number of calls, wall and CPU seconds,
+    and I/O counters. CPU seconds are of the whole process.
+    """
+
+    def __init__(self, callback = None):
+        """
+        Parameters
+        ----------
+        callback: function
+            callback(name, record), called when a stage ends. record has
+            the counters of this call of the stage only. Optional.
+        """
+        self.callback = callback
+        self.stages = {}
+        self.io = dict.fromkeys(io_fields, 0)
+        # Other counts, e.g. 'mapped_bytes' and 'geoid_transforms'
+        self.counters = {}
+        # Packets by stream_id, and private_stream_1 by (pkt_id, sub_pkt_id)
+        self.stream_packets = {}
+        self.private_packets = {}
+        # Records of the stages running, innermost last
+        self.running = []
+
+    def __deepcopy__(self, memo):
+        # Shared by copies of parse_options
+        return self
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Time a stage, and count I/O done in it.
+        """
+        record = dict.fromkeys(io_fields, 0)
+        self.running.append(record)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_sec'] = time.perf_counter() - wall_start
+            record['cpu_sec'] = time.process_time() - cpu_start
+            self.running.pop()
+            total = self.stages.setdefault(name, dict(dict.fromkeys(io_fields, 0), calls = 0, wall_sec = 0.0, cpu_sec = 0.0))
+            total['calls'] = total['calls'] + 1
+            for key in record:
+                total[key] = total[key] + record[key]
+            if self.callback != None:
+                self.callback(name, record)
+
+    def add_io(self, key: str, n: int):
+        """
+        Add n to I/O counter key of the run and all running stages.
+        """
+        self.io[key] = self.io[key] + n
+        for record in self.running:
+            record[key] = record[key] + n
+
+    def add_read(self, n: int, calls: int = 1):
+        self.add_io('bytes_read', n)
+        self.add_io('read_calls', calls)
+
+    def add_write(self, n: int, calls: int = 1):
+        self.add_io('bytes_written', n)
+        self.add_io('write_calls', calls)
+
+    def add(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, stats_dict: dict):
+        """
+        Add counters from to_dict() of another Stats, e.g. of a worker
+        process. Running stages are not changed.
+        """
+        for (name, record) in stats_dict['stages'].items():
+            total = self.stages.setdefault(name, dict(dict.fromkeys(record, 0), wall_sec = 0.0, cpu_sec = 0.0))
+            for key in record:
+                total[key] = total[key] + record[key]
+        for key in io_fields:
+            self.io[key] = self.io[key] + stats_dict['io'][key]
+        for (name, n) in stats_dict['counters'].items():
+            self.add(name, n)
+        for (key, n) in stats_dict['stream_packets'].items():
+            stream_id = int(key, 16)
+            self.stream_packets[stream_id] = self.stream_packets.get(stream_id, 0) + n
+        for (key, n) in stats_dict['private_packets'].items():
+            pkt_type = tuple(int(part, 16) for part in key.split('/'))
+            self.private_packets[pkt_type] = self.private_packets.get(pkt_type, 0) + n
+
+    def to_dict(self) -> dict:
+        """
+        Copy of the counters, with hex string keys for packets so that it
+        can be saved as JSON. See README.md
+        """
+        stats_dict = {}
+        stats_dict['stages'] = {name: dict(record) for (name, record) in self.stages.items()}
+        stats_dict['io'] = dict(self.io)
+        stats_dict['counters'] = dict(self.counters)
+        stats_dict['stream_packets'] = {
+            '0x%02X' % stream_id: n for (stream_id, n) in sorted(self.stream_packets.items())
+        }
+        stats_dict['private_packets'] = {
+            '0x%04X/0x%04X' % pkt_type: n for (pkt_type, n) in sorted(self.private_packets.items())
+        }
+        return stats_dict
+
+class CountingFile:
+    """
+    File object wrapper counting reads, writes and seeks into a Stats.
+    Calls of the file object are counted, a buffered file may make fewer
+    system calls.
+    """
+
+    def __init__(self, f, stats: Stats):
+        self.f = f
+        self.stats = stats
+
+    def read(self, n: int = -1) -> bytes:
+        buf = self.f.read(n)
+        self.stats.add_read(len(buf))
+        return buf
+
+    def readinto(self, b) -> int:
+        n = self.f.readinto(b)
+        self.stats.add_read(n)
+        return n
+
+    def write(self, b) -> int:
+        n = self.f.write(b)
+        self.stats.add_write(n)
+        return n
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        self.stats.add_io('seek_calls', 1)
+        return self.f.seek(pos, whence)
+
+    def tell(self) -> int:
+        return self.f.tell()
+
+    def fileno(self) -> int:
+        return self.f.fileno()
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+#===========================================
+
+def get_stats(options: dict):
+    """
+    Get the Stats of parse_options['stats'].
+
+    Returns
+    ----------
+    stats: Stats
+        options['stats'] if it is a Stats, a new Stats with
+        options['stats_callback'] if it is True, otherwise None.
+    """
+    if (options == None) or ('stats' not in options) or (not options['stats']):
+        return None
+    if isinstance(options['stats'], Stats):
+        return options['stats']
+    return Stats(options['stats_callback'] if 'stats_callback' in options else None)
+
+def stage(stats: Stats, name: str):
+    """
+    stats.stage(name), or a context doing nothing if stats is None.
+    """
+    if stats == None:
+        return contextlib.nullcontext()
+    return stats.stage(name)
+
+def wrap_file(f, stats: Stats):
+    """
+    Count I/O of f into stats. f itself if stats is None.
+    """
+    if stats == None:
+        return f
+    return CountingFile(f, stats)
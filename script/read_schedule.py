@@ -0,0 +1,94 @@
+# Physical read order of a batch of segments, for cards where seeking is slow
+
+import os
+
+import io_pipeline
+
+# Segments closer than this in a file are read as one run
+run_gap = 0x100000
+
+# Bytes of a run the OS is asked to read ahead of the segment being parsed
+default_read_ahead = 0x4000000
+
+#===========================================
+
+def plan(record_file_index: dict, segments: list) -> list:
+    """
+    Plan the order to read segments in, by file and offset. Adjacent
+    segments of a file are coalesced into runs.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    segments: list
+        Segments as in parse_index.search()[], in any order.
+
+    Returns
+    ----------
+    runs: list
+        Runs in reading order. Each run is a dict of 'file_no', 'start'
+        and 'end' byte positions, and 'items', the indexes of its
+        segments in segments, in offset order.
+    """
+
+    positions = []
+    for (i, segment) in enumerate(segments):
+        seg_info = record_file_index['record_file_infos'][segment['file_no']]['seg_infos'][segment['seg_no']]
+        positions.append((segment['file_no'], seg_info['start_pos'], seg_info['end_pos'], i))
+    positions.sort()
+
+    runs = []
+    for (file_no, start, end, i) in positions:
+        if (len(runs) != 0) and (runs[-1]['file_no'] == file_no) and (start - runs[-1]['end'] <= run_gap):
+            run = runs[-1]
+            run['end'] = max(run['end'], end)
+        else:
+            run = {'file_no': file_no, 'start': start, 'end': end, 'items': []}
+            runs.append(run)
+        run['items'].append(i)
+    return runs
+
+def iter_plan(
+        sd_dir_path: str,
+        record_file_index: dict,
+        segments: list,
+        runs: list,
+        read_ahead: int = default_read_ahead
+    ):
+    """
+    Iterate segments in the order of plan(). Before each segment, the OS
+    is asked to read the run ahead, up to read_ahead bytes past the start
+    of the segment, so a run is read in large sequential requests.
+
+    Parameters
+    ----------
+    segments: list
+        Same as given to plan().
+    runs: list
+        From plan().
+    read_ahead: int
+        0 means no read ahead.
+
+    Yields
+    ----------
+    i: int
+        Index of a segment in segments.
+    """
+
+    for run in runs:
+        video_file_path = os.path.join(sd_dir_path, 'hiv%05d.mp4' % run['file_no'])
+        # End of the range already asked for
+        asked_end = run['start']
+        for i in run['items']:
+            segment = segments[i]
+            seg_info = record_file_index['record_file_infos'][segment['file_no']]['seg_infos'][segment['seg_no']]
+            ahead_end = min(run['end'], seg_info['start_pos'] + read_ahead)
+            # Ask in steps of half read_ahead, not for each segment
+            if (read_ahead > 0) and (ahead_end > asked_end) and (
+                (ahead_end - asked_end >= read_ahead // 2) or (ahead_end == run['end'])
+            ):
+                ahead_start = max(asked_end, seg_info['start_pos'])
+                io_pipeline.will_need(video_file_path, ahead_start, ahead_end - ahead_start)
+                asked_end = ahead_end
+            yield i
@@ -0,0 +1,281 @@
+# Grid index of GPS points, to find footage near a location
+
+import array
+import math
+import os
+import pickle
+
+import parse_index
+import parse_video
+
+# Bump when the index content changes
+index_version = 1
+
+# Grid cell size, in degrees. About 1 km for latitude.
+default_cell_deg = 0.01
+
+# Mean earth radius, m
+earth_radius = 6371008.8
+
+#===========================================
+
+def build(
+    sd_dir_path: str, record_file_index: dict,
+    use_seg1: bool = False,
+    parse_options: dict = None,
+    cell_deg: float = default_cell_deg
+) -> dict:
+    """
+    Build a grid index of GPS points of all video segments.
+
+    Parameters
+    ----------
+    record_file_index: dict
+        Index returned by parse_index.parse()
+    use_seg1: bool
+        Use positions in the Seg 1 per second table, which only needs one
+        read for each segment, instead of GPS packets in Seg 5.
+    parse_options: dict
+        'use_mmap' and 'telemetry_index_dir' are passed to
+        parse_video.parse_seg(). Optional.
+    cell_deg: float
+        Grid cell size, in degrees.
+
+    Returns
+    ----------
+    spatial_index: dict
+        Used by query_bbox() and query_radius().
+    """
+
+    parse_seg_options = {}
+    parse_seg_options['export_video'] = False
+    parse_seg_options['export_thumbnail'] = False
+    parse_seg_options['gps_track'] = True
+    parse_seg_options['acce'] = False
+    parse_seg_options['image_label'] = False
+    parse_seg_options['columnar'] = True
+    if parse_options != None:
+        for key in ('use_mmap', 'telemetry_index_dir'):
+            if key in parse_options:
+                parse_seg_options[key] = parse_options[key]
+
+    spatial_index = {}
+    spatial_index['version'] = index_version
+    spatial_index['cell'] = int(cell_deg * 360000)
+    points = {}
+    for name in ('lat', 'lon', 'file_no', 'seg_no', 'sec'):
+        points[name] = array.array('l')
+    points['time'] = array.array('q')
+    spatial_index['points'] = points
+    spatial_index['cells'] = {}
+
+    for file_info in record_file_index['record_file_infos']:
+        if file_info['file_type'] != 'video':
+            continue
+        file_no = file_info['file_no']
+        for seg_info in file_info['seg_infos']:
+            seg_no = seg_info['seg_no']
+            if use_seg1:
+                seg1 = parse_video.parse_seg1(sd_dir_path, file_no, seg_no, record_file_index)
+                columns = {name: list(seg1[name]) for name in ('time', 'valid', 'lat', 'lon')}
+            else:
+                gps_track = parse_video.parse_seg(
+                    sd_dir_path, file_no, seg_no, record_file_index, parse_seg_options
+                )['gps_info']['gps_track']
+                columns = {name: gps_track.columns[name] for name in ('time', 'valid', 'lat', 'lon')}
+            if seg_info['video_type'] == 'parking':
+                # All points are the same in parking mode
+                columns = {name: columns[name][:1] for name in columns}
+            for sec in range(len(columns['time'])):
+                lat = int(columns['lat'][sec])
+                lon = int(columns['lon'][sec])
+                if (not columns['valid'][sec]) or ((lat == 0) and (lon == 0)):
+                    continue
+                __add_point(spatial_index, lat, lon, file_no, seg_no, sec, int(columns['time'][sec]))
+
+    return spatial_index
+
+def save(spatial_index: dict, file_path: str):
+    """
+    Save an index from build() to a file.
+    """
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        pickle.dump(spatial_index, f, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, file_path)
+
+def load(file_path: str):
+    """
+    Load an index saved by save(). None if the file is missing or made
+    by another version.
+    """
+    if not os.path.isfile(file_path):
+        return None
+    with open(file_path, 'rb') as f:
+        spatial_index = pickle.load(f)
+    if spatial_index['version'] != index_version:
+        return None
+    return spatial_index
+
+def query_bbox(spatial_index: dict, lat_min: float, lon_min: float, lat_max: float, lon_max: float) -> list:
+    """
+    Find GPS points in a bounding box.
+
+    Parameters
+    ----------
+    lat_min, lon_min, lat_max, lon_max: float
+        Bounding box in degrees, south and west are negative. A box
+        crossing the 180th meridian has lon_min > lon_max, e.g. 170 to
+        -170, or longitudes past 180, e.g. 170 to 190.
+
+    Returns
+    ----------
+    hits: list
+        Points sorted by time. See README.md
+    """
+    lat_min = int(math.floor(lat_min * 360000))
+    lat_max = int(math.ceil(lat_max * 360000))
+    points = spatial_index['points']
+    hits = []
+    # Split at the 180th meridian
+    for (lon_min, lon_max) in __split_lon(lon_min, lon_max):
+        lon_min = int(math.floor(lon_min * 360000))
+        lon_max = int(math.ceil(lon_max * 360000))
+        for i in __get_candidates(spatial_index, lat_min, lon_min, lat_max, lon_max):
+            if (
+                (lat_min <= points['lat'][i] <= lat_max) and
+                (lon_min <= points['lon'][i] <= lon_max)
+            ):
+                hits.append(__get_hit(spatial_index, i))
+    hits.sort(key = lambda x: x['time'])
+    return hits
+
+def query_radius(spatial_index: dict, lat: float, lon: float, radius: float) -> list:
+    """
+    Find GPS points within a distance of a location.
+
+    Parameters
+    ----------
+    lat, lon: float
+        Location in degrees, south and west are negative.
+    radius: float
+        Distance in meters.
+
+    Returns
+    ----------
+    hits: list
+        Points sorted by time, with 'distance' in meters. See README.md
+        The circle may cross the 180th meridian.
+    """
+    # Bounding box of the circle
+    d_lat = math.degrees(radius / earth_radius)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    d_lon = min(math.degrees(radius / (earth_radius * cos_lat)), 180)
+    hits = []
+    for hit in query_bbox(spatial_index, lat - d_lat, lon - d_lon, lat + d_lat, lon + d_lon):
+        distance = __get_distance(lat, lon, hit['lat'], hit['lon'])
+        if distance <= radius:
+            hit['distance'] = distance
+            hits.append(hit)
+    return hits
+
+def hits_to_videos(hits: list, record_file_index: dict, padding_sec: int = 10) -> list:
+    """
+    Get videos around hits, to be parsed by parse_video.parse_videos().
+
+    Parameters
+    ----------
+    hits: list
+        From query_bbox() or query_radius().
+    padding_sec: int
+        Seconds of video to keep before and after each hit. Hits closer
+        than this are in the same video.
+
+    Returns
+    ----------
+    search_result: list
+        Same as parse_index.search(). See README.md
+    """
+    periods = []
+    for hit in sorted(hits, key = lambda x: x['time']):
+        start_time = hit['time'] - padding_sec
+        end_time = hit['time'] + padding_sec
+        if (len(periods) != 0) and (start_time <= periods[-1][1]):
+            periods[-1] = (periods[-1][0], max(periods[-1][1], end_time))
+        else:
+            periods.append((start_time, end_time))
+    search_index = parse_index.build_search_index(record_file_index)
+    search_result = []
+    for videos in parse_index.search_many(search_index, periods):
+        search_result = search_result + videos
+    return search_result
+
+def __split_lon(lon_min: float, lon_max: float) -> list:
+    """
+    Split a longitude range into ranges within [-180, 180].
+    """
+    if lon_min > lon_max:
+        # Crossing the 180th meridian eastward
+        lon_max = lon_max + 360
+    if lon_max - lon_min >= 360:
+        return [(-180, 180)]
+    # Move the start into [-180, 180)
+    shift = math.floor((lon_min + 180) / 360) * 360
+    (lon_min, lon_max) = (lon_min - shift, lon_max - shift)
+    if lon_max <= 180:
+        return [(lon_min, lon_max)]
+    return [(lon_min, 180), (-180, lon_max - 360)]
+
+def __get_cell(spatial_index: dict, lat: int, lon: int) -> tuple:
+    cell = spatial_index['cell']
+    return (lat // cell, lon // cell)
+
+def __add_point(spatial_index: dict, lat: int, lon: int, file_no: int, seg_no: int, sec: int, t: int):
+    points = spatial_index['points']
+    i = len(points['time'])
+    points['lat'].append(lat)
+    points['lon'].append(lon)
+    points['file_no'].append(file_no)
+    points['seg_no'].append(seg_no)
+    points['sec'].append(sec)
+    points['time'].append(t)
+    cells = spatial_index['cells']
+    cell = __get_cell(spatial_index, lat, lon)
+    if cell not in cells:
+        cells[cell] = array.array('L')
+    cells[cell].append(i)
+
+def __get_candidates(spatial_index: dict, lat_min: int, lon_min: int, lat_max: int, lon_max: int):
+    (cell_lat_min, cell_lon_min) = __get_cell(spatial_index, lat_min, lon_min)
+    (cell_lat_max, cell_lon_max) = __get_cell(spatial_index, lat_max, lon_max)
+    cells = spatial_index['cells']
+    if (cell_lat_max - cell_lat_min + 1) * (cell_lon_max - cell_lon_min + 1) > len(cells):
+        # Large box, visiting used cells is cheaper
+        for cell in cells:
+            if (cell_lat_min <= cell[0] <= cell_lat_max) and (cell_lon_min <= cell[1] <= cell_lon_max):
+                yield from cells[cell]
+        return
+    for cell_lat in range(cell_lat_min, cell_lat_max + 1):
+        for cell_lon in range(cell_lon_min, cell_lon_max + 1):
+            if (cell_lat, cell_lon) in cells:
+                yield from cells[(cell_lat, cell_lon)]
+
+def __get_hit(spatial_index: dict, i: int) -> dict:
+    points = spatial_index['points']
+    hit = {}
+    hit['file_no'] = points['file_no'][i]
+    hit['seg_no'] = points['seg_no'][i]
+    hit['sec'] = points['sec'][i]
+    hit['time'] = points['time'][i]
+    hit['lat'] = points['lat'][i] / 360000
+    hit['lon'] = points['lon'][i] / 360000
+    return hit
+
+def __get_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    # Haversine distance, m
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * earth_radius * math.asin(min(1, math.sqrt(a)))
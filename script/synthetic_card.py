@@ -0,0 +1,544 @@
+# Generate a synthetic SD card with the documented file structures
+
+import calendar
+import os
+import random
+import struct
+from datetime import datetime, timezone
+
+# See make_card()
+default_card_options = {
+    'file_num': 8,
+    'file_size': 0x4000000,
+    'seg_sec': (60, 300),
+    'parking_ratio': 0.2,
+    'trip_seg_num': (1, 6),
+    'trip_gap_sec': (600, 36000),
+    'emergency_ratio': 0.05,
+    'recognition_ratio': 0.02,
+    'fps': 30,
+    'parking_fps': 1,
+    'video_rate': 0x100000,
+    'photo_seg_num': 4,
+    'photo_num': 8,
+    'photo_len': 0x40000,
+    'log_num': 1000,
+    'start_time': calendar.timegm((2024, 3, 9, 8, 0, 0)),
+    'lat': 37.5,
+    'lon': -122.3,
+    'seed': 0
+}
+
+# HEVC nal_unit_type of parameter sets
+hevc_vps = 32
+hevc_sps = 33
+hevc_pps = 34
+
+# Largest data of a video PES packet
+video_pes_max = 0xFFE0
+
+# Audio is AAC LC, 16 kHz mono, in ADTS frames of this many bytes
+audio_frame_len = 0x100
+audio_sample_rate = 16000
+
+#===========================================
+
+def make_card(sd_dir_path: str, card_options: dict = None) -> dict:
+    """
+    Write index00.bin, hivXXXXX.mp4 files and log.bin of a synthetic SD
+    card. Video and audio are HEVC and ADTS AAC streams with filler
+    data, image data are filler bytes, everything else follows docs/.
+
+    Parameters
+    ----------
+    sd_dir_path: str
+        Output folder. Created if not exists.
+    card_options: dict
+        See README.md. Missing options are taken from default_card_options.
+
+    Returns
+    ----------
+    card_info: dict
+        Number of files, segments, seconds and bytes written.
+    """
+
+    options = dict(default_card_options)
+    if card_options != None:
+        options.update(card_options)
+    if options['file_size'] >= (1 << 32) - 0x40000:
+        raise ValueError('file_size should be less than 4 GiB.')
+    os.makedirs(sd_dir_path, exist_ok = True)
+    rnd = random.Random(options['seed'])
+
+    card_info = {'file_num': options['file_num'] + 1, 'seg_num': 0, 'sec_num': 0, 'bytes': 0}
+    state = {}
+    state['time'] = options['start_time']
+    state['trip_left'] = rnd.randint(*options['trip_seg_num'])
+    state['lat'] = options['lat']
+    state['lon'] = options['lon']
+    state['logs'] = []
+    __add_log(state, state['time'] - 2, 0x00100001, b'power:protection line')
+    __add_log(state, state['time'] - 1, 0x00010001, __version_log())
+
+    # The photo file is file 0, video files follow
+    file_records = []
+    seg_records = []
+    (file_record, records, file_len) = __write_photo_file(sd_dir_path, 0, options, rnd, state)
+    file_records.append(file_record)
+    seg_records.append(records)
+    card_info['bytes'] = card_info['bytes'] + file_len
+    for file_no in range(1, options['file_num'] + 1):
+        last = (file_no == options['file_num'])
+        (file_record, records, file_len, sec_num) = __write_video_file(
+            sd_dir_path, file_no, last, options, rnd, state
+        )
+        file_records.append(file_record)
+        seg_records.append(records)
+        card_info['seg_num'] = card_info['seg_num'] + len(records)
+        card_info['sec_num'] = card_info['sec_num'] + sec_num
+        card_info['bytes'] = card_info['bytes'] + file_len
+    __add_log(state, state['time'], 0x000C0001, b'Low power[1290]')
+
+    __write_index(sd_dir_path, file_records, seg_records, options)
+    __write_log(sd_dir_path, state['logs'][-options['log_num']:] if options['log_num'] > 0 else [])
+    return card_info
+
+def __write_index(sd_dir_path: str, file_records: list, seg_records: list, options: dict):
+    file_num = len(file_records)
+    buf = bytearray(0x500 + file_num * (0x20 + 0x5000))
+    # Seg 1
+    buf[0x0C:0x0E] = file_num.to_bytes(2, 'little')
+    buf[0x30:0x32] = (file_num - 1).to_bytes(2, 'little')
+    buf[0x60:0x62] = (0).to_bytes(2, 'little')
+    buf[0x62:0x64] = (options['photo_seg_num'] - 1).to_bytes(2, 'little')
+    for file_no in range(file_num):
+        # Seg 3
+        pos = 0x500 + file_no * 0x20
+        buf[pos : pos + 0x20] = file_records[file_no]
+        # Seg 4
+        pos = 0x500 + file_num * 0x20 + file_no * 0x5000
+        for (seg_no, record) in enumerate(seg_records[file_no]):
+            buf[pos + seg_no * 0x50 : pos + (seg_no + 1) * 0x50] = record
+    with open(os.path.join(sd_dir_path, 'index00.bin'), 'wb') as f:
+        f.write(buf)
+
+def __write_photo_file(sd_dir_path: str, file_no: int, options: dict, rnd: random.Random, state: dict) -> tuple:
+    file_record = bytearray(0x20)
+    file_record[0x00:0x04] = file_no.to_bytes(4, 'little')
+    file_record[0x10:0x12] = (2).to_bytes(2, 'little')
+    records = []
+    with open(os.path.join(sd_dir_path, 'hiv%05d.mp4' % file_no), 'wb') as f:
+        t = state['time'] - 60 * options['photo_seg_num'] * options['photo_num']
+        for seg_no in range(options['photo_seg_num']):
+            seg_start = f.tell()
+            photos = bytearray()
+            seg1 = bytearray()
+            seg2 = bytearray()
+            times = []
+            for photo_no in range(options['photo_num']):
+                t = t + rnd.randint(1, 60)
+                times.append(t)
+                photo = b'\xFF\xD8' + bytes([photo_no & 0xFF]) * (options['photo_len'] - 4) + b'\xFF\xD9'
+                thumb = b'\xFF\xD8' + b'\x01' * 0x1000 + b'\xFF\xD9'
+                data_len = (len(photo) + len(thumb) + 0xFFFF) // 0x10000 * 0x10000
+                seg1 += b'\x78\x56\x03\x00' + struct.pack('<III', t, len(photos), data_len)
+                seg1 += bytes(24) + struct.pack('<II', len(photo), len(thumb))
+                reason = 0x67 if rnd.random() < 0.5 else 0x03
+                seg2 += b'\x78\x56' + struct.pack('<HI', reason, t) + bytes(8)
+                photos += photo + thumb + bytes(data_len - len(photo) - len(thumb))
+            header = bytearray(0x40000)
+            header[0x00000:0x00020] = __private_stream_2_header(len(seg1), 0x01, len(photos), times[-1])
+            header[0x00020 : 0x00020 + len(seg1)] = seg1
+            header[0x10000:0x10020] = __private_stream_2_header(len(seg2), 0x02)
+            header[0x10020 : 0x10020 + len(seg2)] = seg2
+            header[0x20000:0x20020] = __private_stream_2_header(0, 0x04)
+            header[0x3E000:0x3E020] = __private_stream_2_header(0, 0x07)
+            f.write(header)
+            f.write(photos)
+            record = bytearray(0x50)
+            record[0x00] = 2
+            record[0x08:0x0C] = times[0].to_bytes(4, 'little')
+            record[0x10:0x14] = times[-1].to_bytes(4, 'little')
+            record[0x28:0x2C] = (seg_start + 0x40000).to_bytes(4, 'little')
+            record[0x2C:0x30] = f.tell().to_bytes(4, 'little')
+            records.append(record)
+        file_len = f.tell()
+    return (file_record, records, file_len)
+
+def __private_stream_2_header(body_len: int, flag: int, data_len: int = 0, t: int = 0) -> bytes:
+    header = bytearray(0x20)
+    header[0x00:0x04] = b'\x00\x00\x01\xBF'
+    header[0x04:0x06] = (0xFF8F).to_bytes(2, 'big')
+    header[0x0C:0x10] = data_len.to_bytes(4, 'little')
+    header[0x14:0x18] = t.to_bytes(4, 'little')
+    header[0x1C:0x1E] = body_len.to_bytes(2, 'little')
+    header[0x1E] = flag
+    return bytes(header)
+
+def __write_video_file(
+        sd_dir_path: str, file_no: int, last: bool,
+        options: dict, rnd: random.Random, state: dict
+    ) -> tuple:
+    file_record = bytearray(0x20)
+    file_record[0x00:0x04] = file_no.to_bytes(4, 'little')
+    file_record[0x04:0x06] = (0 if last else 1).to_bytes(2, 'little')
+    if last:
+        file_record[0x10:0x12] = (2).to_bytes(2, 'little')
+    elif rnd.random() < options['emergency_ratio']:
+        file_record[0x10:0x12] = (1).to_bytes(2, 'little')
+    records = []
+    sec_num = 0
+    with open(os.path.join(sd_dir_path, 'hiv%05d.mp4' % file_no), 'wb') as f:
+        while (f.tell() < options['file_size']) and (len(records) < 0x100):
+            parking = (rnd.random() < options['parking_ratio'])
+            fps = options['parking_fps'] if parking else options['fps']
+            seg_sec = rnd.randint(*options['seg_sec'])
+            # Keep the file around file_size
+            rate = options['video_rate'] // (10 if parking else 1)
+            seg_sec = max(1, min(seg_sec, (options['file_size'] - f.tell()) // max(rate, 1) + 1))
+            if state['trip_left'] == 0:
+                __next_trip(options, rnd, state)
+            state['trip_left'] = state['trip_left'] - 1
+            if parking:
+                __add_log(state, state['time'], 0x00090001, b'PARKING ENTER')
+            seg_start = f.tell()
+            __write_video_seg(f, seg_start, state['time'], seg_sec, fps, parking, options, rnd, state)
+            if parking:
+                __add_log(state, state['time'] + seg_sec, 0x00090001, b'PARKING EXIT')
+            record = bytearray(0x50)
+            record[0x04:0x08] = (0x00 if parking else 0x13).to_bytes(4, 'little')
+            record[0x08:0x0C] = state['time'].to_bytes(4, 'little')
+            record[0x10:0x14] = (state['time'] + seg_sec - 1).to_bytes(4, 'little')
+            record[0x28:0x2C] = (seg_start + 0x40000).to_bytes(4, 'little')
+            record[0x2C:0x30] = f.tell().to_bytes(4, 'little')
+            record[0x31] = fps
+            records.append(record)
+            state['time'] = state['time'] + seg_sec
+            sec_num = sec_num + seg_sec
+        file_len = f.tell()
+    file_record[0x06:0x08] = (len(records) - 1).to_bytes(2, 'little')
+    return (file_record, records, file_len, sec_num)
+
+def __next_trip(options: dict, rnd: random.Random, state: dict):
+    # Power off, a gap, then power on
+    __add_log(state, state['time'], 0x000C0001, b'Low power[%d]' % rnd.randint(1250, 1299))
+    state['time'] = state['time'] + rnd.randint(*options['trip_gap_sec'])
+    __add_log(state, state['time'] - 2, 0x00100001, b'power:protection line')
+    __add_log(state, state['time'] - 1, 0x00010001, __version_log())
+    if rnd.random() < 0.1:
+        t = datetime.fromtimestamp(state['time'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        __add_log(state, state['time'], 0x00090003, ('GPS %s to %s\n' % (t, t)).encode())
+    state['trip_left'] = rnd.randint(*options['trip_seg_num'])
+
+def __write_video_seg(
+        f, seg_start: int, start_time: int, seg_sec: int, fps: int, parking: bool,
+        options: dict, rnd: random.Random, state: dict
+    ):
+    # Seg 5 first, tables are written after it
+    f.seek(seg_start + 0x40000)
+    frame_len = max(1, options['video_rate'] // (10 if parking else 1) // fps)
+    # Frame data without the PTS of its first PES packet
+    key_frame = __video_frame(frame_len, True)
+    other_frame = __video_frame(frame_len, False)
+    audio_frame = __adts_frame()
+    audio_frame_num = 0
+    psm = __pes(0xBC, bytes(0x5E))
+    scr = rnd.randrange(1 << 20, 1 << 29) // 90 * 90
+    seg1 = bytearray()
+    emergency = []
+    counters = {'acce': 0, 'gps': 0}
+    for sec in range(seg_sec):
+        t = start_time + sec
+        if not parking:
+            state['lat'] = state['lat'] + rnd.uniform(-0.0002, 0.0002)
+            state['lon'] = state['lon'] + rnd.uniform(-0.0002, 0.0002)
+        speed = 0 if parking else rnd.randint(20, 110)
+        heading = rnd.randint(0, 359)
+        sec_offset = f.tell() - seg_start - 0x40000
+        seg1 += __seg1_record(t, sec_offset, state['lat'], state['lon'], speed, heading)
+        # private_stream_1 packets of the second, placed in frames
+        packets = [[] for frame in range(fps)]
+        pts_sec = scr + sec * 90000
+        packets[0].append((0x0802, 0x0007, __gps_packet(t, state['lat'], state['lon'], speed, heading, counters)))
+        for i in range(9):
+            acce = (rnd.randint(-50, 50), rnd.randint(-50, 50), 981 + rnd.randint(-20, 20))
+            packets[i * fps // 9].append((0x0802, 0x0007, __acce_packet(t, acce, counters)))
+        for i in range(5):
+            frame = i * fps // 5
+            timestamp = (pts_sec + frame * 90000 // fps) // 90
+            frm_num = timestamp * 30 // 1000
+            packets[frame].append((0x0007, 0x0001, __ascii_acce_packet(frm_num, timestamp, acce)))
+            recognized = parking and (rnd.random() < options['recognition_ratio'])
+            packets[frame].append((0x0802, 0x0001, __misc_1_packet(frm_num, timestamp, parking, recognized, acce, rnd)))
+            packets[frame].append((0x0009, 0x0001, __misc_2_packet(timestamp, parking, rnd)))
+        chunks = []
+        for frame_no in range(fps):
+            pts = (pts_sec + frame_no * 90000 // fps) // 90 * 90
+            chunks.append(__pack_header(pts))
+            if frame_no == 0:
+                chunks.append(psm)
+            for (pkt_id, sub_pkt_id, private_data) in packets[frame_no]:
+                chunks.append(__private_stream_1(pts, pkt_id, sub_pkt_id, private_data))
+            video = key_frame if frame_no == 0 else other_frame
+            chunks.append(video[:9] + __pts_bytes(pts) + video[14:])
+            if frame_no % 3 == 0:
+                # ADTS frames up to the next audio packet
+                audio_end = ((sec * fps + frame_no + 3) * audio_sample_rate // fps) // 1024
+                if audio_end > audio_frame_num:
+                    audio_pts = scr + audio_frame_num * 1024 * 90000 // audio_sample_rate
+                    chunks.append(__pes(
+                        0xC0, b'\x81\x80\x05' + __pts_bytes(audio_pts) + audio_frame * (audio_end - audio_frame_num)
+                    ))
+                    audio_frame_num = audio_end
+        f.write(b''.join(chunks))
+        if rnd.random() < options['emergency_ratio'] / 60:
+            emergency.append(t)
+    seg_end = f.tell()
+
+    # Seg 1 to Seg 4
+    seg2 = b''.join(b'\x78\x56\x00\x00' + t.to_bytes(4, 'little') + bytes(8) for t in emergency)
+    thumb = b'\xFF\xD8' + bytes(rnd.getrandbits(8) for i in range(0x800)) + b'\xFF\xD9'
+    header = bytearray(0x40000)
+    header[0x00000:0x00020] = __private_stream_2_header(len(seg1), 0x01, seg_end - seg_start - 0x40000, start_time + seg_sec - 1)
+    header[0x00012] = fps
+    header[0x00020 : 0x00020 + len(seg1)] = seg1
+    header[0x10000:0x10020] = __private_stream_2_header(len(seg2), 0x02)
+    header[0x10020 : 0x10020 + len(seg2)] = seg2
+    header[0x20000:0x20020] = __private_stream_2_header(len(thumb), 0x04)
+    header[0x20020 : 0x20020 + len(thumb)] = thumb
+    header[0x3E000:0x3E020] = __private_stream_2_header(0, 0x07)
+    f.seek(seg_start)
+    f.write(header)
+    f.seek(seg_end)
+
+def __seg1_record(t: int, sec_offset: int, lat: float, lon: float, speed: int, heading: int) -> bytes:
+    record = bytearray(0x30)
+    record[0x00:0x04] = b'\x78\x56\x01\x00'
+    record[0x04:0x08] = t.to_bytes(4, 'little')
+    record[0x08:0x0C] = sec_offset.to_bytes(4, 'little')
+    record[0x10:0x24] = struct.pack(
+        '<IIIII', int(abs(lon) * 360000), int(abs(lat) * 360000), speed, heading, 1000 + (t % 100)
+    )
+    record[0x24] = 1
+    record[0x25] = ord('W' if lon < 0 else 'E')
+    record[0x26] = ord('S' if lat < 0 else 'N')
+    return bytes(record)
+
+def __pack_header(scr: int) -> bytes:
+    # pack_header with SCR, 20 bytes
+    scr_bytes = bytes([
+        0x44 | (((scr >> 30) & 7) << 3) | ((scr >> 28) & 3),
+        (scr >> 20) & 0xFF,
+        (((scr >> 15) & 0x1F) << 3) | 0x04 | ((scr >> 13) & 3),
+        (scr >> 5) & 0xFF,
+        ((scr & 0x1F) << 3) | 0x04,
+        0x01
+    ])
+    return b'\x00\x00\x01\xBA' + scr_bytes + b'\x01\x89\xC3\xFE' + b'\xFF' * 6
+
+def __pes(stream_id: int, data: bytes) -> bytes:
+    return b'\x00\x00\x01' + bytes([stream_id]) + len(data).to_bytes(2, 'big') + data
+
+def __video_frame(frame_len: int, key: bool) -> bytes:
+    # An HEVC access unit, with parameter sets and an IDR slice if key,
+    # or a TRAIL_R slice. Split into PES packets of at most video_pes_max
+    # bytes, only the first has a PTS.
+    if key:
+        data = b''.join(b'\x00\x00\x00\x01' + nal for nal in __hevc_parameter_sets())
+        data = data + b'\x00\x00\x00\x01' + bytes([19 << 1, 0x01])
+    else:
+        data = b'\x00\x00\x00\x01' + bytes([1 << 1, 0x01])
+    data = data + b'\x55' * max(0, frame_len - len(data))
+    chunks = []
+    pos = 0
+    while pos < len(data):
+        data_len = min(len(data) - pos, video_pes_max)
+        if pos == 0:
+            header = b'\x81\x80\x05' + bytes(5)
+        else:
+            header = b'\x81\x00\x05' + b'\xFF' * 5
+        chunks.append(__pes(0xE0, header + data[pos : pos + data_len]))
+        pos = pos + data_len
+    return b''.join(chunks)
+
+def __hevc_parameter_sets() -> list:
+    # VPS, SPS and PPS of 1920x1080 Main profile, level 4
+    profile = b'\x01\x60\x00\x00\x00\x90\x00\x00\x00\x00\x00\x78'
+    vps = b'\x0C\x01\xFF\xFF' + profile + b'\x95\x98\x09'
+    bits = '0000' + '000' + '1' + ''.join('{:08b}'.format(byte) for byte in profile)
+    # sps_seq_parameter_set_id, chroma_format_idc, width, height
+    bits = bits + ''.join(__exp_golomb(value) for value in (0, 1, 1920, 1088))
+    # conformance_window 0, 0, 0, 4 and bit depths of 8
+    bits = bits + '1' + ''.join(__exp_golomb(value) for value in (0, 0, 0, 4, 0, 0))
+    # rbsp_trailing_bits
+    bits = bits + '1'
+    bits = bits + '0' * (-len(bits) % 8)
+    sps = bytes([hevc_sps << 1, 0x01]) + __emulation_prevention(
+        bytes(int(bits[i : i + 8], 2) for i in range(0, len(bits), 8))
+    )
+    pps = bytes([hevc_pps << 1, 0x01]) + b'\xC1\x72\xB4\x62\x40'
+    return [bytes([hevc_vps << 1, 0x01]) + __emulation_prevention(vps), sps, pps]
+
+def __exp_golomb(value: int) -> str:
+    code = '{:b}'.format(value + 1)
+    return '0' * (len(code) - 1) + code
+
+def __emulation_prevention(rbsp: bytes) -> bytes:
+    out = bytearray()
+    zeros = 0
+    for byte in rbsp:
+        if (zeros >= 2) and (byte <= 3):
+            out.append(3)
+            zeros = 0
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+    return bytes(out)
+
+def __adts_frame() -> bytes:
+    # AAC LC, 16 kHz, mono, no CRC
+    header = bytes([
+        0xFF, 0xF1,
+        (1 << 6) | (8 << 2),
+        (1 << 6) | (audio_frame_len >> 11),
+        (audio_frame_len >> 3) & 0xFF,
+        ((audio_frame_len & 0x07) << 5) | 0x1F,
+        0xFC
+    ])
+    return header + b'\xAB' * (audio_frame_len - len(header))
+
+def __pts_bytes(pts: int) -> bytes:
+    return bytes([
+        0x21 | (((pts >> 30) & 7) << 1),
+        (pts >> 22) & 0xFF,
+        (((pts >> 15) & 0x7F) << 1) | 1,
+        (pts >> 7) & 0xFF,
+        ((pts & 0x7F) << 1) | 1
+    ])
+
+def __private_stream_1(pts: int, pkt_id: int, sub_pkt_id: int, private_data: bytes) -> bytes:
+    # PES_packet header, private_header and private_data
+    private_header = struct.pack('>HHH', pkt_id, (len(private_data) + 8) // 4, sub_pkt_id)
+    private_header = private_header + b'\x81\x00\x00\xFF\x00\x00'
+    return __pes(0xBD, b'\x81\x80\x07' + __pts_bytes(pts) + b'\xFF\xF8' + private_header + private_data)
+
+def __bin_header(t: int, data_type: int, data_len: int, counter: int) -> bytearray:
+    # From 0x0C of a binary GPS/acce packet
+    d = datetime.fromtimestamp(t, timezone.utc)
+    data = bytearray(data_len)
+    data[0x00:0x08] = b'\xFF\xAA\xFF\xAA\xDD\x2A\x01\x02'
+    data[0x08:0x0A] = data_type.to_bytes(2, 'little')
+    data[0x18:0x26] = struct.pack(
+        '<7H', d.year, d.month, (d.weekday() + 1) % 7, d.day, d.hour, d.minute, d.second
+    )
+    data[0x2C:0x30] = data_len.to_bytes(4, 'little')
+    data[0x3C:0x3E] = counter.to_bytes(2, 'little')
+    return data
+
+def __gps_packet(t: int, lat: float, lon: float, speed: int, heading: int, counters: dict) -> bytes:
+    data = __bin_header(t, 0x20, 0x80, counters['gps'])
+    counters['gps'] = counters['gps'] + 1
+    data[0x58:0x74] = struct.pack(
+        '<ddccBxff', abs(lat), abs(lon),
+        b'S' if lat < 0 else b'N', b'W' if lon < 0 else b'E', 1,
+        float(speed), float(heading)
+    )
+    return bytes(data)
+
+def __acce_packet(t: int, acce: tuple, counters: dict) -> bytes:
+    data = __bin_header(t, 0x10, 0x78, counters['acce'])
+    counters['acce'] = counters['acce'] + 1
+    (x, y, z) = acce
+    data[0x5C:0x68] = struct.pack('<iii', z, y, x)
+    return bytes(data)
+
+def __ascii_acce_packet(frm_num: int, timestamp: int, acce: tuple) -> bytes:
+    (x, y, z) = acce
+    str1 = b'frmNum=%d, timeStamp=%d\0' % (frm_num, timestamp)
+    str2 = b'g_rt=0 g_x=%d g_y=%d g_z=%d\0' % (x, y, z)
+    data = bytearray(0x28)
+    data[0x00:0x06] = struct.pack('<IH', 1, 2)
+    data[0x06:0x14] = b'\xEE' * 14
+    data[0x14:0x1C] = struct.pack('<II', 0x2C0, 0x240)
+    # String 1 takes 0x38 bytes, or 0x30 when it fits. String 2 takes 0x30.
+    str1_len = 0x38 if 8 + len(str1) > 0x30 else 0x30
+    data[0x1C:0x1E] = (0x28 + str1_len + 0x30).to_bytes(2, 'little')
+    block = str1_len.to_bytes(2, 'little') + b'\x99' * 6 + str1
+    data += block + b'\xAA' * (str1_len - len(block))
+    block = (0x30).to_bytes(2, 'little') + b'\x99' * 6 + str2
+    data += block + b'\xBB' * (0x30 - len(block))
+    return bytes(data)
+
+def __misc_1_packet(frm_num: int, timestamp: int, parking: bool, recognized: bool, acce: tuple, rnd: random.Random) -> bytes:
+    # header from 0x0C
+    data = bytearray(0x5C)
+    data[0x00:0x04] = b'\xAA\xFF\xAA\xFF'
+    data[0x1C:0x24] = struct.pack('<II', frm_num, timestamp)
+    data[0x24:0x28] = b'\xFF' * 4
+    data[0x28:0x2A] = b'\x01\x07' if recognized else b'\x00\x07'
+    data[0x2C:0x30] = (8 if recognized else 0).to_bytes(4, 'little')
+    data[0x38:0x3A] = ((0x22 if rnd.random() < 0.5 else 0x21) if recognized else 0x01).to_bytes(2, 'little')
+    if recognized:
+        # part_1
+        data += struct.pack('<HHHH', rnd.randint(0, 1800), rnd.randint(0, 500), 36, 20) + bytes(12)
+    # part_2
+    part_2 = bytearray(0x1C0)
+    (x, y, z) = acce
+    part_2[0x100:0x10C] = struct.pack('<iii', z, y, x)
+    data += part_2
+    data += __misc_parts(timestamp, parking, 0x64C, rnd)
+    length = len(data)
+    data[0x08:0x0A] = length.to_bytes(2, 'little')
+    data[0x14:0x16] = length.to_bytes(2, 'little')
+    return bytes(data)
+
+def __misc_2_packet(timestamp: int, parking: bool, rnd: random.Random) -> bytes:
+    # header from 0x0C
+    return b'HKJI' + __misc_parts(timestamp, parking, 0x650, rnd)
+
+def __misc_parts(timestamp: int, parking: bool, part_3_base: int, rnd: random.Random) -> bytes:
+    # part_3 to part_8 of 0x0802/0x0001 and 0x0009/0x0001 packets
+    part_3_len = (0x648 if parking else 0x3FC) - (part_3_base - 0x64C)
+    part_3 = bytearray(part_3_len)
+    part_3[0x00:0x04] = timestamp.to_bytes(4, 'little')
+    part_3[0x08:0x0A] = (part_3_len + part_3_base).to_bytes(2, 'little')
+    part_4 = bytearray(0x17C)
+    part_4[0x00:0x10] = struct.pack('<IIII', timestamp - 200, timestamp, timestamp, 1)
+    rec_num = rnd.randint(0, 4) if parking else 0
+    for box_no in range(rec_num):
+        part_4[0x10 + box_no * 8 : 0x18 + box_no * 8] = struct.pack(
+            '<HHHH', rnd.randint(0, 1200), rnd.randint(0, 300), 24, 14
+        )
+    part_4[0x178:0x17C] = rec_num.to_bytes(4, 'little')
+    part_5 = bytearray(0x38)
+    part_5[0x10:0x14] = timestamp.to_bytes(4, 'little')
+    return bytes(part_3 + part_4 + part_5 + bytes(0x84 + 0x404 + 0x28))
+
+def __version_log() -> bytes:
+    return struct.pack('<HBBHBB', 3, 2, 1, 2023, 5, 6) + bytes(12) + b'SYNTHETIC0001'
+
+def __add_log(state: dict, t: int, type_id: int, message: bytes):
+    state['logs'].append((t, type_id, message))
+
+def __write_log(sd_dir_path: str, logs: list):
+    buf = bytearray(0x480040)
+    buf[0x00:0x04] = b'SWKH'
+    log_num = min(len(logs), (len(buf) - 0x2000) // 0x90)
+    buf[0x10:0x12] = log_num.to_bytes(2, 'little')
+    for (i, (t, type_id, message)) in enumerate(logs[:log_num]):
+        pos = 0x2000 + i * 0x90
+        buf[pos : pos + 0x08] = struct.pack('<II', t, type_id)
+        buf[pos + 0x0C : pos + 0x0C + len(message[:132])] = message[:132]
+    with open(os.path.join(sd_dir_path, 'log.bin'), 'wb') as f:
+        f.write(buf)
+
+if __name__ == '__main__':
+    import sys
+    if len(sys.argv) < 2:
+        print('Usage: python synthetic_card.py <output folder> [file_num] [file_size]')
+        sys.exit(1)
+    card_options = {}
+    if len(sys.argv) > 2:
+        card_options['file_num'] = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        card_options['file_size'] = int(sys.argv[3], 0)
+    print(make_card(sys.argv[1], card_options))
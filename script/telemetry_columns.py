@@ -0,0 +1,173 @@
+# Column storage of GPS tracks and accelerometer logs
+
+import array
+
+try:
+    import numpy as np
+    has_numpy = True
+except ImportError:
+    has_numpy = False
+
+class Columns:
+    """
+    Records stored as one array per field, instead of one dict per record.
+
+    Behaves like a list of dicts for reading: len(), indexing, slicing and
+    iteration give the same dicts as the list version. Appending a record
+    or extending with another container is amortized O(1) per record.
+    """
+
+    # List of (field name, array typecode), in dict key order
+    fields = []
+
+    def __init__(self, columns: dict = None):
+        """
+        Parameters
+        ----------
+        columns: dict
+            Initial content, a sequence for each field. Missing fields are
+            filled with 0. Optional.
+        """
+        self.columns = {}
+        if columns == None:
+            for (name, typecode) in self.fields:
+                self.columns[name] = array.array(typecode)
+            return
+        length = max((len(column) for column in columns.values()), default = 0)
+        for (name, typecode) in self.fields:
+            if name in columns:
+                column = columns[name]
+                if has_numpy and isinstance(column, np.ndarray):
+                    column = column.tolist()
+                self.columns[name] = array.array(typecode, column)
+            else:
+                self.columns[name] = array.array(typecode, bytes(array.array(typecode).itemsize * length))
+
+    @classmethod
+    def from_list(cls, records: list):
+        """
+        Build from a list of dicts.
+        """
+        container = cls()
+        container.extend(records)
+        return container
+
+    def __len__(self) -> int:
+        return len(self.columns[self.fields[0][0]])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.__class__({name: column[i] for (name, column) in self.columns.items()})
+        return {name: self.columns[name][i] for (name, typecode) in self.fields}
+
+    def __setitem__(self, i: int, record: dict):
+        for (name, typecode) in self.fields:
+            self.columns[name][i] = record[name]
+
+    def __iter__(self):
+        columns = [self.columns[name] for (name, typecode) in self.fields]
+        names = [name for (name, typecode) in self.fields]
+        for values in zip(*columns):
+            yield dict(zip(names, values))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Columns):
+            return (self.fields == other.fields) and (self.columns == other.columns)
+        return self.to_list() == other
+
+    def __repr__(self) -> str:
+        return '%s(%d records)' % (self.__class__.__name__, len(self))
+
+    def append(self, record: dict):
+        for (name, typecode) in self.fields:
+            self.columns[name].append(record[name])
+
+    def extend(self, records):
+        """
+        Add records of another container of the same type, or dicts.
+        """
+        if isinstance(records, self.__class__):
+            for (name, typecode) in self.fields:
+                self.columns[name].extend(records.columns[name])
+        else:
+            for record in records:
+                self.append(record)
+
+    def column(self, name: str, copy: bool = True):
+        """
+        Get a field of all records, as a numpy array if numpy is installed,
+        otherwise as an array.array.
+
+        Parameters
+        ----------
+        copy: bool
+            False to get the array sharing the memory of the container,
+            without copying. While a shared numpy array exists, append()
+            and extend() raise BufferError, as the memory can't be moved.
+        """
+        if has_numpy:
+            column = np.frombuffer(self.columns[name], dtype = self.columns[name].typecode)
+            return column.copy() if copy else column
+        if copy:
+            return array.array(self.columns[name].typecode, self.columns[name])
+        return self.columns[name]
+
+    def to_list(self) -> list:
+        """
+        Get the list of dicts, the same as the list version.
+        """
+        return list(self)
+
+class GpsTrack(Columns):
+    """
+    gps_track in parse_seg_result. See README.md
+    """
+    fields = [
+        ('time', 'q'), ('valid', 'B'), ('lat', 'i'), ('lon', 'i'),
+        ('height', 'i'), ('speed', 'i'), ('heading', 'i')
+    ]
+
+class AcceLog(Columns):
+    """
+    acce_log in parse_seg_result. See README.md
+    """
+    fields = [('time_ms', 'q'), ('x', 'i'), ('y', 'i'), ('z', 'i')]
+
+class EmergencyLog(Columns):
+    """
+    Emergency video timestamps with the segment they are found in.
+    """
+    fields = [('time', 'q'), ('file_no', 'i'), ('seg_no', 'i')]
+
+class AsciiAcceLog(Columns):
+    """
+    ascii_acce_log in parse_seg_result. See README.md
+    """
+    fields = [('timestamp', 'q'), ('frm_num', 'q'), ('x', 'i'), ('y', 'i'), ('z', 'i')]
+
+class ImageLabelLog(Columns):
+    """
+    image_label_log in parse_seg_result. See README.md
+    """
+    fields = [
+        ('timestamp', 'q'), ('frm_num', 'q'), ('label_type', 'i'),
+        ('x', 'i'), ('y', 'i'), ('w', 'i'), ('h', 'i')
+    ]
+
+class TrafficLightLog(Columns):
+    """
+    traffic_light_log in parse_seg_result. See README.md
+    """
+    fields = [
+        ('timestamp', 'q'), ('box_no', 'i'),
+        ('x', 'd'), ('y', 'd'), ('w', 'd'), ('h', 'd')
+    ]
+
+def json_default(obj):
+    """
+    Use as json.dump(..., default = telemetry_columns.json_default) to dump
+    results holding containers as lists of dicts.
+    """
+    if isinstance(obj, Columns):
+        return obj.to_list()
+    raise TypeError('Object of type %s is not JSON serializable' % obj.__class__.__name__)
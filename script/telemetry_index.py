@@ -0,0 +1,154 @@
+# Sidecar index of private_stream_1 packets in Seg 5 of video segments
+
+import array
+import os
+import pickle
+from bisect import bisect_left
+
+import index_cache
+import pipeline_stats
+
+# Bump when the sidecar content changes
+sidecar_version = 1
+
+# Packets closer than this are read in one read
+read_gap = 0x1000
+
+def new_packets() -> dict:
+    """
+    Create an empty packet index of a segment.
+
+    Returns
+    ----------
+    packets: dict
+        Arrays with one element for each private_stream_1 packet, sorted by
+        offset:
+        'offset': packet start in hivXXXXX.mp4 file.
+        'length': packet length, including the 6 bytes start code and length.
+        'pts': PTS of the packet.
+        'pkt_id', 'sub_pkt_id': from private_header.
+    """
+    packets = {}
+    packets['offset'] = array.array('Q')
+    packets['length'] = array.array('L')
+    packets['pts'] = array.array('Q')
+    packets['pkt_id'] = array.array('H')
+    packets['sub_pkt_id'] = array.array('H')
+    return packets
+
+def get_sidecar_dir(sd_dir_path: str, cache_dir: str) -> str:
+    """
+    Get the folder keeping sidecar files of an SD card folder. It is next
+    to the index cache file.
+    """
+    return os.path.join(cache_dir, 'telemetry_%s' % index_cache.get_card_key(sd_dir_path))
+
+def __get_sidecar_path(sd_dir_path: str, cache_dir: str, file_no: int, seg_no: int) -> str:
+    return os.path.join(
+        get_sidecar_dir(sd_dir_path, cache_dir),
+        'hiv%05d_%03d.pkt' % (file_no, seg_no)
+    )
+
+def __get_seg_key(seg_info: dict) -> tuple:
+    # A segment overwritten by loop recording gets a different key
+    return (
+        seg_info['start_time'], seg_info['end_time'],
+        seg_info['start_pos'], seg_info['end_pos']
+    )
+
+def load(sd_dir_path: str, cache_dir: str, file_no: int, seg_no: int, seg_info: dict):
+    """
+    Load the packet index of a segment.
+
+    Returns
+    ----------
+    packets: dict
+        See new_packets(). None if there is no valid sidecar file.
+    """
+    sidecar_path = __get_sidecar_path(sd_dir_path, cache_dir, file_no, seg_no)
+    if not os.path.isfile(sidecar_path):
+        return None
+    try:
+        with open(sidecar_path, 'rb') as sidecar_file:
+            sidecar = pickle.load(sidecar_file)
+    except Exception:
+        return None
+    if (
+        (sidecar['version'] != sidecar_version) or
+        (sidecar['seg_key'] != __get_seg_key(seg_info))
+    ):
+        return None
+    return sidecar['packets']
+
+def save(sd_dir_path: str, cache_dir: str, file_no: int, seg_no: int, seg_info: dict, packets: dict):
+    """
+    Save the packet index of a segment from new_packets().
+    """
+    sidecar_path = __get_sidecar_path(sd_dir_path, cache_dir, file_no, seg_no)
+    os.makedirs(os.path.dirname(sidecar_path), exist_ok = True)
+    sidecar = {}
+    sidecar['version'] = sidecar_version
+    sidecar['seg_key'] = __get_seg_key(seg_info)
+    sidecar['packets'] = packets
+    temp_path = sidecar_path + '.tmp'
+    with open(temp_path, 'wb') as sidecar_file:
+        pickle.dump(sidecar, sidecar_file, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, sidecar_path)
+
+def read_packets(f, packets: dict, start_pos: int, end_pos: int, pkt_types: set):
+    """
+    Read selected packets. Close packets are read together, so a segment
+    costs a few reads instead of walking every PES header.
+
+    Parameters
+    ----------
+    f: file
+        Opened hivXXXXX.mp4 file.
+    packets: dict
+        See new_packets().
+    start_pos, end_pos: int
+        Only packets starting in [start_pos, end_pos) are read.
+    pkt_types: set
+        (pkt_id, sub_pkt_id) of packets to read.
+
+    Yields
+    ----------
+    tuple(pts, buf)
+        buf is the PES packet data after the 10 bytes PES_packet header,
+        same as walking Program Stream.
+    """
+
+    offsets = packets['offset']
+    lengths = packets['length']
+    selected = [
+        i for i in range(bisect_left(offsets, start_pos), bisect_left(offsets, end_pos))
+        if (packets['pkt_id'][i], packets['sub_pkt_id'][i]) in pkt_types
+    ]
+
+    i = 0
+    while i < len(selected):
+        # Merge close packets into one read
+        j = i + 1
+        read_start = offsets[selected[i]]
+        read_end = read_start + lengths[selected[i]]
+        while (j < len(selected)) and (offsets[selected[j]] - read_end <= read_gap):
+            read_end = offsets[selected[j]] + lengths[selected[j]]
+            j = j + 1
+        buf = __pread(f, read_end - read_start, read_start)
+        mv = memoryview(buf)
+        for k in selected[i:j]:
+            pos = offsets[k] - read_start
+            yield (packets['pts'][k], mv[pos + 16 : pos + lengths[k]])
+        i = j
+
+def __pread(f, size: int, offset: int) -> bytes:
+    if hasattr(os, 'pread'):
+        buf = os.pread(f.fileno(), size, offset)
+        if isinstance(f, pipeline_stats.CountingFile):
+            # Read past the file object, count it here
+            f.stats.add_read(len(buf))
+        return buf
+    else:
+        # Windows
+        f.seek(offset)
+        return f.read(size)
@@ -0,0 +1,153 @@
+# Check that the faster paths give the same results as the plain ones,
+# on a small synthetic card. Run with pytest in this folder
+
+import copy
+import json
+import os
+import random
+
+import pytest
+
+import common
+import parse_index
+import parse_video
+import synthetic_card
+
+# Small enough to make in a fraction of a second, with trips of a few
+# segments, parking segments and emergency timestamps
+card_options = {
+    'file_num': 2,
+    'file_size': 0x800000,
+    'seg_sec': (10, 40),
+    'video_rate': 0x10000,
+    'trip_seg_num': (2, 4),
+    'emergency_ratio': 0.3,
+    'log_num': 50,
+    'photo_seg_num': 1,
+    'photo_num': 2,
+    'photo_len': 0x1000
+}
+
+# Options compared with the default path
+fast_options = {
+    'mmap': {'use_mmap': True},
+    'pipeline': {'pipeline': True},
+    'pipeline_small': {'pipeline': True, 'pipeline_memory': 0x40000},
+    'workers': {'workers': 2},
+    'offset': {'read_order': 'offset'}
+}
+
+#===========================================
+
+@pytest.fixture(scope = 'module')
+def card(tmp_path_factory):
+    common.set_timezone('UTC')
+    sd_dir_path = str(tmp_path_factory.mktemp('card'))
+    synthetic_card.make_card(sd_dir_path, card_options)
+    return (sd_dir_path, parse_index.parse(sd_dir_path))
+
+def __export(sd_dir_path: str, record_file_index: dict, out_dir: str, extra_options: dict) -> tuple:
+    """
+    Export every segment, the first video and all videos of the card.
+
+    Returns
+    ----------
+    tuple(results, files)
+        Results as JSON, with out_dir left out of paths, and the bytes of
+        each exported file by name.
+    """
+    os.makedirs(out_dir, exist_ok = True)
+    base_options = {'gps_track': True, 'acce': True, 'image_label': False}
+    videos = parse_index.search(record_file_index)
+    results = {'segs': {}}
+    for file_info in record_file_index['record_file_infos']:
+        if file_info['file_type'] != 'video':
+            continue
+        for seg_info in file_info['seg_infos']:
+            for (start_sec, end_sec) in [(-1, -1), (1, 3)]:
+                name = 'seg_%d_%d_%d_%d' % (file_info['file_no'], seg_info['seg_no'], start_sec, end_sec)
+                parse_options = dict(
+                    base_options,
+                    export_video = True,
+                    export_video_path = os.path.join(out_dir, name + '.mp4'),
+                    export_thumbnail = True,
+                    export_thumbnail_path = os.path.join(out_dir, name + '.jpg'),
+                    **extra_options
+                )
+                results['segs'][name] = parse_video.parse_seg(
+                    sd_dir_path, file_info['file_no'], seg_info['seg_no'], record_file_index,
+                    parse_options, start_sec, end_sec
+                )
+    results['video'] = parse_video.parse_video(
+        sd_dir_path, videos[0], record_file_index,
+        dict(base_options, export_video = True, export_video_path = os.path.join(out_dir, 'video.mp4'), **extra_options)
+    )
+    results['videos'] = parse_video.parse_videos(
+        sd_dir_path, videos, record_file_index,
+        dict(
+            base_options,
+            export_videos = True,
+            export_videos_folder = out_dir,
+            export_video_names = ['videos_%d.mp4' % i for i in range(len(videos))],
+            **extra_options
+        )
+    )
+    text = json.dumps(results, sort_keys = True, default = lambda o: o.tolist())
+    files = {}
+    for name in os.listdir(out_dir):
+        with open(os.path.join(out_dir, name), 'rb') as f:
+            files[name] = f.read()
+    return (text.replace(out_dir, '<out>'), files)
+
+@pytest.fixture(scope = 'module')
+def default_export(card, tmp_path_factory):
+    (sd_dir_path, record_file_index) = card
+    return __export(sd_dir_path, record_file_index, str(tmp_path_factory.mktemp('default')), {})
+
+@pytest.mark.parametrize('name', list(fast_options))
+def test_export_same(card, default_export, tmp_path, name):
+    (sd_dir_path, record_file_index) = card
+    (results, files) = __export(sd_dir_path, record_file_index, str(tmp_path), fast_options[name])
+    assert sorted(files) == sorted(default_export[1])
+    for file_name in files:
+        assert files[file_name] == default_export[1][file_name], file_name
+    assert results == default_export[0]
+
+def test_export_fmp4_same(card, tmp_path):
+    (sd_dir_path, record_file_index) = card
+    fmp4 = {'export_format': 'fmp4'}
+    (results, files) = __export(sd_dir_path, record_file_index, str(tmp_path / 'plain'), fmp4)
+    for extra_options in [{'pipeline': True}, {'workers': 2}, {'read_order': 'offset'}]:
+        out_dir = tmp_path / list(extra_options)[0]
+        assert __export(sd_dir_path, record_file_index, str(out_dir), dict(fmp4, **extra_options)) == (results, files)
+
+@pytest.mark.parametrize('long_seg', [False, True])
+def test_search_indexed_same(card, long_seg):
+    (sd_dir_path, record_file_index) = card
+    if long_seg:
+        # A segment ending after later ones, so end times are not sorted
+        record_file_index = copy.deepcopy(record_file_index)
+        seg_infos = [
+            seg_info
+            for file_info in record_file_index['record_file_infos'] if file_info['file_type'] == 'video'
+            for seg_info in file_info['seg_infos']
+        ]
+        seg_infos[1]['end_time'] = max(seg_info['end_time'] for seg_info in seg_infos) + 600
+    search_index = parse_index.build_search_index(record_file_index)
+    times = [
+        seg_info[key]
+        for file_info in record_file_index['record_file_infos'] if file_info['file_type'] == 'video'
+        for seg_info in file_info['seg_infos']
+        for key in ('start_time', 'end_time')
+    ]
+    rnd = random.Random(0)
+    periods = [(-1, -1), (-1, min(times)), (max(times), -1), (min(times) - 100, min(times) - 1)]
+    for i in range(200):
+        start_time = rnd.randint(min(times) - 100, max(times) + 100)
+        periods.append((start_time, start_time + rnd.randint(0, 3600)))
+    # Bounds on segment edges
+    periods.extend((t + d, t + d + 10) for t in times for d in (-10, -1, 0, 1))
+    expected = [parse_index.search(record_file_index, start_time, end_time) for (start_time, end_time) in periods]
+    for (period, result) in zip(periods, expected):
+        assert parse_index.search_indexed(search_index, *period) == result, period
+    assert parse_index.search_many(search_index, periods) == expected